@@ -2,7 +2,6 @@
     Main entry point
 """
 import os
-from threading import BoundedSemaphore
 
 import logging
 
@@ -11,6 +10,13 @@ from pyramid.config import Configurator
 from pyramid.renderers import JSON as JSONRenderer
 
 from webgnome_api.common.views import cors_policy
+from webgnome_api.common.locks import SessionLockManager
+from webgnome_api.common.workers import ModelWorkerPool
+from webgnome_api.common.jobs import ModelRunQueue
+from webgnome_api.common.broadcasters import (UncertainModelPool,
+                                              Ensemble,
+                                              uncertainty_levels)
+from webgnome_api.tweens.py_gnome import json_body_key
 
 logging.basicConfig()
 
@@ -43,15 +49,61 @@ def load_cors_origins(settings, key):
 
 
 def get_json(request):
-    return ujson.loads(request.text)
+    '''
+        The JSON payload of a request.  Our tween has usually parsed it
+        already.
+    '''
+    if json_body_key in request.environ:
+        return request.environ[json_body_key]
+    else:
+        return ujson.loads(request.text)
 
 
 def main(global_config, **settings):
     settings['package_root'] = os.path.abspath(os.path.dirname(__file__))
-    settings['py_gnome_semaphore'] = BoundedSemaphore(value=1)
-    settings['objects'] = {}
 
-    settings['uncertain_models'] = {}
+    max_concurrent = int(settings.get('py_gnome_max_concurrent', 4))
+    settings['py_gnome_locks'] = SessionLockManager(max_concurrent)
+
+    num_workers = int(settings.get('model_workers', 0))
+    settings['model_workers'] = ModelWorkerPool(num_workers)
+
+    percentiles = settings.get('uncertainty_percentiles', '').split()
+    settings['uncertainty_percentiles'] = [float(p) for p in percentiles]
+
+    max_model_runs = int(settings.get('max_model_runs', 2))
+    max_model_run_steps = int(settings.get('max_model_run_steps', 100))
+    settings['model_runs'] = ModelRunQueue(max_model_runs,
+                                           max_steps=max_model_run_steps)
+    settings['objects'] = {}
+    settings['session_timeout'] = int(settings.get('redis.sessions.timeout',
+                                                   1200))
+    settings['step_timings'] = {}
+    settings['full_runs'] = {}
+
+    keyframe_interval = int(settings.get('delta_keyframe_interval', 20))
+    settings['delta_keyframe_interval'] = keyframe_interval
+    settings['trajectory_deltas'] = {}
+
+    checkpoint_interval = int(settings.get('checkpoint_interval', 10))
+    checkpoint_max_mb = int(settings.get('checkpoint_max_mb', 200))
+    settings['checkpoint_interval'] = checkpoint_interval
+    settings['checkpoint_max_bytes'] = checkpoint_max_mb * 1024 * 1024
+    settings['checkpoints'] = {}
+
+    pool_size = int(settings.get('uncertain_models.max_size', 4))
+    idle_timeout = int(settings.get('uncertain_models.idle_timeout', 600))
+    max_processes = int(settings.get('uncertain_models.max_processes', 0))
+    settings['uncertain_models'] = UncertainModelPool(pool_size, idle_timeout,
+                                                      'ipc_files',
+                                                      max_processes)
+
+    levels = ' '.join(uncertainty_levels)
+    wind_speed = settings.get('uncertain_models.wind_speed', levels).split()
+    spill_amount = settings.get('uncertain_models.spill_amount',
+                                levels).split()
+    settings['uncertainty_ensemble'] = Ensemble.from_levels(wind_speed,
+                                                            spill_amount)
     try:
         os.mkdir('ipc_files')
     except OSError, e:
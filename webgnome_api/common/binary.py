@@ -0,0 +1,136 @@
+"""
+A binary encoding of our step output, for clients that would rather not
+parse the coordinates of every particle out of JSON.
+
+A step is encoded as a frame with the following layout:
+- the length of the header, as a little-endian uint32.
+- the header, which is the step output in JSON, with the trajectory
+  feature collection replaced by a description of the packed arrays.
+  It is padded with spaces to a multiple of 4 bytes.
+- the packed arrays, one after the other, padded to a multiple of
+  4 bytes.
+
+The particles of the trajectory are grouped by the properties of the
+features they come from, and the header lists the groups in the order
+that their particles are packed.  Each array is described by its name,
+its numpy dtype, its number of items, and its byte offset from the end
+of the header:
+- lon & lat: little-endian float32
+- weight: little-endian float32, only if the particles were decimated
+- status: uint8, the status code of each particle
+The total length of the arrays, including padding, is given by the
+header's 'data_length', so a batch of steps is simply a sequence of
+frames.
+"""
+import struct
+
+import ujson
+import numpy as np
+
+content_type = 'application/x-gnome-trajectory'
+
+
+def encode_step(output):
+    header = dict(output)
+    arrays = []
+
+    traj_output = output.get('TrajectoryGeoJsonOutput')
+    if traj_output is not None and 'feature_collection' in traj_output:
+        features = traj_output['feature_collection']['features']
+        groups, arrays = pack_features(features)
+
+        traj_output = dict(traj_output, groups=groups)
+        del traj_output['feature_collection']
+
+        header['TrajectoryGeoJsonOutput'] = traj_output
+
+    return encode_frame(header, arrays)
+
+
+def encode_steps(outputs):
+    return b''.join([encode_step(o) for o in outputs])
+
+
+def encode_frame(header, arrays):
+    descriptions, chunks = [], []
+    offset = 0
+
+    for name, values in arrays:
+        data = values.tobytes()
+
+        descriptions.append({'name': name,
+                             'dtype': values.dtype.str,
+                             'count': len(values),
+                             'offset': offset})
+        chunks.append(data)
+
+        offset += len(data)
+
+    padding = -offset % 4
+    chunks.append(b'\0' * padding)
+
+    header = dict(header, arrays=descriptions, data_length=offset + padding)
+
+    header = ujson.dumps(header).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+
+    return struct.pack('<I', len(header)) + header + b''.join(chunks)
+
+
+def pack_features(features):
+    '''
+        Gather the points of our Point & MultiPoint features into arrays,
+        grouped by their feature properties.
+    '''
+    groups = []
+    group_ids = {}
+    group_points = []
+
+    for f in features:
+        geometry = f['geometry']
+        properties = f.get('properties') or {}
+
+        if geometry['type'] == 'Point':
+            # a feature per particle, so we only group them by the
+            # properties that are shared by many particles
+            group_props = dict([(k, v) for k, v in properties.iteritems()
+                                if k in ('sc_type', 'status_code',
+                                         'spill_num')])
+            key = tuple(sorted(group_props.items()))
+            coordinates = [geometry['coordinates']]
+            weights = [properties.get('weight', 1)]
+        elif geometry['type'] == 'MultiPoint':
+            group_props = dict([(k, v) for k, v in properties.iteritems()
+                                if k != 'weights'])
+            key = id(f)
+            coordinates = geometry['coordinates']
+            weights = properties.get('weights', [1] * len(coordinates))
+        else:
+            continue
+
+        if key not in group_ids:
+            group_ids[key] = len(groups)
+            groups.append({'properties': group_props, 'count': 0})
+            group_points.append(([], []))
+
+        idx = group_ids[key]
+        groups[idx]['count'] += len(coordinates)
+        group_points[idx][0].extend([c[:2] for c in coordinates])
+        group_points[idx][1].extend(weights)
+
+    coords = [c for points, _weights in group_points for c in points]
+    weights = [w for _points, ws in group_points for w in ws]
+    status = [g['properties'].get('status_code', 0)
+              for g in groups for _i in range(g['count'])]
+
+    coords = np.array(coords, dtype='<f4').reshape(-1, 2)
+
+    arrays = [('lon', np.ascontiguousarray(coords[:, 0])),
+              ('lat', np.ascontiguousarray(coords[:, 1]))]
+
+    if any([w != 1 for w in weights]):
+        arrays.append(('weight', np.array(weights, dtype='<f4')))
+
+    arrays.append(('status', np.array(status, dtype='u1')))
+
+    return groups, arrays
@@ -0,0 +1,327 @@
+"""
+A pool of the uncertain models (ModelBroadcasters) of our sessions.
+"""
+import time
+import logging
+from collections import OrderedDict, namedtuple
+
+from gevent import get_hub
+
+from gnome.multi_model_broadcast import ModelBroadcaster
+
+log = logging.getLogger(__name__)
+
+uncertainty_levels = ('down', 'normal', 'up')
+
+
+class UncertainModelsUnavailable(Exception):
+    '''
+        Raised when there is no room in our pool for the uncertain models
+        of a session, since all of the ensembles in it are in use.
+    '''
+    pass
+
+
+class Ensemble(namedtuple('Ensemble', ['wind_speed', 'spill_amount'])):
+    '''
+        The dimensions of an uncertainty ensemble.
+
+        The ensemble has a member for every combination of a wind speed
+        level and a spill amount level.  py_gnome only knows the levels
+        'down', 'normal' & 'up', so an ensemble can be anything from
+        a single member up to 3x3.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_levels(cls, wind_speed, spill_amount):
+        for levels in (wind_speed, spill_amount):
+            if (len(levels) == 0 or
+                    len(set(levels)) != len(levels) or
+                    not set(levels).issubset(uncertainty_levels)):
+                raise ValueError('uncertainty levels must be a subset of {0}'
+                                 .format(uncertainty_levels))
+
+        return cls(tuple(wind_speed), tuple(spill_amount))
+
+    @property
+    def size(self):
+        return len(self.wind_speed) * len(self.spill_amount)
+
+    def to_dict(self):
+        return {'wind_speed': list(self.wind_speed),
+                'spill_amount': list(self.spill_amount)}
+
+
+class UncertainModels(object):
+    '''
+        The ModelBroadcaster of a session, which may still be in the
+        process of being spawned.
+
+        An ensemble is fresh until it has been used, after which it needs
+        to be rewound before it can be used for another run.  An ensemble
+        that is spawned from a model that isn't rewound, like one that has
+        reached the end of its run, needs to be rewound as well.  It is only
+        valid for the model revision and the ensemble dimensions that it
+        was spawned with.
+
+        An ensemble is running from the first step of a run until the run
+        is over, and it has users while it is performing a command.
+        Neither kind of ensemble may be stopped to make room for others.
+    '''
+    def __init__(self, spawn_result, model_id, revision, ensemble,
+                 fresh=True):
+        self._result = spawn_result
+        self.model_id = model_id
+        self.revision = revision
+        self.ensemble = ensemble
+
+        self.fresh = fresh
+        self.running = False
+        self.users = 0
+        self.last_used = time.time()
+
+    @property
+    def in_use(self):
+        return self.running or self.users > 0
+
+    def matches(self, model, revision, ensemble):
+        return (self.model_id == model.id and
+                self.revision == revision and
+                self.ensemble == ensemble)
+
+    @property
+    def broadcaster(self):
+        '''
+            Returns our ModelBroadcaster, waiting for it to be spawned
+            if necessary.
+        '''
+        return self._result.get()
+
+    def wait(self):
+        self._result.wait()
+
+    def rewind(self):
+        # The broadcaster blocks while waiting for its processes, so we
+        # wait for it on a thread.
+        get_hub().threadpool.apply(self.broadcaster.cmd, ('rewind', {}))
+
+        self.fresh = True
+
+    def stop(self):
+        try:
+            broadcaster = self.broadcaster
+        except Exception:
+            # The spawn failed, so there are no processes to stop
+            log.info('uncertain models failed to spawn')
+            return
+
+        broadcaster.stop()
+
+
+class UncertainModelPool(object):
+    '''
+        Keeps the uncertain models of our sessions.
+
+        A ModelBroadcaster starts a process for each member of the
+        uncertainty ensemble, and pickles our model into each of them,
+        which takes a lot longer than a model step.  py_gnome has no way of
+        handing a new model to processes that are already running, so
+        instead we spawn the ensemble in the background as soon as we can
+        expect a new run to begin, which is when the model is rewound or
+        a run has reached its end.  The first step of the next run can
+        then use it right away, provided that the model has not changed
+        in the meantime.
+        And as long as the model does not change, an ensemble can simply
+        be rewound for each new run, which is the case when a run is
+        replayed.
+
+        :param max_size: The maximum number of ensembles that are kept
+                         at the same time.  The least recently used
+                         ensembles that aren't in use are stopped to make
+                         room for new ones.  If they are all in use, the
+                         new one isn't spawned.
+        :param max_processes: The maximum number of ensemble member
+                              processes that are running at the same time,
+                              so that large ensembles don't oversubscribe
+                              our cores.  Ensembles are stopped in the same
+                              way to stay within it.
+        :param idle_timeout: The number of seconds an ensemble may go
+                             unused before it is stopped, even if the run
+                             that it was running was never finished.
+        :param ipc_folder: The folder holding the sockets that we use
+                           to talk to the ensemble processes.
+    '''
+    def __init__(self, max_size=4, idle_timeout=600, ipc_folder='ipc_files',
+                 max_processes=0):
+        self.max_size = max_size
+        self.max_processes = max_processes
+        self.idle_timeout = idle_timeout
+        self.ipc_folder = ipc_folder
+
+        self._entries = OrderedDict()
+
+    def checkout(self, session_id):
+        '''
+            Returns the uncertain models of a session for a command, or
+            None if it doesn't have any.  They can't be stopped to make
+            room for others until they are checked back in.
+        '''
+        self._evict_idle()
+
+        entry = self._entries.get(session_id)
+
+        if entry is None:
+            return None
+
+        self._use(session_id, entry)
+        entry.users += 1
+
+        return entry
+
+    def checkin(self, entry):
+        entry.users -= 1
+        entry.last_used = time.time()
+
+    def fits(self, ensemble):
+        return self.max_processes <= 0 or ensemble.size <= self.max_processes
+
+    def acquire(self, session_id, model, revision, ensemble):
+        '''
+            Returns a fresh ModelBroadcaster for the first step of a run
+            of our model.  The session's existing one is used, rewound if
+            necessary, if it is still valid for the model.  Otherwise a
+            new one is spawned.
+            The ensemble is running until the run is finished.
+        '''
+        entry = self._entries.get(session_id)
+
+        if entry is None or not entry.matches(model, revision, ensemble):
+            entry = self._spawn(session_id, model, revision, ensemble)
+        elif not entry.fresh:
+            log.info('rewinding the uncertain models')
+
+            # we may yield while rewinding, so we keep it from being stopped
+            entry.running = True
+
+            try:
+                entry.rewind()
+            except Exception:
+                log.info('rewinding the uncertain models failed')
+                entry = self._spawn(session_id, model, revision, ensemble)
+
+        self._use(session_id, entry)
+        entry.running = True
+
+        return entry.broadcaster
+
+    def finish(self, session_id):
+        '''
+            The run of the session's model is over.
+        '''
+        entry = self._entries.get(session_id)
+
+        if entry is not None:
+            entry.running = False
+
+    def prewarm(self, session_id, model, revision, ensemble):
+        '''
+            Spawn a ModelBroadcaster in the background, so it is ready by
+            the time the next run of our model begins.  There is no need
+            if the session's existing one is still valid for the model.
+            We prewarm when the previous run is over, so this finishes it.
+        '''
+        self.finish(session_id)
+
+        entry = self._entries.get(session_id)
+
+        if entry is None or not entry.matches(model, revision, ensemble):
+            try:
+                self._spawn(session_id, model, revision, ensemble)
+            except UncertainModelsUnavailable:
+                # the next run will try again
+                log.info('no room to prewarm the uncertain models')
+
+    def wait(self, session_id):
+        '''
+            Wait for the session's ModelBroadcaster to finish spawning.
+        '''
+        entry = self._entries.get(session_id)
+
+        if entry is not None:
+            entry.wait()
+
+    def drop(self, session_id):
+        entry = self._entries.pop(session_id, None)
+
+        if entry is not None:
+            entry.stop()
+
+    def stop_all(self):
+        for session_id in self._entries.keys():
+            self.drop(session_id)
+
+    def _spawn(self, session_id, model, revision, ensemble):
+        if not self.fits(ensemble):
+            raise ValueError('An ensemble of {0} members exceeds our limit '
+                             'of {1} processes'
+                             .format(ensemble.size, self.max_processes))
+
+        self.drop(session_id)
+        self._evict_idle()
+
+        while self._is_full(ensemble):
+            idle = [sid for sid, e in self._entries.items() if not e.in_use]
+
+            if not idle:
+                raise UncertainModelsUnavailable('All of our uncertain '
+                                                 'models are in use')
+
+            # our entries are in the order they were last used
+            log.info('evicting the uncertain models of session {0}'
+                     .format(idle[0]))
+
+            self.drop(idle[0])
+
+        # Spawning blocks on pickling the model & starting processes,
+        # so we do it on a thread.
+        spawn_result = get_hub().threadpool.spawn(ModelBroadcaster, model,
+                                                  ensemble.wind_speed,
+                                                  ensemble.spill_amount,
+                                                  self.ipc_folder)
+
+        entry = UncertainModels(spawn_result, model.id, revision, ensemble,
+                                fresh=model.current_time_step == -1)
+        self._entries[session_id] = entry
+
+        return entry
+
+    def _is_full(self, ensemble):
+        if 0 < self.max_size <= len(self._entries):
+            return True
+
+        processes = sum([e.ensemble.size for e in self._entries.values()])
+
+        return 0 < self.max_processes < processes + ensemble.size
+
+    def _use(self, session_id, entry):
+        entry.fresh = False
+        entry.last_used = time.time()
+
+        # move the entry to the most recently used end
+        del self._entries[session_id]
+        self._entries[session_id] = entry
+
+    def _evict_idle(self):
+        if self.idle_timeout <= 0:
+            return
+
+        now = time.time()
+
+        for session_id, entry in self._entries.items():
+            if (entry.users == 0 and
+                    now - entry.last_used > self.idle_timeout):
+                log.info('stopping the idle uncertain models of session {0}'
+                         .format(session_id))
+
+                self.drop(session_id)
@@ -0,0 +1,194 @@
+"""
+Checkpoints of the state of a model run, so that we can jump to any step
+without recomputing the run from its beginning.
+"""
+import copy
+
+import numpy as np
+
+
+class ModelCheckpoint(object):
+    '''
+        A snapshot of the state of a model that changes as it is stepped.
+
+        That is the model's time step, and the data arrays & mass balance
+        of its spill containers, along with the state of its releases and
+        weatherers.  Everything else is computed from the model time in
+        every step.
+        The configuration of the releases & weatherers, which are their
+        serializable attributes, is not part of the checkpoint, so that
+        restoring it doesn't undo any changes made since it was taken.
+        The exceptions are the running_attrs, which are serializable but
+        count what a release has done so far in the run.
+        Restoring a checkpoint requires the model run to be set up, which
+        is the case once the model has taken its first step.
+    '''
+    model_attrs = ('_current_time_step', 'model_time')
+    running_attrs = ('num_released', 'start_time_invalid')
+
+    def __init__(self, model):
+        self.step_num = model.current_time_step
+        self.model_time = model.model_time
+
+        self.model_state = dict([(a, model.__dict__[a])
+                                 for a in self.model_attrs
+                                 if a in model.__dict__])
+        self.containers = [self.copy_state(sc.__dict__)
+                           for sc in model.spills.items()]
+        self.releases = [self.run_state(s.release) for s in model.spills]
+        self.weatherers = [self.run_state(w) for w in model.weatherers]
+
+        self.nbytes = sum([a.nbytes
+                           for sc_state in self.containers
+                           for a in sc_state.get('_data_arrays', {}).values()])
+
+    def restore(self, model):
+        model.__dict__.update(self.model_state)
+
+        for sc, sc_state in zip(model.spills.items(), self.containers):
+            sc.__dict__.update(self.copy_state(sc_state))
+
+        for s, release_state in zip(model.spills, self.releases):
+            s.release.__dict__.update(release_state)
+
+        for w, weatherer_state in zip(model.weatherers, self.weatherers):
+            w.__dict__.update(weatherer_state)
+
+    @classmethod
+    def run_state(cls, obj):
+        '''
+            The attributes of a py_gnome object, except for the ones that
+            are part of its configuration.
+        '''
+        config = set()
+
+        if hasattr(obj, '_state'):
+            for name in obj._state.get_names():
+                if name not in cls.running_attrs:
+                    config.update((name, '_' + name))
+
+        return dict([(k, v) for k, v in obj.__dict__.iteritems()
+                     if k not in config])
+
+    @staticmethod
+    def copy_state(state):
+        '''
+            A shallow copy of an object's attributes, except for its data
+            arrays & any dicts, like the mass balance, which are the
+            attributes that are modified in place as a model is stepped.
+        '''
+        state = dict(state)
+
+        for k, v in state.items():
+            if isinstance(v, (dict, np.ndarray)):
+                state[k] = copy.deepcopy(v)
+
+        return state
+
+
+class CheckpointStore(object):
+    '''
+        The checkpoints of the model run of a session.
+
+        A checkpoint is taken every interval steps.  When the checkpoints
+        take up more than max_bytes, every other one of them is dropped
+        and the interval is doubled, so our checkpoints stay evenly spread
+        across the run.
+
+        The checkpoints are kept up to date with the revision of the
+        session's objects.  When the objects change, only the checkpoints
+        past the earliest model time that is affected by the changes are
+        dropped.  If the model itself is past that time, its state is
+        stale, and it takes no more checkpoints until it is rewound or
+        restored to a checkpoint.
+
+        :param interval: The number of steps between checkpoints.
+        :param max_bytes: The memory budget of our checkpoints.
+    '''
+    def __init__(self, interval=10, max_bytes=200 * 1024 * 1024):
+        self.base_interval = interval
+        self.max_bytes = max_bytes
+
+        self.revision = None
+        self.stale = False
+        self.clear()
+
+    def clear(self):
+        self.interval = self.base_interval
+        self.checkpoints = {}
+
+    def validate(self, revision, affected_from=None, model=None):
+        '''
+            Bring our checkpoints up to a revision of the session objects.
+
+            :param affected_from: The earliest model time that is affected
+                                  by the changes since our revision, or
+                                  None if all of the run is affected.
+            :param model: The active model of the session.
+        '''
+        if revision == self.revision:
+            return
+
+        if self.revision is not None:
+            if affected_from is None:
+                self.clear()
+            else:
+                for step_num, c in self.checkpoints.items():
+                    if c.model_time > affected_from:
+                        del self.checkpoints[step_num]
+
+            if (model is not None and
+                    model.current_time_step >= 0 and
+                    (affected_from is None or
+                     model.model_time > affected_from)):
+                self.stale = True
+
+        self.revision = revision
+
+    def model_reset(self):
+        '''
+            The model has been rewound or restored to a checkpoint, so
+            its state is no longer stale.
+        '''
+        self.stale = False
+
+    @property
+    def nbytes(self):
+        return sum([c.nbytes for c in self.checkpoints.values()])
+
+    def save(self, model):
+        step_num = model.current_time_step
+
+        if (self.stale or
+                self.interval <= 0 or
+                step_num <= 0 or
+                step_num % self.interval != 0 or
+                step_num in self.checkpoints):
+            return
+
+        self.checkpoints[step_num] = ModelCheckpoint(model)
+
+        while len(self.checkpoints) > 1 and self.nbytes > self.max_bytes:
+            self.thin()
+
+        if self.nbytes > self.max_bytes:
+            # a single checkpoint is too big for our budget
+            self.checkpoints.clear()
+
+    def thin(self):
+        self.interval *= 2
+
+        for step_num in self.checkpoints.keys():
+            if step_num % self.interval != 0:
+                del self.checkpoints[step_num]
+
+    def latest(self, step_num):
+        '''
+            Returns the latest checkpoint at or before a step, or None.
+        '''
+        candidates = [s for s in self.checkpoints if s <= step_num]
+
+        if candidates:
+            return self.checkpoints[max(candidates)]
+        else:
+            return None
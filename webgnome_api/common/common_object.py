@@ -2,20 +2,25 @@
 Common Gnome object request handlers.
 """
 import os
+import copy
 import shutil
 import urllib2
-import ujson
+import uuid
+import hashlib
+from datetime import datetime
+from collections import OrderedDict
 
-from types import MethodType, FunctionType, BuiltinFunctionType, NoneType
-from logging import Logger
+from types import NoneType
+
+import numpy as np
 
 from .helpers import FQNamesToDict, PyClassFromName
 
 from gnome.utilities.orderedcollection import OrderedCollection
 from gnome.spill_container import SpillContainerPair
-from gnome.utilities.geometry.BBox import BBox
 
 from webgnome_api.common.session_management import set_session_object
+from webgnome_api.common.patch import validate_patch, apply_op, merge_patch
 
 
 def CreateObject(json_obj, all_objects, deserialize_obj=True):
@@ -45,6 +50,173 @@ def UpdateObject(obj, json_obj, all_objects, deserialize_obj=True):
     [o for o in ProcessJsonObjectTree(_UpdateObject, json_obj, all_objects)]
 
 
+def PatchObject(obj, patch, all_objects):
+    '''
+        Apply a JSON Patch to an object.
+
+        Each operation is applied to the serialized form of the innermost
+        object that contains everything the operation changes, or of the
+        target of another operation if that object is inside it, so that
+        none of the serialized forms that we change overlap.
+        Only the fields that the patch changes are deserialized and
+        updated, so a small change to a large model doesn't cost us
+        a round trip of all of the model.
+
+        The patch is applied as a whole or not at all.  Every operation
+        is applied, and every changed object deserialized, before any of
+        our objects are updated.
+    '''
+    ops = zip(patch, validate_patch(patch))
+
+    targets, op_targets = {}, []
+    for op, (path, from_path) in ops:
+        parent_path = path[:-1]
+        if from_path is not None:
+            parent_path = os.path.commonprefix([parent_path,
+                                                from_path[:-1]])
+
+        target, depth = PatchTarget(obj, parent_path)
+
+        target_path = tuple(parent_path[:depth])
+        targets[target_path] = target
+        op_targets.append(target_path)
+
+    outermost = dict([(t, min([p for p in targets if t[:len(p)] == p],
+                               key=len))
+                      for t in targets])
+
+    changes = OrderedDict()
+    for (op, (path, from_path)), target_path in zip(ops, op_targets):
+        target_path = outermost[target_path]
+        depth = len(target_path)
+
+        if target_path not in changes:
+            target = targets[target_path]
+            json_obj = target.serialize()
+
+            changes[target_path] = [target, json_obj,
+                                    copy.deepcopy(json_obj)]
+
+        change = changes[target_path]
+        change[2] = apply_op(change[2], op, path[depth:],
+                             from_path[depth:] if from_path is not None
+                             else None)
+
+    UpdateChangedFields(changes.values(), all_objects)
+
+
+def PatchTarget(obj, tokens):
+    '''
+        Follow the reference tokens of a JSON Pointer through an object
+        and its children, and return the innermost object that we reach,
+        along with the number of tokens that lead to it.
+    '''
+    target, depth = obj, 0
+
+    for i, token in enumerate(tokens):
+        obj = ChildObject(obj, token)
+
+        if obj is None:
+            break
+        elif IsGnomeObject(obj):
+            target, depth = obj, i + 1
+
+    return target, depth
+
+
+def MergePatchObject(obj, patch, all_objects):
+    '''
+        Apply a JSON Merge Patch to an object.
+
+        The members of the patch that refer to child objects are merged
+        into those objects, so that only the objects that have fields
+        changed by the patch are deserialized and updated.
+        Like a JSON Patch, it is applied as a whole or not at all.
+    '''
+    UpdateChangedFields(MergePatchChanges(obj, patch), all_objects)
+
+
+def MergePatchChanges(obj, patch, changes=None):
+    '''
+        The serialized forms of an object and its children, from before
+        and after a JSON Merge Patch.
+    '''
+    if changes is None:
+        changes = []
+
+    if not isinstance(patch, dict):
+        raise ValueError('a merge patch of an object must be an object')
+
+    fields = {}
+
+    for k, v in patch.iteritems():
+        child = ChildObject(obj, k) if isinstance(v, dict) else None
+
+        if IsGnomeObject(child) and v.get('id', child.id) == child.id:
+            MergePatchChanges(child, v, changes)
+        elif k not in ('id', 'obj_type'):
+            fields[k] = v
+
+    if fields:
+        json_obj = obj.serialize()
+
+        changes.append((obj, json_obj,
+                        merge_patch(copy.deepcopy(json_obj), fields)))
+
+    return changes
+
+
+def UpdateChangedFields(changes, all_objects):
+    '''
+        Update objects with the fields that differ between the old and
+        the new serialized forms of each of them.  The fields that haven't
+        changed are left out, so that the children they hold aren't
+        updated.
+        All of the changes are deserialized before any object is updated,
+        so a change that doesn't deserialize leaves all of them alone.
+    '''
+    payloads = []
+
+    for _obj, old_json, new_json in changes:
+        if not isinstance(new_json, dict):
+            raise ValueError('an object can only be patched into an object')
+
+        changed = [k for k, v in new_json.iteritems()
+                   if k not in old_json or old_json[k] != v]
+
+        if changed:
+            json_obj = _DeserializeObject(new_json)
+
+            payloads.append(dict([(k, v) for k, v in json_obj.iteritems()
+                                  if k in changed or k in ('id',
+                                                           'obj_type')]))
+
+    for json_obj in payloads:
+        [o for o in ProcessJsonObjectTree(_UpdateObject, json_obj,
+                                          all_objects)]
+
+
+def ChildObject(obj, token):
+    '''
+        The child of an object or collection that is referred to by
+        a JSON Pointer reference token, or None.
+    '''
+    if isinstance(obj, (list, tuple, OrderedCollection,
+                        SpillContainerPair)):
+        try:
+            return list(obj)[int(token)]
+        except (ValueError, IndexError):
+            return None
+    elif token in ChildObjectAttrs(obj):
+        return getattr(obj, token, None)
+    else:
+        return None
+
+
+def IsGnomeObject(obj):
+    return hasattr(obj, 'id') and hasattr(obj, 'serialize')
+
+
 def _DeserializeObject(json_obj):
     '''
         The py_gnome deserialize method can handle nested payloads
@@ -103,8 +275,15 @@ def _UpdateObject(payload, parent, attr_name, all_objects):
     '''
     if ObjectExists(payload, all_objects):
         obj = all_objects[ObjectId(payload)]
+        start_time = ObjectStartTime(obj)
 
-        obj.update_from_dict(payload)
+        if obj.update_from_dict(payload) is not False:
+            new_start_time = ObjectStartTime(obj)
+
+            if start_time is not None and new_start_time is not None:
+                all_objects.touch(min(start_time, new_start_time), obj=obj)
+            else:
+                all_objects.touch(obj=obj)
 
         # link the object to its associated parent attribute
         try:
@@ -117,6 +296,37 @@ def _UpdateObject(payload, parent, attr_name, all_objects):
         return _CreateObject(payload, parent, attr_name, all_objects)
 
 
+# ETags must not be reused by the objects of a restarted server
+_etag_salt = uuid.uuid4().hex
+
+
+def ObjectETag(obj, all_objects, *args):
+    '''
+        A strong ETag for a representation of an object.  It changes
+        whenever any of the objects in the object's tree change, or any
+        of the other args that the representation depends on.
+    '''
+    versions = [(id(o), all_objects.version(o)) for o in ObjectTree(obj)]
+
+    return hashlib.sha1(repr((_etag_salt, id(obj), all_objects.epoch,
+                              versions, args))).hexdigest()
+
+
+def ObjectStartTime(obj):
+    '''
+        The model time from which an object has an effect on a model run,
+        like the start of a weatherer's active range or the release time
+        of a spill, or None if it can have an effect on all of the run.
+    '''
+    for attr in ('active_start', 'release_time'):
+        start_time = getattr(obj, attr, None)
+
+        if isinstance(start_time, datetime):
+            return start_time
+
+    return None
+
+
 def ValueIsJsonObject(value):
     return (isinstance(value, dict) and
             'obj_type' in value)
@@ -157,29 +367,129 @@ def RegisterObject(obj, request):
         Recursively register an object plus all contained child objects.
         Registering means we put the object somewhere it can be looked up
         in the Web API.
-        We would mainly like to register PyGnome objects.  Others
-        we probably don't care about.
     '''
+    for o in ObjectTree(obj):
+        set_session_object(o, request)
+
+
+def ObjectTree(obj, seen=None):
+    '''
+        Generates an object and all of the objects contained in it.
+        We would mainly like to find PyGnome objects.  Others we probably
+        don't care about, so we only look for child objects in the items
+        of collections and the serializable fields of objects.
+    '''
+    if seen is None:
+        seen = {}
+
+    if id(obj) in seen:
+        return
+
+    # we keep a reference, so that the id can't be reused in our walk
+    seen[id(obj)] = obj
+
     if (hasattr(obj, 'id') and
             not obj.__class__.__name__ == 'type'):
-        # print 'RegisterObject(): registering:', (obj.__class__.__name__,
-        #                                           obj.id)
-        set_session_object(obj, request)
+        yield obj
+
     if isinstance(obj, (list, tuple, OrderedCollection,
                         SpillContainerPair)):
-        for i in obj:
-            RegisterObject(i, request)
-    elif hasattr(obj, '__dict__'):
-        for k in dir(obj):
-            attr = getattr(obj, k)
-            if not (k.find('_') == 0 or
-                    isinstance(attr, (MethodType, FunctionType,
-                                      BuiltinFunctionType,
-                                      int, float, str, unicode, NoneType,
-                                      Logger, BBox)
-                               )):
-                # print 'RegisterObject(): recursing attr:', (k, type(attr))
-                RegisterObject(attr, request)
+        children = obj
+    else:
+        children = [getattr(obj, k, None)
+                    for k in ChildObjectAttrs(obj)]
+
+    for child in children:
+        if not isinstance(child, (int, float, str, unicode, NoneType,
+                                  np.ndarray)):
+            for o in ObjectTree(child, seen):
+                yield o
+
+
+def SerializeObject(obj, all_objects, model_step=None):
+    '''
+        Serialize an object, or return its cached serialization if none
+        of the objects in its tree have changed since it was cached.
+        Our objects also change as a model is stepped or rewound, so the
+        serialization is only reused at the same step of the model run.
+
+        The serialization is shared by everyone that asks for it, so it
+        must not be modified.
+    '''
+    entry = all_objects.serialized.get(id(obj))
+
+    if (entry is not None and
+            entry['obj'] is obj and
+            entry['epoch'] == all_objects.epoch and
+            entry['model_step'] == model_step and
+            all([all_objects.version(o) == v for o, v in entry['deps']])):
+        return entry['json']
+
+    deps = [(o, all_objects.version(o)) for o in ObjectTree(obj)]
+    json_obj = obj.serialize()
+
+    all_objects.serialized[id(obj)] = {'obj': obj,
+                                       'epoch': all_objects.epoch,
+                                       'model_step': model_step,
+                                       'deps': deps,
+                                       'json': json_obj}
+
+    return json_obj
+
+
+_child_object_attrs = {}
+
+
+def ChildObjectAttrs(obj):
+    '''
+        The names of the attributes of an object that can contain child
+        objects, which are the serializable fields of its class that hold
+        a PyGnome object or a collection of them.
+        The fields are declared by the class, so what a field holds is
+        remembered for the class, once we have found a value in it.
+        Until then, a field that is None or an empty collection could be
+        either.
+    '''
+    py_class = obj.__class__
+
+    if py_class not in _child_object_attrs:
+        state = getattr(py_class, '_state', None)
+
+        try:
+            names = state.get_names()
+        except AttributeError:
+            names = []
+
+        _child_object_attrs[py_class] = dict([(n, None) for n in names
+                                              if not n.startswith('_')])
+
+    fields = _child_object_attrs[py_class]
+
+    for name, holds_objects in fields.items():
+        if holds_objects is None:
+            fields[name] = HoldsGnomeObjects(getattr(obj, name, None))
+
+    return [name for name, holds_objects in fields.iteritems()
+            if holds_objects is not False]
+
+
+def HoldsGnomeObjects(value):
+    '''
+        Whether a value is a PyGnome object or a collection of them, or
+        None if we can't tell.
+    '''
+    if isinstance(value, (list, tuple, OrderedCollection,
+                          SpillContainerPair)):
+        items = list(value)
+
+        if len(items) == 0:
+            return None
+
+        return any([IsGnomeObject(i) for i in items])
+    elif value is None:
+        return None
+    else:
+        return IsGnomeObject(value)
 
 
 def obj_id_from_url(request):
@@ -263,7 +573,7 @@ def get_file_path(request, json_request=None):
     session_dir = get_session_dir(request)
 
     if json_request is None:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
 
     if (json_request['filename'][:4] == 'http' and
             json_request['filename'].find(goods_url) != -1):
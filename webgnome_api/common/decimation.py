@@ -0,0 +1,193 @@
+"""
+Spatial decimation of the particles in our trajectory output.
+"""
+import numpy as np
+
+
+def parse_bbox(value):
+    '''
+        Parse a bounding box of the form 'west,south,east,north'.
+    '''
+    bbox = [float(v) for v in value.split(',')]
+
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError('bbox must be of the form west,south,east,north')
+
+    return bbox
+
+
+def decimate_feature_collection(feature_collection,
+                                max_points=None, bbox=None):
+    '''
+        Reduce the particles of a trajectory feature collection to the
+        ones inside a bounding box, and then to a spatially stratified
+        subsample of no more than max_points particles.
+
+        The subsample is taken by laying the finest regular grid over the
+        particles that has no more than max_points occupied cells, and
+        keeping a single particle from each occupied cell.  The particles
+        of different features are never mixed up, so a cell holding
+        both forecast and uncertain particles keeps one of each.
+        Each kept particle is given a weight, which is the number of
+        particles that it stands for.
+
+        Point features are kept or dropped as a whole, and get a 'weight'
+        property.  MultiPoint features keep a subset of their coordinates,
+        and get a 'weights' property with one weight per coordinate.
+        Any other features are left alone.
+    '''
+    features = feature_collection['features']
+
+    # gather our points, along with the feature & coordinate they come from
+    feature_idx, coord_idx, coords = [], [], []
+    for i, f in enumerate(features):
+        geometry = f['geometry']
+
+        if geometry['type'] == 'Point':
+            feature_idx.append(i)
+            coord_idx.append(0)
+            coords.append(geometry['coordinates'][:2])
+        elif geometry['type'] == 'MultiPoint':
+            for j, c in enumerate(geometry['coordinates']):
+                feature_idx.append(i)
+                coord_idx.append(j)
+                coords.append(c[:2])
+
+    if len(coords) == 0:
+        return feature_collection
+
+    feature_idx = np.array(feature_idx)
+    coord_idx = np.array(coord_idx)
+    coords = np.array(coords, dtype=np.float64)
+    classes = point_classes(features, feature_idx)
+
+    keep = np.ones(len(coords), dtype=bool)
+    if bbox is not None:
+        keep = ((coords[:, 0] >= bbox[0]) & (coords[:, 0] <= bbox[2]) &
+                (coords[:, 1] >= bbox[1]) & (coords[:, 1] <= bbox[3]))
+
+    kept = np.nonzero(keep)[0]
+    weights = np.ones(len(kept), dtype=np.int64)
+
+    if max_points is not None and len(kept) > max_points:
+        kept, weights = stratified_sample(coords[kept], classes[kept],
+                                          max_points, bbox)
+        kept = np.nonzero(keep)[0][kept]
+
+    return rebuild_feature_collection(feature_collection,
+                                      feature_idx[kept], coord_idx[kept],
+                                      weights)
+
+
+def point_classes(features, feature_idx):
+    '''
+        Point features are classified by their properties other than
+        their id, which tells forecast & uncertain particles and their
+        status apart.  The points of a MultiPoint feature are in a class
+        of their own.
+    '''
+    class_ids = {}
+    classes = np.empty(len(feature_idx), dtype=np.int64)
+
+    for n, i in enumerate(feature_idx):
+        f = features[i]
+
+        if f['geometry']['type'] == 'Point':
+            props = f.get('properties') or {}
+            key = tuple(sorted((k, v) for k, v in props.iteritems()
+                               if k in ('sc_type', 'status_code',
+                                        'spill_num')))
+        else:
+            key = i
+
+        classes[n] = class_ids.setdefault(key, len(class_ids))
+
+    return classes
+
+
+def stratified_sample(coords, classes, max_points, bbox=None):
+    '''
+        Find the finest grid that leaves no more than max_points cells
+        occupied, and take the first point in each occupied cell of each
+        class.
+        If there are more classes than max_points, even the coarsest grid
+        has too many cells, so we keep the most populous classes only.
+        Returns the indexes of the sampled points, and the number of
+        points that each of them stands for.
+    '''
+    if bbox is not None:
+        lower = np.array(bbox[:2], dtype=np.float64)
+        upper = np.array(bbox[2:], dtype=np.float64)
+    else:
+        lower = coords.min(axis=0)
+        upper = coords.max(axis=0)
+
+    extent = np.maximum(upper - lower, np.finfo(np.float64).tiny)
+    normalized = (coords - lower) / extent
+
+    def occupied_cells(n):
+        cells = np.clip((normalized * n).astype(np.int64), 0, n - 1)
+        cell_ids = (classes * n + cells[:, 0]) * n + cells[:, 1]
+
+        return np.unique(cell_ids, return_index=True, return_counts=True)
+
+    # binary search for the finest grid that fits our budget
+    lo, hi = 1, max(int(np.sqrt(max_points)) * 2, 2)
+    while len(occupied_cells(hi)[0]) <= max_points and hi < 2 ** 20:
+        lo, hi = hi, hi * 2
+
+    best = occupied_cells(lo)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        result = occupied_cells(mid)
+
+        if len(result[0]) <= max_points:
+            lo, best = mid, result
+        else:
+            hi = mid
+
+    _cell_ids, first, counts = best
+
+    if len(first) > max_points:
+        largest = np.sort(np.argsort(-counts, kind='mergesort')[:max_points])
+        first, counts = first[largest], counts[largest]
+
+    return first, counts
+
+
+def rebuild_feature_collection(feature_collection,
+                               feature_idx, coord_idx, weights):
+    features = feature_collection['features']
+
+    kept = {}
+    for i, j, w in zip(feature_idx.tolist(), coord_idx.tolist(),
+                       weights.tolist()):
+        kept.setdefault(i, []).append((j, w))
+
+    new_features = []
+    for i, f in enumerate(features):
+        geometry = f['geometry']
+
+        if geometry['type'] == 'Point':
+            if i in kept:
+                props = dict(f.get('properties') or {})
+                props['weight'] = kept[i][0][1]
+
+                new_features.append(dict(f, properties=props))
+        elif geometry['type'] == 'MultiPoint':
+            if i in kept:
+                points = sorted(kept[i])
+                coordinates = geometry['coordinates']
+
+                props = dict(f.get('properties') or {})
+                props['weights'] = [w for _j, w in points]
+
+                new_geometry = dict(geometry,
+                                    coordinates=[coordinates[j]
+                                                 for j, _w in points])
+                new_features.append(dict(f, geometry=new_geometry,
+                                         properties=props))
+        else:
+            new_features.append(f)
+
+    return dict(feature_collection, features=new_features)
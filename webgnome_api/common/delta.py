@@ -0,0 +1,119 @@
+"""
+Delta encoding of the element positions between consecutive steps.
+"""
+import numpy as np
+
+
+class TrajectoryDeltaEncoder(object):
+    '''
+        Remembers the element positions & status codes that were last
+        sent to a session's client, so that each following frame only
+        needs to contain the elements that have changed since.
+
+        A frame is a keyframe containing every element if there is no
+        previous frame to build on, if the steps are not consecutive
+        (the model was rewound), if the client asks for one, or if
+        keyframe_interval frames have gone by since the last one.
+
+        Elements are identified by their spill number and id, and their
+        positions are rounded to the given number of decimals before
+        they are compared, so that elements that are beached or off the
+        map don't show up as changed.
+
+        :param keyframe_interval: The number of frames between keyframes.
+        :param decimals: The number of decimals of the positions.
+    '''
+    def __init__(self, keyframe_interval=20, decimals=4):
+        self.keyframe_interval = keyframe_interval
+        self.decimals = decimals
+
+        self.reset()
+
+    def reset(self):
+        self.last_step = None
+        self.frames_since_keyframe = 0
+        self.sent = {}
+
+    def encode(self, step_num, spill_containers, keyframe=False):
+        keyframe = (keyframe or
+                    self.last_step is None or
+                    step_num != self.last_step + 1 or
+                    self.frames_since_keyframe + 1 >= self.keyframe_interval)
+
+        frame = {'step_num': step_num,
+                 'keyframe': keyframe}
+        sent = {}
+
+        for sc in spill_containers:
+            sc_type = 'uncertain' if sc.uncertain else 'forecast'
+            current = self.element_state(sc)
+
+            if keyframe or sc_type not in self.sent:
+                frame[sc_type] = self.full_frame(current)
+            else:
+                frame[sc_type] = self.delta_frame(self.sent[sc_type], current)
+
+            sent[sc_type] = current
+
+        self.sent = sent
+        self.last_step = step_num
+        self.frames_since_keyframe = (0 if keyframe
+                                      else self.frames_since_keyframe + 1)
+
+        return frame
+
+    def element_state(self, sc):
+        '''
+            The keys, positions & status codes of a spill container's
+            elements, sorted by key.
+        '''
+        keys = ((sc['spill_num'].astype(np.int64) << 32) +
+                sc['id'].astype(np.int64))
+        order = np.argsort(keys, kind='mergesort')
+
+        positions = np.round(sc['positions'][order, :2], self.decimals)
+
+        return {'keys': keys[order],
+                'ids': sc['id'][order],
+                'spill_num': sc['spill_num'][order],
+                'lon': positions[:, 0],
+                'lat': positions[:, 1],
+                'status': sc['status_codes'][order]}
+
+    def full_frame(self, current):
+        return self.frame(current, np.ones(len(current['keys']), dtype=bool))
+
+    def delta_frame(self, previous, current):
+        prev_keys = previous['keys']
+        cur_keys = current['keys']
+
+        # the position of each current element in the previous frame
+        idx = np.searchsorted(prev_keys, cur_keys)
+        idx = np.clip(idx, 0, max(len(prev_keys) - 1, 0))
+
+        if len(prev_keys) > 0:
+            found = prev_keys[idx] == cur_keys
+            changed = (~found |
+                       (previous['lon'][idx] != current['lon']) |
+                       (previous['lat'][idx] != current['lat']) |
+                       (previous['status'][idx] != current['status']))
+        else:
+            changed = np.ones(len(cur_keys), dtype=bool)
+
+        removed = ~np.in1d(prev_keys, cur_keys)
+
+        return self.frame(current, changed, (previous['spill_num'][removed],
+                                             previous['ids'][removed]))
+
+    def frame(self, current, selected, removed=None):
+        frame = {'spill_num': current['spill_num'][selected].tolist(),
+                 'id': current['ids'][selected].tolist(),
+                 'lon': current['lon'][selected].tolist(),
+                 'lat': current['lat'][selected].tolist(),
+                 'status': current['status'][selected].tolist()}
+
+        if removed is not None and len(removed[0]) > 0:
+            frame['removed'] = {'spill_num': removed[0].tolist(),
+                                'id': removed[1].tolist()}
+
+        return frame
@@ -0,0 +1,247 @@
+"""
+Background model runs.
+"""
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+
+import gevent
+
+from .views import format_exception
+
+log = logging.getLogger(__name__)
+
+
+class RunRequest(object):
+    '''
+        Stands in for the request that submitted a background run, which
+        is over long before the run is.
+
+        It holds on to no more than stepping a model needs, which is our
+        registry, the request parameters, and a copy of the id & values
+        of the session.
+    '''
+    def __init__(self, request):
+        self.registry = request.registry
+        self.GET = request.GET.copy()
+        self.session = RunSession(request.session)
+
+
+class RunSession(dict):
+    '''
+        A copy of the values of a session.  Changes to it are not saved.
+    '''
+    def __init__(self, session):
+        super(RunSession, self).__init__(session)
+
+        self.session_id = session.session_id
+
+    def changed(self):
+        pass
+
+
+class ModelRun(object):
+    '''
+        A model run that is performed in the background.
+
+        The run function is called with the run itself as its only
+        argument.  It is expected to report each step it completes with
+        add_step(), and to return early if the run has been cancelled.
+
+        Only the outputs of the latest max_steps steps are kept, so that
+        a run that nobody is polling can't take up ever more memory.
+
+        :param max_steps: The number of step outputs that are kept, or
+                          None to keep all of them.
+    '''
+    def __init__(self, session_id, func, total_steps=None, max_steps=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.func = func
+
+        self.status = 'queued'
+        self.cancelled = False
+        self.error = None
+        self.finished_at = None
+
+        self.total_steps = total_steps
+        self.num_steps = 0
+        self.steps = deque(maxlen=max_steps)
+
+    def add_step(self, output):
+        self.steps.append(output)
+        self.num_steps += 1
+
+    @property
+    def first_kept_step(self):
+        return self.num_steps - len(self.steps)
+
+    def get_steps(self, first=0):
+        '''
+            The outputs of the completed steps, beginning with the first
+            one, or with the earliest one that we still have.
+        '''
+        return list(self.steps)[max(first - self.first_kept_step, 0):]
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def to_dict(self):
+        return {'id': self.id,
+                'status': self.status,
+                'current_step': self.num_steps,
+                'first_kept_step': self.first_kept_step,
+                'total_steps': self.total_steps,
+                'error': self.error}
+
+
+class ModelRunQueue(object):
+    '''
+        Queues up background model runs and performs them in greenlets.
+
+        No more than max_running runs are performed at the same time, and
+        the runs of a session are performed one after the other, since
+        they all step the session's active model.
+        Waiting runs are started in a round robin fashion across
+        sessions, so that a session that queues up many runs can not
+        hold up the runs of other sessions.
+
+        Finished runs are kept around for their results, up to
+        max_finished of them for each session, and for no longer than
+        max_age seconds.
+
+        :param max_running: The maximum number of runs that are performed
+                            at the same time.
+        :param max_finished: The number of finished runs that we keep
+                             around for each session.
+        :param max_steps: The number of step outputs that each run keeps.
+        :param max_age: The number of seconds that a finished run is kept.
+    '''
+    def __init__(self, max_running=1, max_finished=4, max_steps=None,
+                 max_age=3600):
+        self.max_running = max_running
+        self.max_finished = max_finished
+        self.max_steps = max_steps
+        self.max_age = max_age
+
+        self.runs = OrderedDict()
+        self._pending = OrderedDict()
+        self._running = set()
+
+    def submit(self, session_id, func, total_steps=None):
+        self._discard_finished(session_id)
+
+        run = ModelRun(session_id, func, total_steps, self.max_steps)
+        self.runs[run.id] = run
+        self._pending.setdefault(session_id, deque()).append(run)
+
+        self._dispatch()
+
+        return run
+
+    def get(self, session_id, run_id):
+        run = self.runs.get(run_id)
+
+        if run is not None and run.session_id == session_id:
+            return run
+        else:
+            return None
+
+    def session_runs(self, session_id):
+        return [r for r in self.runs.values() if r.session_id == session_id]
+
+    def discard_session(self, session_id):
+        '''
+            Drop the finished runs of a session that has expired.
+        '''
+        for r in self.session_runs(session_id):
+            if r.done:
+                del self.runs[r.id]
+
+    def cancel(self, run):
+        run.cancel()
+
+        if run.status == 'queued':
+            session_queue = self._pending.get(run.session_id, ())
+
+            if run in session_queue:
+                session_queue.remove(run)
+
+                if not session_queue:
+                    del self._pending[run.session_id]
+
+            run.status = 'cancelled'
+            run.finished_at = time.time()
+
+    def _discard_finished(self, session_id):
+        finished = [r for r in self.session_runs(session_id) if r.done]
+        excess = len(finished) - self.max_finished
+
+        for r in finished[:max(excess, 0)]:
+            del self.runs[r.id]
+
+        self.discard_expired()
+
+    def discard_expired(self):
+        if self.max_age <= 0:
+            return
+
+        now = time.time()
+
+        for r in self.runs.values():
+            if (r.done and
+                    r.finished_at is not None and
+                    now - r.finished_at > self.max_age):
+                del self.runs[r.id]
+
+    def _next_run(self):
+        '''
+            Take the first run of the first session in line that is not
+            already performing a run, and move that session to the back
+            of the line.
+        '''
+        for session_id, session_queue in self._pending.items():
+            if session_id not in self._running:
+                del self._pending[session_id]
+                run = session_queue.popleft()
+
+                if session_queue:
+                    self._pending[session_id] = session_queue
+
+                return run
+
+        return None
+
+    def _dispatch(self):
+        while len(self._running) < self.max_running:
+            run = self._next_run()
+
+            if run is None:
+                break
+
+            self._running.add(run.session_id)
+            run.status = 'running'
+
+            gevent.spawn(self._perform, run)
+
+    def _perform(self, run):
+        try:
+            run.func(run)
+
+            run.status = 'cancelled' if run.cancelled else 'finished'
+        except Exception:
+            log.info('model run {0} failed'.format(run.id))
+
+            run.status = 'failed'
+            run.error = format_exception()
+        finally:
+            run.finished_at = time.time()
+
+            self._running.discard(run.session_id)
+            self._discard_finished(run.session_id)
+            self._dispatch()
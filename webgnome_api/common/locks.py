@@ -0,0 +1,173 @@
+"""
+Locks that guard access to the py_gnome objects of a session.
+"""
+from gevent.event import Event
+from gevent.lock import BoundedSemaphore
+
+
+class SessionLock(object):
+    '''
+        A reader/writer lock that guards the py_gnome objects of a single
+        session.
+
+        Any number of readers (serializing an object, fetching grid data)
+        may hold the lock at the same time, but writers (creating or
+        updating objects, stepping the model) have exclusive access.
+        Waiting writers take priority over newly arriving readers, so
+        clients that are polling the model cannot starve a model run.
+
+        Acquiring a session lock, for reading or writing, also takes a slot
+        from the global semaphore that caps how many requests may be
+        running py_gnome code at the same time.  Both are released
+        together.  A writer that is waiting on something other than
+        py_gnome, like a client reading its response, can give up its
+        global slot for a while without giving up the session.
+
+        The lock is taken by the greenlets that serve our requests, which
+        hold it while they wait for a model worker, so it is built on
+        gevent's primitives.  Waiting for it only suspends the waiting
+        greenlet, while a lock from the threading module would block the
+        event loop, and with it the worker results that would release
+        the lock.  The lock must not be taken by a worker thread.
+    '''
+    def __init__(self, global_sema):
+        self._readers = 0
+        self._writer = False
+        self._writer_slot = False
+        self._writers_waiting = 0
+        self._waiters = []
+
+        self._global_sema = global_sema
+
+    def acquire_read(self):
+        while self._writer or self._writers_waiting:
+            self._wait()
+
+        self._readers += 1
+
+        try:
+            self._global_sema.acquire()
+        except:
+            self._release_read()
+            raise
+
+    def release_read(self):
+        self._global_sema.release()
+        self._release_read()
+
+    def acquire(self):
+        self._writers_waiting += 1
+
+        try:
+            while self._writer or self._readers:
+                self._wait()
+        except:
+            self._writers_waiting -= 1
+            self._notify_all()
+            raise
+
+        self._writers_waiting -= 1
+        self._writer = True
+
+        try:
+            self.resume()
+        except:
+            self._release_write()
+            raise
+
+    def release(self):
+        self.pause()
+        self._release_write()
+
+    def pause(self):
+        '''
+            Give the global slot of our writer back, while it keeps
+            exclusive access to the session.
+        '''
+        if self._writer_slot:
+            self._writer_slot = False
+            self._global_sema.release()
+
+    def resume(self):
+        '''
+            Take a global slot for our writer again.
+        '''
+        if not self._writer_slot:
+            self._global_sema.acquire()
+            self._writer_slot = True
+
+    @property
+    def idle(self):
+        return not (self._readers or self._writer or
+                    self._writers_waiting or self._waiters)
+
+    def _release_read(self):
+        self._readers -= 1
+
+        if self._readers == 0:
+            self._notify_all()
+
+    def _release_write(self):
+        self._writer = False
+        self._notify_all()
+
+    def _wait(self):
+        '''
+            Wait until the state of the lock changes.  All of our greenlets
+            run in the same thread, so the state can't change between our
+            checking it and waiting.
+        '''
+        waiter = Event()
+        self._waiters.append(waiter)
+
+        try:
+            waiter.wait()
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _notify_all(self):
+        waiters, self._waiters = self._waiters, []
+
+        for waiter in waiters:
+            waiter.set()
+
+
+class SessionLockManager(object):
+    '''
+        Hands out one lock per session so that independent sessions can
+        run their models concurrently, while changes within the same
+        session are still processed one at a time.
+
+        :param max_concurrent: The maximum number of requests that are
+                               allowed to hold a session lock at the
+                               same time.
+    '''
+    def __init__(self, max_concurrent=1):
+        self.max_concurrent = max_concurrent
+        self.global_sema = BoundedSemaphore(value=max_concurrent)
+
+        self._locks = {}
+
+    def get_lock(self, session_id):
+        if session_id not in self._locks:
+            self._locks[session_id] = SessionLock(self.global_sema)
+
+        return self._locks[session_id]
+
+    def session_ids(self):
+        return self._locks.keys()
+
+    def discard(self, session_id):
+        '''
+            Drop the lock of a session, unless it is held or waited for.
+            Returns whether the session's lock is gone.
+        '''
+        lock = self._locks.get(session_id)
+
+        if lock is not None and not lock.idle:
+            return False
+
+        self._locks.pop(session_id, None)
+
+        return True
@@ -0,0 +1,173 @@
+"""
+JSON Patch (RFC 6902) & JSON Merge Patch (RFC 7386) operations on plain
+JSON documents, for the partial updates of our objects.
+"""
+import copy
+
+json_patch_type = 'application/json-patch+json'
+merge_patch_type = 'application/merge-patch+json'
+
+patch_ops = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+def parse_pointer(pointer):
+    '''
+        Split a JSON Pointer into its reference tokens.
+    '''
+    if pointer == '':
+        return []
+
+    if not isinstance(pointer, basestring) or not pointer.startswith('/'):
+        raise ValueError('invalid JSON pointer {0!r}'.format(pointer))
+
+    return [t.replace('~1', '/').replace('~0', '~')
+            for t in pointer[1:].split('/')]
+
+
+def validate_patch(patch):
+    '''
+        Check that a JSON Patch is well formed, and return the reference
+        tokens of the path, and the from path if there is one, of each
+        operation.
+    '''
+    if not isinstance(patch, list):
+        raise ValueError('a JSON patch must be a list of operations')
+
+    tokens = []
+    for op in patch:
+        if not isinstance(op, dict) or op.get('op') not in patch_ops:
+            raise ValueError('invalid JSON patch operation {0!r}'.format(op))
+
+        if op['op'] in ('add', 'replace', 'test') and 'value' not in op:
+            raise ValueError('{0} operation without a value'.format(op['op']))
+
+        path = parse_pointer(op.get('path'))
+        from_path = (parse_pointer(op.get('from'))
+                     if op['op'] in ('move', 'copy')
+                     else None)
+
+        tokens.append((path, from_path))
+
+    return tokens
+
+
+def apply_op(doc, op, path, from_path=None):
+    '''
+        Apply a JSON Patch operation to a document, and return the
+        resulting document.  The document is modified in place, unless
+        the operation replaces all of it.
+
+        :param path: The reference tokens of the operation's path,
+                     relative to the document.
+        :param from_path: The reference tokens of the operation's from
+                          path, relative to the document.
+    '''
+    name = op['op']
+
+    if name == 'test':
+        if resolve(doc, path) != op['value']:
+            raise ValueError('test of {0} failed'.format(op['path']))
+        return doc
+    elif name == 'remove':
+        return remove(doc, path)
+    elif name == 'add':
+        return add(doc, path, copy.deepcopy(op['value']))
+    elif name == 'replace':
+        resolve(doc, path)
+        return add(remove(doc, path), path, copy.deepcopy(op['value']))
+    elif name == 'copy':
+        return add(doc, path, copy.deepcopy(resolve(doc, from_path)))
+    elif name == 'move':
+        if path[:len(from_path)] == from_path and path != from_path:
+            raise ValueError('cannot move a value into one of its children')
+
+        value = resolve(doc, from_path)
+        return add(remove(doc, from_path), path, value)
+
+
+def resolve(doc, path):
+    for token in path:
+        doc = child(doc, token)
+
+    return doc
+
+
+def child(container, token):
+    try:
+        if isinstance(container, dict):
+            return container[token]
+        elif isinstance(container, list):
+            return container[list_index(container, token)]
+    except (KeyError, IndexError):
+        pass
+
+    raise ValueError('nothing found at {0!r}'.format(token))
+
+
+def list_index(container, token, appending=False):
+    if appending and token == '-':
+        return len(container)
+
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise ValueError('invalid list index {0!r}'.format(token))
+
+    return int(token)
+
+
+def add(doc, path, value):
+    if not path:
+        return value
+
+    parent = resolve(doc, path[:-1])
+    token = path[-1]
+
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        idx = list_index(parent, token, appending=True)
+
+        if idx > len(parent):
+            raise ValueError('list index {0} is out of range'.format(idx))
+
+        parent.insert(idx, value)
+    else:
+        raise ValueError('cannot add to {0!r}'.format(parent))
+
+    return doc
+
+
+def remove(doc, path):
+    if not path:
+        return None
+
+    parent = resolve(doc, path[:-1])
+    token = path[-1]
+
+    child(parent, token)
+
+    if isinstance(parent, dict):
+        del parent[token]
+    else:
+        del parent[list_index(parent, token)]
+
+    return doc
+
+
+def merge_patch(doc, patch):
+    '''
+        Apply a JSON Merge Patch to a document, and return the resulting
+        document.
+    '''
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+
+    if not isinstance(doc, dict):
+        doc = {}
+
+    for k, v in patch.iteritems():
+        if v is None:
+            doc.pop(k, None)
+        else:
+            doc[k] = merge_patch(doc.get(k), v)
+
+    return doc
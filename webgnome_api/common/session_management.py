@@ -1,7 +1,108 @@
 """
 Common Gnome object request handlers.
 """
-from gnome.multi_model_broadcast import ModelBroadcaster
+import time
+from itertools import count
+
+from .broadcasters import Ensemble
+from .timing import TimingSummary
+from .delta import TrajectoryDeltaEncoder
+from .checkpoints import CheckpointStore
+
+_revisions = count(1)
+
+# the number of seconds between our sweeps for expired session state
+sweep_interval = 60
+
+
+class SessionObjects(dict):
+    '''
+        The py_gnome objects of a session, keyed by their id.
+
+        The revision is changed whenever an object is added to the
+        session, or is updated.  Revisions are never reused, even by
+        different sessions, so anything that was derived from a session's
+        objects can tell that it is stale by comparing revisions.
+
+        The version of an object is the revision at which it was last
+        added or updated.  A change that isn't made to any one object
+        changes the epoch instead, which dates all of our objects.
+        Our serialization cache uses them to tell which objects have
+        changed.  They are also changed when the model run moves our
+        objects to a state that the model step doesn't tell apart.
+
+        We remember the earliest model time that is affected by each of
+        our latest max_changes changes, so that the results of a model
+        run from before that time can be kept.
+
+        The time that the objects were last accessed tells us when the
+        session has expired.
+    '''
+    max_changes = 100
+
+    def __init__(self, *args, **kwargs):
+        self.changes = []
+        self.versions = {}
+        self.serialized = {}
+        self.last_access = time.time()
+
+        super(SessionObjects, self).__init__(*args, **kwargs)
+        self.touch()
+
+    def __setitem__(self, key, value):
+        super(SessionObjects, self).__setitem__(key, value)
+        self.touch(obj=value)
+
+    def touch(self, affected_from=None, obj=None):
+        '''
+            :param affected_from: The earliest model time that is affected
+                                  by the change, or None if all of a model
+                                  run could be.
+            :param obj: The object that was changed, or None if the change
+                        could have been made to any of our objects.
+        '''
+        self.revision = next(_revisions)
+
+        if obj is None:
+            self.epoch = self.revision
+        else:
+            self.versions[id(obj)] = self.revision
+
+        self.changes.append((self.revision, affected_from))
+        del self.changes[:-self.max_changes]
+
+    def refresh(self, obj=None):
+        '''
+            Date the serialized form of an object, or of all of our objects
+            if obj is None, without counting it as a change.  Our objects
+            also change as the model runs, which doesn't change the model
+            run itself, so our checkpoints & uncertain models stay valid.
+        '''
+        version = next(_revisions)
+
+        if obj is None:
+            self.epoch = version
+        else:
+            self.versions[id(obj)] = version
+
+    def version(self, obj):
+        return self.versions.get(id(obj), 0)
+
+    def affected_since(self, revision):
+        '''
+            The earliest model time that is affected by the changes since
+            a revision, or None if all of a model run could be.
+        '''
+        if revision is None or revision < self.changes[0][0]:
+            # we don't remember all of the changes since then
+            return None
+
+        affected = [t for r, t in self.changes if r > revision]
+
+        if not affected or None in affected:
+            return None
+        else:
+            return min(affected)
 
 
 def init_session_objects(request, force=False):
@@ -9,14 +110,60 @@ def init_session_objects(request, force=False):
     obj_pool = request.registry.settings['objects']
 
     if (session.session_id not in obj_pool) or force:
-        obj_pool[session.session_id] = {}
+        obj_pool[session.session_id] = SessionObjects()
 
 
 def get_session_objects(request):
     init_session_objects(request)
     obj_pool = request.registry.settings['objects']
 
-    return obj_pool[request.session.session_id]
+    objects = obj_pool[request.session.session_id]
+    objects.last_access = time.time()
+
+    expire_session_state(request.registry.settings)
+
+    return objects
+
+
+def expire_session_state(settings):
+    '''
+        Drop everything that we keep for the sessions whose objects have
+        gone unused for longer than the session timeout, since those
+        sessions have expired.  We also drop the state of any session
+        that no longer has objects.
+        A session whose lock is held or waited for is still in use, so
+        it is left alone.
+        We sweep no more than once every sweep_interval seconds.
+    '''
+    now = time.time()
+
+    if now - settings.get('session_state_swept', 0) < sweep_interval:
+        return
+
+    settings['session_state_swept'] = now
+
+    obj_pool = settings['objects']
+    lock_manager = settings['py_gnome_locks']
+    timeout = settings['session_timeout']
+
+    for session_id, objects in obj_pool.items():
+        if (now - objects.last_access > timeout and
+                lock_manager.discard(session_id)):
+            del obj_pool[session_id]
+            settings['model_runs'].discard_session(session_id)
+
+    settings['model_runs'].discard_expired()
+
+    for key in ('step_timings', 'trajectory_deltas', 'checkpoints'):
+        session_state = settings[key]
+
+        for session_id in session_state.keys():
+            if session_id not in obj_pool:
+                del session_state[session_id]
+
+    for session_id in lock_manager.session_ids():
+        if session_id not in obj_pool:
+            lock_manager.discard(session_id)
 
 
 def get_session_object(obj_id, request):
@@ -51,35 +198,226 @@ def get_active_model(request):
         return None
 
 
-def get_uncertain_models(request):
-    session_id = request.session.session_id
-    uncertainty_models = request.registry.settings['uncertain_models']
+def get_session_lock(request):
+    lock_manager = request.registry.settings['py_gnome_locks']
+
+    return lock_manager.get_lock(request.session.session_id)
+
+
+def run_model_task(request, func, *args, **kwargs):
+    '''
+        Perform some py_gnome work on the model worker that is bound to
+        our session, and return its result.
+    '''
+    workers = request.registry.settings['model_workers']
+
+    return workers.apply(request.session.session_id, func, *args, **kwargs)
+
+
+def get_session_revision(request):
+    return get_session_objects(request).revision
+
+
+def get_uncertainty_ensemble(request):
+    '''
+        The dimensions of the uncertainty ensemble of our session, or the
+        configured default if the session hasn't chosen any.
+    '''
+    session = request.session
 
-    if session_id in uncertainty_models:
-        return uncertainty_models[session_id]
+    if 'uncertainty_ensemble' in session:
+        return Ensemble.from_levels(**session['uncertainty_ensemble'])
     else:
-        return None
+        return request.registry.settings['uncertainty_ensemble']
+
+
+def set_uncertainty_ensemble(request, ensemble):
+    session = request.session
+
+    session['uncertainty_ensemble'] = ensemble.to_dict()
+    session.changed()
+
+
+def checkout_uncertain_models(request):
+    '''
+        The uncertain models of our session, which are kept from being
+        stopped until they are checked back in.
+    '''
+    uncertain_models = request.registry.settings['uncertain_models']
+
+    return uncertain_models.checkout(request.session.session_id)
+
+
+def checkin_uncertain_models(request, entry):
+    uncertain_models = request.registry.settings['uncertain_models']
+
+    uncertain_models.checkin(entry)
 
 
 def set_uncertain_models(request):
-    session_id = request.session.session_id
+    '''
+        Establish the uncertain models for the first step of a run of
+        our active model.
+    '''
     uncertain_models = request.registry.settings['uncertain_models']
 
     active_model = get_active_model(request)
     if active_model:
-        model_broadcaster = ModelBroadcaster(active_model,
-                                             ('down', 'normal', 'up'),
-                                             ('down', 'normal', 'up'),
-                                             'ipc_files')
+        uncertain_models.acquire(request.session.session_id,
+                                 active_model,
+                                 get_session_revision(request),
+                                 get_uncertainty_ensemble(request))
+
+
+def prewarm_uncertain_models(request):
+    '''
+        Spawn the uncertain models for the next run of our active model
+        in the background.
+    '''
+    uncertain_models = request.registry.settings['uncertain_models']
+
+    active_model = get_active_model(request)
+    if active_model and active_model.has_weathering_uncertainty:
+        uncertain_models.prewarm(request.session.session_id,
+                                 active_model,
+                                 get_session_revision(request),
+                                 get_uncertainty_ensemble(request))
+    else:
+        drop_uncertain_models(request)
 
-        uncertain_models[session_id] = model_broadcaster
+
+def finish_uncertain_models(request):
+    '''
+        The run of our active model is over, so our uncertain models are
+        no longer kept from being stopped to make room for others.
+    '''
+    uncertain_models = request.registry.settings['uncertain_models']
+
+    uncertain_models.finish(request.session.session_id)
 
 
 def drop_uncertain_models(request):
-    session_id = request.session.session_id
     uncertain_models = request.registry.settings['uncertain_models']
 
-    if (session_id in uncertain_models and
-            uncertain_models[session_id] is not None):
-        uncertain_models[session_id].stop()
-        uncertain_models[session_id] = None
+    uncertain_models.drop(request.session.session_id)
+
+
+def wait_for_uncertain_models(request):
+    uncertain_models = request.registry.settings['uncertain_models']
+
+    uncertain_models.wait(request.session.session_id)
+
+
+def get_timing_summary(request, create=True):
+    summaries = request.registry.settings['step_timings']
+    session_id = request.session.session_id
+
+    if session_id not in summaries and create:
+        summaries[session_id] = TimingSummary()
+
+    return summaries.get(session_id)
+
+
+def reset_timing_summary(request):
+    summaries = request.registry.settings['step_timings']
+
+    summaries[request.session.session_id] = TimingSummary()
+
+
+class CancelToken(object):
+    '''
+        Lets one request cancel a model run that another request is
+        performing.  Each run gets a token of its own, so a cancel
+        can't outlive the run it was meant for.
+    '''
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def start_session_run(request):
+    '''
+        Register a full run of our session, and return the token that
+        cancels it.
+    '''
+    full_runs = request.registry.settings['full_runs']
+    token = CancelToken()
+
+    full_runs.setdefault(request.session.session_id, []).append(token)
+
+    return token
+
+
+def end_session_run(request, token):
+    full_runs = request.registry.settings['full_runs']
+    session_id = request.session.session_id
+
+    tokens = full_runs.get(session_id, [])
+
+    if token in tokens:
+        tokens.remove(token)
+
+    if not tokens:
+        full_runs.pop(session_id, None)
+
+
+def cancel_session_runs(request):
+    '''
+        Cancel the full runs of our session, and return the number of
+        runs that were cancelled.
+    '''
+    full_runs = request.registry.settings['full_runs']
+
+    tokens = full_runs.get(request.session.session_id, [])
+
+    for token in tokens:
+        token.cancel()
+
+    return len(tokens)
+
+
+def get_delta_encoder(request):
+    settings = request.registry.settings
+    encoders = settings['trajectory_deltas']
+    session_id = request.session.session_id
+
+    if session_id not in encoders:
+        interval = settings['delta_keyframe_interval']
+        encoders[session_id] = TrajectoryDeltaEncoder(interval)
+
+    return encoders[session_id]
+
+
+def reset_delta_encoder(request):
+    '''
+        The next delta frame of our session will be a keyframe.
+    '''
+    request.registry.settings['trajectory_deltas'].pop(
+        request.session.session_id, None)
+
+
+def get_checkpoints(request):
+    '''
+        The checkpoints of the model run of our session, without any
+        checkpoints that were invalidated by changes to our session
+        objects.
+    '''
+    settings = request.registry.settings
+    stores = settings['checkpoints']
+    session_id = request.session.session_id
+
+    if session_id not in stores:
+        stores[session_id] = CheckpointStore(settings['checkpoint_interval'],
+                                             settings['checkpoint_max_bytes'])
+
+    checkpoints = stores[session_id]
+    objects = get_session_objects(request)
+
+    if checkpoints.revision != objects.revision:
+        checkpoints.validate(objects.revision,
+                             objects.affected_since(checkpoints.revision),
+                             get_active_model(request))
+
+    return checkpoints
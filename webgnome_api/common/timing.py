@@ -0,0 +1,105 @@
+"""
+Instrumentation that breaks down where the time of a model step goes.
+"""
+import time
+from contextlib import contextmanager
+
+from .uncertainty import flatten, unflatten
+
+
+class StepTiming(object):
+    '''
+        Collects the wall time spent in each component of a model step.
+
+        The components of our model are instrumented by wrapping the
+        method that does their work for the duration of a step:
+        - movers: get_move()
+        - weatherers: weather_elements()
+        - outputters: write_output()
+        A component is reported by its name, and the times of components
+        that share a name are added up.
+    '''
+    instrumented_methods = (('movers', 'get_move'),
+                            ('weatherers', 'weather_elements'),
+                            ('outputters', 'write_output'))
+
+    def __init__(self):
+        self.times = {}
+
+    def add(self, key, elapsed):
+        self.times[key] = self.times.get(key, 0.0) + elapsed
+
+    def add_component(self, kind, name, elapsed):
+        components = self.times.setdefault(kind, {})
+        components[name] = components.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def instrument(self, model):
+        wrapped = []
+
+        try:
+            for kind, method_name in self.instrumented_methods:
+                for obj in getattr(model, kind):
+                    wrapped.append(self._wrap(obj, kind, method_name))
+
+            yield self
+        finally:
+            for obj, method_name, saved in wrapped:
+                if saved is None:
+                    del obj.__dict__[method_name]
+                else:
+                    obj.__dict__[method_name] = saved
+
+    def _wrap(self, obj, kind, method_name):
+        '''
+            Shadow an object's method with a timed version of it.  Only
+            this object is affected, not the other instances of its class.
+        '''
+        method = getattr(obj, method_name)
+        name = getattr(obj, 'name', None) or obj.__class__.__name__
+
+        def timed_method(*args, **kwargs):
+            begin = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add_component(kind, name, time.time() - begin)
+
+        saved = obj.__dict__.get(method_name)
+        obj.__dict__[method_name] = timed_method
+
+        return obj, method_name, saved
+
+    def to_dict(self):
+        return self.times
+
+
+class TimingSummary(object):
+    '''
+        Aggregates the step timings of a model run.
+    '''
+    def __init__(self):
+        self.steps = 0
+        self.totals = {}
+        self.maxima = {}
+
+    def add_step(self, timing):
+        self.steps += 1
+        self._add(flatten(timing))
+
+    def add(self, key, elapsed):
+        self._add([((key,), elapsed)])
+
+    def _add(self, items):
+        for path, elapsed in items:
+            self.totals[path] = self.totals.get(path, 0.0) + elapsed
+            self.maxima[path] = max(self.maxima.get(path, 0.0), elapsed)
+
+    def to_dict(self):
+        steps = max(self.steps, 1)
+
+        return {'steps': self.steps,
+                'total': unflatten(self.totals.items()),
+                'mean': unflatten([(p, v / steps)
+                                   for p, v in self.totals.iteritems()]),
+                'max': unflatten(self.maxima.items())}
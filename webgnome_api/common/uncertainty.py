@@ -0,0 +1,135 @@
+"""
+Aggregation of the weathering output of our uncertainty ensemble.
+"""
+from numbers import Number
+
+import numpy as np
+
+
+def aggregate_weathering_output(nominal, ensemble=None, percentiles=()):
+    '''
+        Combine the weathering output of our nominal model with the
+        outputs of the uncertainty ensemble.
+
+        The result contains the nominal output, the low & high bounds of
+        the ensemble, the requested percentiles of the ensemble, and the
+        output of each ensemble member keyed by its index.
+        If there is no ensemble, the bounds are None.
+
+        :param nominal: The WeatheringOutput of our nominal model.
+        :param ensemble: A list of the WeatheringOutput of each ensemble
+                         member.
+        :param percentiles: A sequence of percentiles in the range 0-100.
+    '''
+    full_output = {'time_stamp': nominal['time_stamp'],
+                   'nominal': nominal,
+                   'low': None,
+                   'high': None}
+
+    if ensemble:
+        low, high, pct = aggregate_ensemble(ensemble, percentiles)
+
+        full_output['low'] = low
+        full_output['high'] = high
+
+        if pct:
+            full_output['percentiles'] = pct
+
+        for idx, member_output in enumerate(ensemble):
+            full_output[idx] = member_output
+
+    return full_output
+
+
+def aggregate_ensemble(ensemble, percentiles=()):
+    '''
+        Compute the element-wise minimum, maximum and percentiles of a list
+        of (possibly nested) dicts.
+
+        All numeric values are stacked into a single array, with one row
+        per ensemble member, and reduced in one pass.  A member that is
+        missing a value does not take part in its reduction.
+        Any non-numeric values, like time stamps, are reduced with the
+        python builtin min() & max(), and are left out of the percentiles.
+
+        Returns a tuple (low, high, percentiles), where percentiles is a
+        dict keyed by the formatted percentile.
+    '''
+    members = [dict(flatten(m)) for m in ensemble]
+
+    keys = set()
+    for m in members:
+        keys.update(m.keys())
+
+    numeric = [k for k in keys
+               if all(is_number(m[k]) for m in members if k in m)]
+    other = keys.difference(numeric)
+
+    values = np.array([[m.get(k, np.nan) for k in numeric]
+                       for m in members], dtype=np.float64)
+
+    # integer values keep their type in the low & high bounds
+    integral = [all(isinstance(m[k], (int, long)) for m in members if k in m)
+                for k in numeric]
+
+    low = [as_type(v, i)
+           for v, i in zip(np.nanmin(values, axis=0).tolist(), integral)]
+    high = [as_type(v, i)
+            for v, i in zip(np.nanmax(values, axis=0).tolist(), integral)]
+
+    low = zip(numeric, low)
+    high = zip(numeric, high)
+
+    for k in other:
+        present = [m[k] for m in members if k in m]
+
+        low.append((k, min(present)))
+        high.append((k, max(present)))
+
+    pct = {}
+    if len(percentiles) > 0 and len(numeric) > 0:
+        pct_values = np.nanpercentile(values, percentiles, axis=0).tolist()
+
+        for p, row in zip(percentiles, pct_values):
+            pct['{0:g}'.format(p)] = unflatten(zip(numeric, row))
+
+    return unflatten(low), unflatten(high), pct
+
+
+def flatten(obj, prefix=()):
+    '''
+        Generates (path, value) pairs for all leaf values of a nested dict.
+    '''
+    for k, v in obj.iteritems():
+        path = prefix + (k,)
+
+        if isinstance(v, dict):
+            for item in flatten(v, path):
+                yield item
+        else:
+            yield path, v
+
+
+def unflatten(items):
+    '''
+        Builds a nested dict from (path, value) pairs.
+    '''
+    ret = {}
+
+    for path, v in items:
+        node = ret
+
+        for k in path[:-1]:
+            node = node.setdefault(k, {})
+
+        node[path[-1]] = v
+
+    return ret
+
+
+def is_number(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def as_type(value, integral):
+    return int(value) if integral else value
@@ -8,9 +8,11 @@ import shutil
 import uuid
 import logging
 import os
+import hashlib
 
 from pyramid.httpexceptions import (HTTPBadRequest,
                                     HTTPNotFound,
+                                    HTTPNotModified,
                                     HTTPInsufficientStorage,
                                     HTTPUnsupportedMediaType,
                                     HTTPNotImplemented)
@@ -25,13 +27,23 @@ from .helpers import (JSONImplementsOneOf,
 
 from .common_object import (CreateObject,
                             UpdateObject,
+                            PatchObject,
+                            MergePatchObject,
+                            SerializeObject,
+                            ObjectETag,
                             ObjectImplementsOneOf,
                             obj_id_from_url,
                             obj_id_from_req_payload,
                             get_session_dir,
                             clean_session_dir)
 
-from .session_management import get_session_objects, get_session_object
+from .patch import json_patch_type
+
+from .session_management import (get_session_objects,
+                                 get_session_object,
+                                 get_active_model,
+                                 get_session_lock,
+                                 run_model_task)
 
 cors_policy = {'credentials': True
                }
@@ -39,8 +51,8 @@ cors_policy = {'credentials': True
 log = logging.getLogger(__name__)
 
 
-def cors_exception(request, exception_class, with_stacktrace=False):
-    depth = 2
+def cors_exception(request, exception_class, with_stacktrace=False,
+                   etag=None):
     http_exc = exception_class()
 
     hdr_val = request.headers.get('Origin')
@@ -48,15 +60,27 @@ def cors_exception(request, exception_class, with_stacktrace=False):
         http_exc.headers.add('Access-Control-Allow-Origin', hdr_val)
         http_exc.headers.add('Access-Control-Allow-Credentials', 'true')
 
-    if with_stacktrace:
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        fmt = traceback.format_exception(exc_type, exc_value, exc_traceback)
+    if etag is not None:
+        http_exc.etag = etag
+        cors_expose_etag(request, http_exc)
 
-        http_exc.json_body = ujson.dumps([l.strip() for l in fmt][-depth:])
+    if with_stacktrace:
+        http_exc.json_body = ujson.dumps(format_exception())
 
     return http_exc
 
 
+def format_exception(depth=2):
+    '''
+        Returns the last few lines of the stacktrace of the exception
+        that is currently being handled.
+    '''
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    fmt = traceback.format_exception(exc_type, exc_value, exc_traceback)
+
+    return [l.strip() for l in fmt][-depth:]
+
+
 def cors_response(request, response):
     hdr_val = request.headers.get('Origin')
     if hdr_val is not None:
@@ -70,6 +94,55 @@ def cors_response(request, response):
     return response
 
 
+def cors_expose_etag(request, response):
+    '''
+        Browsers only let a cross-origin client see the ETag of our
+        response if we say so.
+    '''
+    if request.headers.get('Origin') is not None:
+        response.headers.add('Access-Control-Expose-Headers', 'ETag')
+
+
+def check_etag(request, etag):
+    '''
+        Give our response a strong ETag.  If the client already has the
+        representation that it stands for, we raise a 304 Not Modified
+        instead of having it generated again.
+        Our gzip filter weakens the ETag of a response that it compresses,
+        which If-None-Match still matches, since it compares weakly.
+    '''
+    if etag in request.if_none_match:
+        raise cors_exception(request, HTTPNotModified, etag=etag)
+
+    request.response.etag = etag
+    cors_expose_etag(request, request.response)
+
+
+def object_etag(request, obj, *args):
+    '''
+        The ETag of a representation of an object, which depends on the
+        versions of the objects in its tree, and any other args.
+    '''
+    return ObjectETag(obj, get_session_objects(request), *args)
+
+
+def file_etag(paths):
+    '''
+        The ETag of a representation that is generated from some files,
+        which depends on their paths, sizes and modification times.
+    '''
+    stats = []
+
+    for p in sorted(paths):
+        try:
+            st = os.stat(p)
+            stats.append((p, st.st_size, st.st_mtime))
+        except OSError:
+            stats.append((p, None, None))
+
+    return hashlib.sha1(repr(stats)).hexdigest()
+
+
 def cors_file_response(request, path):
     file_response = FileResponse(path)
 
@@ -90,13 +163,45 @@ def get_object(request, implemented_types):
         obj = get_session_object(obj_id, request)
         if obj:
             if ObjectImplementsOneOf(obj, implemented_types):
-                return obj.serialize()
+                gnome_sema = get_session_lock(request)
+                gnome_sema.acquire_read()
+
+                try:
+                    check_etag(request, object_etag(request, obj, 'json',
+                                                    get_model_step(request)))
+
+                    return serialize_object(request, obj)
+                finally:
+                    gnome_sema.release_read()
             else:
                 raise cors_exception(request, HTTPUnsupportedMediaType)
         else:
             raise cors_exception(request, HTTPNotFound)
 
 
+def serialize_object(request, obj):
+    '''
+        Serialize an object, by way of the serialization cache of our
+        session.
+    '''
+    return SerializeObject(obj, get_session_objects(request),
+                           get_model_step(request))
+
+
+def get_model_step(request):
+    '''
+        The current step of our active model.  Our objects change as the
+        model is stepped, so this is part of the version of anything that
+        is derived from them.
+    '''
+    active_model = get_active_model(request)
+
+    if active_model is not None:
+        return active_model.current_time_step
+    else:
+        return None
+
+
 def get_specifications(request, implemented_types):
     specs = {}
     for t in implemented_types:
@@ -120,20 +225,21 @@ def create_object(request, implemented_types):
     log.info('>>' + log_prefix)
 
     try:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
     except:
         raise cors_exception(request, HTTPBadRequest)
 
     if not JSONImplementsOneOf(json_request, implemented_types):
         raise cors_exception(request, HTTPNotImplemented)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
+    gnome_sema = get_session_lock(request)
     gnome_sema.acquire()
     log.info('  ' + log_prefix + 'semaphore acquired...')
 
     try:
         log.info('  ' + log_prefix + 'creating ' + json_request['obj_type'])
-        obj = CreateObject(json_request, get_session_objects(request))
+        obj = run_model_task(request, CreateObject,
+                             json_request, get_session_objects(request))
     except:
         raise cors_exception(request, HTTPUnsupportedMediaType,
                              with_stacktrace=True)
@@ -142,7 +248,7 @@ def create_object(request, implemented_types):
         log.info('  ' + log_prefix + 'semaphore released...')
 
     log.info('<<' + log_prefix)
-    return obj.serialize()
+    return serialize_object(request, obj)
 
 
 def update_object(request, implemented_types):
@@ -151,7 +257,7 @@ def update_object(request, implemented_types):
     log.info('>>' + log_prefix)
 
     try:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
     except:
         raise cors_exception(request, HTTPBadRequest)
 
@@ -161,12 +267,13 @@ def update_object(request, implemented_types):
     obj = get_session_object(obj_id_from_req_payload(json_request),
                              request)
     if obj:
-        gnome_sema = request.registry.settings['py_gnome_semaphore']
+        gnome_sema = get_session_lock(request)
         gnome_sema.acquire()
         log.info('  ' + log_prefix + 'semaphore acquired...')
 
         try:
-            UpdateObject(obj, json_request, get_session_objects(request))
+            run_model_task(request, UpdateObject,
+                           obj, json_request, get_session_objects(request))
         except:
             raise cors_exception(request, HTTPUnsupportedMediaType,
                                  with_stacktrace=True)
@@ -177,7 +284,63 @@ def update_object(request, implemented_types):
         raise cors_exception(request, HTTPNotFound)
 
     log.info('<<' + log_prefix)
-    return obj.serialize()
+    return serialize_object(request, obj)
+
+
+def patch_object(request, implemented_types):
+    '''
+        Partially updates a Gnome object, with a JSON Patch if the
+        request is of type application/json-patch+json, or with a JSON
+        Merge Patch otherwise.
+    '''
+    log_prefix = 'req({0}): patch_object():'.format(id(request))
+    log.info('>>' + log_prefix)
+
+    try:
+        patch = request.json
+    except:
+        raise cors_exception(request, HTTPBadRequest)
+
+    obj = get_session_object(obj_id_from_url(request), request)
+    if obj:
+        if not ObjectImplementsOneOf(obj, implemented_types):
+            raise cors_exception(request, HTTPUnsupportedMediaType)
+
+        gnome_sema = get_session_lock(request)
+        gnome_sema.acquire()
+        log.info('  ' + log_prefix + 'semaphore acquired...')
+
+        try:
+            apply_patch(request, obj, patch)
+        finally:
+            gnome_sema.release()
+            log.info('  ' + log_prefix + 'semaphore released...')
+    else:
+        raise cors_exception(request, HTTPNotFound)
+
+    log.info('<<' + log_prefix)
+    return serialize_object(request, obj)
+
+
+def apply_patch(request, obj, patch):
+    '''
+        Apply a patch to an object, in the format given by the content
+        type of the request.
+        The session lock is expected to be held by the caller.
+    '''
+    if request.content_type == json_patch_type:
+        patch_func = PatchObject
+    else:
+        patch_func = MergePatchObject
+
+    try:
+        run_model_task(request, patch_func,
+                       obj, patch, get_session_objects(request))
+    except ValueError:
+        raise cors_exception(request, HTTPBadRequest, with_stacktrace=True)
+    except:
+        raise cors_exception(request, HTTPUnsupportedMediaType,
+                             with_stacktrace=True)
 
 
 def process_upload(request, field_name):
@@ -0,0 +1,45 @@
+"""
+Workers that execute py_gnome model work outside of the gevent event loop.
+"""
+import zlib
+
+from gevent.threadpool import ThreadPool
+
+
+class ModelWorkerPool(object):
+    '''
+        A fixed set of single threaded workers.
+
+        Each session is bound to one worker by hashing its session id, so
+        all of the model work for a session is performed in order by the
+        same worker, while different sessions can make progress in
+        parallel.  The requesting greenlet simply waits for the result,
+        which leaves the event loop free to serve other requests while a
+        CPU-bound model step is being computed.
+
+        :param num_workers: The number of workers in the pool.  If zero,
+                            the work is performed inline by the calling
+                            greenlet.
+    '''
+    def __init__(self, num_workers=0):
+        self.workers = [ThreadPool(1) for _i in range(num_workers)]
+
+    def worker_for(self, session_id):
+        idx = (zlib.crc32(session_id) & 0xffffffff) % len(self.workers)
+
+        return self.workers[idx]
+
+    def apply(self, session_id, func, *args, **kwargs):
+        '''
+            Run func(*args, **kwargs) on the worker that owns the session
+            and return its result.  Any exception raised by func is
+            re-raised in the caller.
+        '''
+        if self.workers:
+            return self.worker_for(session_id).apply(func, args, kwargs)
+        else:
+            return func(*args, **kwargs)
+
+    def kill(self):
+        for w in self.workers:
+            w.kill()
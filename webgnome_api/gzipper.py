@@ -0,0 +1,168 @@
+"""
+    A gzip WSGI filter that does not buffer the response.
+
+    The Paste gzip filter collects the entire response body before it
+    returns anything, which defeats streaming responses such as our
+    streaming full run.  This filter compresses each chunk of the body as
+    it is produced by the application.
+    A response without a Content-Length is being generated as it is sent,
+    so we flush the compressor after each of its chunks, so that the
+    client can decompress them right away.  Any other response is
+    compressed as a whole, which compresses a lot better.
+
+    A strong ETag must be different for each content coding of
+    a representation, so we weaken the ETag of a response that we
+    compress, and of a 304 Not Modified that stands for one.  The
+    gzip and identity representations then share a weak validator,
+    which If-None-Match compares weakly.
+"""
+import zlib
+
+
+class GzipMiddleware(object):
+    def __init__(self, application, compress_level=6):
+        self.application = application
+        self.compress_level = int(compress_level)
+
+    def __call__(self, environ, start_response):
+        accepts_gzip = accepts_encoding(environ.get('HTTP_ACCEPT_ENCODING',
+                                                    ''),
+                                        'gzip')
+        compress = []
+
+        def gzip_start_response(status, headers, exc_info=None):
+            content_type = header_value(headers, 'content-type')
+            content_encoding = header_value(headers, 'content-encoding')
+
+            compressible = (status[:3] not in ('204', '304') and
+                            content_type is not None and
+                            content_type.startswith(('text/',
+                                                     'application/')) and
+                            content_encoding is None)
+
+            if compressible or status[:3] == '304':
+                # whether or not we compress it, the representation
+                # depends on the client's Accept-Encoding
+                headers = add_vary(headers, 'Accept-Encoding')
+
+                if accepts_gzip:
+                    headers = weaken_etag(headers)
+
+            if compressible and accepts_gzip:
+                streaming = header_value(headers, 'content-length') is None
+
+                headers = [(k, v) for k, v in headers
+                           if k.lower() != 'content-length']
+                headers.append(('Content-Encoding', 'gzip'))
+                compress.append(streaming)
+
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.application(environ, gzip_start_response)
+
+        return self.gzip_app_iter(app_iter, compress)
+
+    def gzip_app_iter(self, app_iter, compress):
+        '''
+            The application may not call start_response until its body is
+            iterated, so we only decide whether to compress once we have
+            our first chunk.
+        '''
+        # a wbits value of 16 + MAX_WBITS gives us a gzip header & trailer
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+
+        try:
+            for chunk in app_iter:
+                if compress:
+                    chunk = compressor.compress(chunk)
+
+                    if compress[0]:
+                        # we are streaming
+                        chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+
+                if chunk:
+                    yield chunk
+
+            if compress:
+                yield compressor.flush()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def accepts_encoding(accept_encoding, coding):
+    '''
+        Whether the value of an Accept-Encoding header allows a content
+        coding, which is the case if the coding, or the wildcard if the
+        coding isn't listed, is given a q-value greater than zero.
+    '''
+    qvalues = {}
+
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        name = params[0].strip().lower()
+
+        if not name:
+            continue
+
+        qvalue = 1.0
+        for p in params[1:]:
+            key, _sep, value = p.partition('=')
+
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+
+        qvalues[name] = qvalue
+
+    for name in (coding, 'x-' + coding, '*'):
+        if name in qvalues:
+            return qvalues[name] > 0.0
+
+    return False
+
+
+def add_vary(headers, name):
+    '''
+        Add a request header name to the Vary header of a response.
+    '''
+    vary = header_value(headers, 'vary')
+
+    if vary is None:
+        return headers + [('Vary', name)]
+
+    names = [n.strip().lower() for n in vary.split(',')]
+
+    if name.lower() in names or '*' in names:
+        return headers
+
+    return ([(k, v) for k, v in headers if k.lower() != 'vary'] +
+            [('Vary', '{0}, {1}'.format(vary, name))])
+
+
+def weaken_etag(headers):
+    etag = header_value(headers, 'etag')
+
+    if etag is None or etag.startswith('W/'):
+        return headers
+
+    return ([(k, v) for k, v in headers if k.lower() != 'etag'] +
+            [('ETag', 'W/' + etag)])
+
+
+def header_value(headers, name):
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+
+    return None
+
+
+def filter_factory(global_conf, compress_level=6):
+    def filter_(application):
+        return GzipMiddleware(application, compress_level)
+
+    return filter_
@@ -0,0 +1,157 @@
+"""
+Outputters that are implemented by the Web API rather than py_gnome.
+"""
+import copy
+
+import numpy as np
+
+from colander import SchemaNode, TupleSchema, Float, String, OneOf, drop
+
+from gnome.basic_types import oil_status
+from gnome.utilities.serializable import Serializable, Field
+from gnome.outputters.outputter import Outputter, BaseSchema
+
+
+class BBoxSchema(TupleSchema):
+    west = SchemaNode(Float())
+    south = SchemaNode(Float())
+    east = SchemaNode(Float())
+    north = SchemaNode(Float())
+
+
+class DensityGridSchema(BaseSchema):
+    bbox = BBoxSchema(missing=drop)
+    resolution = SchemaNode(Float(), missing=drop)
+    weighting = SchemaNode(String(), missing=drop,
+                           validator=OneOf(['count', 'mass']))
+
+
+class DensityGridOutput(Outputter, Serializable):
+    '''
+        Bins the positions of the elements onto a regular lon/lat grid,
+        as an alternative to the trajectory of every single element.
+        The size of its output depends only on the size of the grid.
+
+        The grid covers the bounding box, if we were given one, otherwise
+        the bounds of the model map.  The forecast & uncertain elements
+        are binned onto the same grid, so that their cells can be compared
+        one to one.  The cells are resolution degrees
+        wide & high, or the grid is split into default_cells cells along
+        each axis if no resolution is given.
+
+        Each cell holds the number of elements that are in it, or their
+        total mass if weighting is 'mass'.  Only the cells that are not
+        empty are output, as a list of their row-major indexes (the rows
+        running south to north) and a list of their values.
+    '''
+    _state = copy.deepcopy(Outputter._state)
+    _state += [Field('bbox', save=True, update=True),
+               Field('resolution', save=True, update=True),
+               Field('weighting', save=True, update=True)]
+    _schema = DensityGridSchema
+
+    default_cells = 100
+    max_cells = 1000
+
+    def __init__(self, bbox=None, resolution=None, weighting='count',
+                 **kwargs):
+        self.bbox = bbox
+        self.resolution = resolution
+        self.weighting = weighting
+
+        # The Web API gives us the map when a model run begins
+        self.map_bounds = None
+
+        super(DensityGridOutput, self).__init__(**kwargs)
+
+    def set_map(self, gnome_map):
+        map_bounds = getattr(gnome_map, 'map_bounds', None)
+
+        if map_bounds is not None and len(map_bounds) > 0:
+            map_bounds = np.asarray(map_bounds)
+            self.map_bounds = (map_bounds.min(axis=0).tolist() +
+                               map_bounds.max(axis=0).tolist())
+        else:
+            self.map_bounds = None
+
+    def write_output(self, step_num, islast_step=False):
+        super(DensityGridOutput, self).write_output(step_num, islast_step)
+
+        if not self._write_step:
+            return None
+
+        output_info = {'weighting': self.weighting}
+
+        binned = []
+        for sc in self.cache.load_timestep(step_num).items():
+            in_grid = np.in1d(sc['status_codes'], (oil_status.in_water,
+                                                    oil_status.on_land))
+            positions = sc['positions'][in_grid]
+            weights = (sc['mass'][in_grid]
+                       if self.weighting == 'mass' else None)
+
+            binned.append((sc, positions, weights))
+
+        # The forecast & uncertain grids need to line up, so they share
+        # a bounding box that covers the elements of both.
+        if binned:
+            bbox = self.grid_bbox(np.concatenate([p for _sc, p, _w
+                                                  in binned]))
+        else:
+            bbox = self.grid_bbox(np.zeros((0, 3)))
+
+        shape = grid_shape(bbox, self.resolution,
+                           self.default_cells, self.max_cells)
+
+        output_info.update({'bbox': bbox,
+                            'shape': shape})
+
+        for sc, positions, weights in binned:
+            sc_type = 'uncertain' if sc.uncertain else 'forecast'
+            output_info[sc_type] = grid_density(positions, weights,
+                                                bbox, shape)
+            output_info['time_stamp'] = sc.current_time_stamp.isoformat()
+
+        return output_info
+
+    def grid_bbox(self, positions):
+        if self.bbox is not None:
+            return list(self.bbox)
+        elif self.map_bounds is not None:
+            return list(self.map_bounds)
+        elif len(positions) > 0:
+            return (positions[:, :2].min(axis=0).tolist() +
+                    positions[:, :2].max(axis=0).tolist())
+        else:
+            return [-180.0, -90.0, 180.0, 90.0]
+
+
+def grid_shape(bbox, resolution=None, default_cells=100, max_cells=1000):
+    '''
+        The number of (rows, columns) of the grid covering a bounding box
+    '''
+    if not resolution:
+        return [default_cells, default_cells]
+
+    return [int(min(max(np.ceil((bbox[3] - bbox[1]) / resolution), 1),
+                    max_cells)),
+            int(min(max(np.ceil((bbox[2] - bbox[0]) / resolution), 1),
+                    max_cells))]
+
+
+def grid_density(positions, weights, bbox, shape):
+    '''
+        Bin lon/lat positions onto a grid, and return the cells that are
+        not empty.
+    '''
+    grid, _lat_edges, _lon_edges = np.histogram2d(positions[:, 1],
+                                                  positions[:, 0],
+                                                  bins=shape,
+                                                  range=[[bbox[1], bbox[3]],
+                                                         [bbox[0], bbox[2]]],
+                                                  weights=weights)
+    grid = grid.ravel()
+    index = np.nonzero(grid)[0]
+
+    return {'index': index.tolist(),
+            'value': grid[index].tolist()}
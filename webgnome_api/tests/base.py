@@ -51,10 +51,9 @@ class FunctionalTestBase(GnomeTestCase):
         registry = self.testapp.app.registry
         settings = registry.settings
 
-        for session_umodels in settings['uncertain_models'].values():
-            print 'our session umodels object:', session_umodels
-            if session_umodels is not None:
-                session_umodels.stop()
+        settings['model_workers'].kill()
+
+        settings['uncertain_models'].stop_all()
 
         if hasattr(registry, '_redis_sessions'):
             registry._redis_sessions.connection_pool.disconnect()
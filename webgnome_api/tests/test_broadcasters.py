@@ -0,0 +1,83 @@
+"""
+Tests for the pool of our uncertain models
+"""
+from base import UnitTestBase
+
+from webgnome_api.common import broadcasters
+from webgnome_api.common.broadcasters import (UncertainModelPool,
+                                              UncertainModelsUnavailable,
+                                              Ensemble)
+
+
+class FakeBroadcaster(object):
+    '''
+        Stands in for a ModelBroadcaster, without any processes.
+    '''
+    def __init__(self, model, wind_speed, spill_amount, ipc_folder):
+        self.commands = []
+        self.stopped = False
+
+    def cmd(self, command, args):
+        self.commands.append(command)
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeModel(object):
+    def __init__(self, model_id, current_time_step=-1):
+        self.id = model_id
+        self.current_time_step = current_time_step
+
+
+class UncertainModelPoolTests(UnitTestBase):
+    ensemble = Ensemble.from_levels(['down', 'up'], ['normal'])
+
+    def setUp(self):
+        super(UncertainModelPoolTests, self).setUp()
+
+        self.original = broadcasters.ModelBroadcaster
+        broadcasters.ModelBroadcaster = FakeBroadcaster
+
+        self.pool = UncertainModelPool(max_size=2, idle_timeout=0)
+
+    def tearDown(self):
+        broadcasters.ModelBroadcaster = self.original
+
+        super(UncertainModelPoolTests, self).tearDown()
+
+    def test_prewarm_rewound(self):
+        model = FakeModel('m')
+
+        self.pool.prewarm('s1', model, 1, self.ensemble)
+        broadcaster = self.pool.acquire('s1', model, 1, self.ensemble)
+
+        assert broadcaster.commands == []
+
+    def test_prewarm_at_end_of_run(self):
+        # an ensemble spawned from a model at the end of its run starts
+        # out at the end of the run too
+        model = FakeModel('m', current_time_step=95)
+
+        self.pool.prewarm('s1', model, 1, self.ensemble)
+
+        model.current_time_step = -1
+        broadcaster = self.pool.acquire('s1', model, 1, self.ensemble)
+
+        assert broadcaster.commands == ['rewind']
+
+    def test_no_eviction_in_use(self):
+        for session_id in ('s1', 's2'):
+            self.pool.acquire(session_id, FakeModel(session_id), 1,
+                              self.ensemble)
+
+        # both of our ensembles are running
+        self.assertRaises(UncertainModelsUnavailable,
+                          self.pool.acquire, 's3', FakeModel('s3'), 1,
+                          self.ensemble)
+
+        self.pool.finish('s1')
+        self.pool.acquire('s3', FakeModel('s3'), 1, self.ensemble)
+
+        assert self.pool.checkout('s1') is None
+        assert self.pool.checkout('s2') is not None
@@ -0,0 +1,45 @@
+"""
+Tests for the checkpoints of our model runs
+"""
+from base import UnitTestBase
+
+from webgnome_api.common.checkpoints import ModelCheckpoint
+
+
+class FakeState(object):
+    def __init__(self, names):
+        self.names = names
+
+    def get_names(self):
+        return self.names
+
+
+class FakeRelease(object):
+    _state = FakeState(['release_time', 'num_elements', 'num_released',
+                        'start_time_invalid'])
+
+    def __init__(self):
+        self.release_time = 0
+        self._num_elements = 1000
+        self.num_released = 0
+        self.start_time_invalid = None
+        self._next_release_pos = None
+
+
+class ModelCheckpointTests(UnitTestBase):
+    def test_run_state(self):
+        release = FakeRelease()
+        release.num_released = 84
+        release.start_time_invalid = False
+        release._next_release_pos = (1.0, 2.0, 0.0)
+
+        state = ModelCheckpoint.run_state(release)
+
+        # what the release has done so far in the run is kept...
+        assert state['num_released'] == 84
+        assert state['start_time_invalid'] is False
+        assert state['_next_release_pos'] == (1.0, 2.0, 0.0)
+
+        # ...while its configuration isn't
+        assert 'release_time' not in state
+        assert '_num_elements' not in state
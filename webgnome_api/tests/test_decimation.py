@@ -0,0 +1,51 @@
+"""
+Tests for the decimation of our trajectory output
+"""
+import numpy as np
+
+from base import UnitTestBase
+
+from webgnome_api.common.decimation import (stratified_sample,
+                                            decimate_feature_collection)
+
+
+def point_feature(lon, lat, **props):
+    return {'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': props}
+
+
+class StratifiedSampleTests(UnitTestBase):
+    def test_budget(self):
+        coords = np.random.RandomState(0).uniform(size=(1000, 2))
+        classes = np.zeros(1000, dtype=np.int64)
+
+        for max_points in (1, 10, 100):
+            kept, weights = stratified_sample(coords, classes, max_points)
+
+            assert 0 < len(kept) <= max_points
+            assert weights.sum() == 1000
+
+    def test_more_classes_than_budget(self):
+        # 10 classes, 5 of which hold more points than the others
+        classes = np.repeat(np.arange(10), [30, 10, 30, 10, 30,
+                                            10, 30, 10, 30, 10])
+        coords = np.random.RandomState(0).uniform(size=(len(classes), 2))
+
+        kept, weights = stratified_sample(coords, classes, 5)
+
+        assert len(kept) == 5
+        assert sorted(set(classes[kept])) == [0, 2, 4, 6, 8]
+        assert weights.tolist() == [30] * 5
+
+    def test_feature_collection(self):
+        features = [point_feature(i / 20.0, 0.0, sc_type='forecast',
+                                  spill_num=s)
+                    for s in range(4) for i in range(20)]
+        fc = {'type': 'FeatureCollection', 'features': features}
+
+        decimated = decimate_feature_collection(fc, max_points=3)
+
+        assert len(decimated['features']) == 3
+        assert [f['properties']['weight']
+                for f in decimated['features']] == [20] * 3
@@ -0,0 +1,109 @@
+"""
+Tests for our gzip filter
+"""
+import zlib
+
+from base import UnitTestBase
+
+from webgnome_api.gzipper import GzipMiddleware, accepts_encoding
+
+
+def json_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', '10'),
+                              ('Vary', 'Accept')])
+    return ['a' * 5, 'b' * 5]
+
+
+def etag_app(environ, start_response):
+    if environ.get('HTTP_IF_NONE_MATCH'):
+        start_response('304 Not Modified', [('ETag', '"abc"')])
+        return []
+
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', '2'),
+                              ('ETag', '"abc"')])
+    return ['{}']
+
+
+def streaming_app(environ, start_response):
+    def app_iter():
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+
+        for line in ('{"step_num": 0}\n', '{"step_num": 1}\n'):
+            yield line
+
+    return app_iter()
+
+
+class GzipMiddlewareTests(UnitTestBase):
+    def call(self, app, accept_encoding, **environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        chunks = list(GzipMiddleware(app)(environ, start_response))
+
+        return response['headers'], chunks
+
+    def test_accepts_encoding(self):
+        assert accepts_encoding('gzip, deflate', 'gzip')
+        assert accepts_encoding('deflate;q=0.5, GZIP;q=0.1', 'gzip')
+        assert accepts_encoding('*', 'gzip')
+
+        assert not accepts_encoding('', 'gzip')
+        assert not accepts_encoding('gzip;q=0', 'gzip')
+        assert not accepts_encoding('gzip;q=0, *', 'gzip')
+        assert not accepts_encoding('identity', 'gzip')
+
+    def test_compressed(self):
+        headers, chunks = self.call(json_app, 'gzip')
+
+        assert headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in headers
+        assert headers['Vary'] == 'Accept, Accept-Encoding'
+
+        body = zlib.decompress(''.join(chunks), 16 + zlib.MAX_WBITS)
+        assert body == 'aaaaabbbbb'
+
+    def test_not_accepted(self):
+        headers, chunks = self.call(json_app, 'gzip;q=0')
+
+        assert 'Content-Encoding' not in headers
+        assert headers['Content-Length'] == '10'
+        assert headers['Vary'] == 'Accept, Accept-Encoding'
+        assert ''.join(chunks) == 'aaaaabbbbb'
+
+    def test_streaming(self):
+        headers, chunks = self.call(streaming_app, 'gzip')
+
+        assert headers['Content-Encoding'] == 'gzip'
+
+        # each line can be decompressed as soon as it arrives
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        assert (decompressor.decompress(chunks[0]) ==
+                '{"step_num": 0}\n')
+        assert (decompressor.decompress(''.join(chunks[1:])) ==
+                '{"step_num": 1}\n')
+
+    def test_etag(self):
+        # the gzip representation gets a weak validator
+        headers, _chunks = self.call(etag_app, 'gzip')
+        assert headers['ETag'] == 'W/"abc"'
+
+        headers, _chunks = self.call(etag_app, 'gzip',
+                                     HTTP_IF_NONE_MATCH='W/"abc"')
+        assert headers['ETag'] == 'W/"abc"'
+        assert headers['Vary'] == 'Accept-Encoding'
+
+        # while the identity representation keeps its strong one
+        headers, _chunks = self.call(etag_app, 'identity')
+        assert headers['ETag'] == '"abc"'
+
+        headers, _chunks = self.call(etag_app, 'identity',
+                                     HTTP_IF_NONE_MATCH='"abc"')
+        assert headers['ETag'] == '"abc"'
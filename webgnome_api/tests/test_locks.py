@@ -0,0 +1,291 @@
+"""
+Tests for the locks that guard the py_gnome objects of our sessions
+"""
+import time
+
+import gevent
+from gevent.event import Event
+
+from base import UnitTestBase
+
+from webgnome_api.common.locks import SessionLockManager
+from webgnome_api.common.workers import ModelWorkerPool
+
+
+def settle():
+    '''
+        Let our greenlets run until they are all blocked.
+    '''
+    for _i in range(5):
+        gevent.sleep(0)
+
+
+class SessionLockManagerTests(UnitTestBase):
+    def test_lock_per_session(self):
+        manager = SessionLockManager(max_concurrent=2)
+
+        assert manager.get_lock('a') is manager.get_lock('a')
+        assert manager.get_lock('a') is not manager.get_lock('b')
+        assert sorted(manager.session_ids()) == ['a', 'b']
+
+    def test_sessions_run_concurrently(self):
+        manager = SessionLockManager(max_concurrent=2)
+        lock_a = manager.get_lock('a')
+        lock_b = manager.get_lock('b')
+
+        lock_a.acquire()
+
+        g = gevent.spawn(lock_b.acquire)
+        settle()
+
+        assert g.ready()
+
+        lock_b.release()
+        lock_a.release()
+
+    def test_global_cap(self):
+        manager = SessionLockManager(max_concurrent=1)
+        lock_a = manager.get_lock('a')
+        lock_b = manager.get_lock('b')
+
+        lock_a.acquire()
+
+        writer = gevent.spawn(lock_b.acquire)
+        reader = gevent.spawn(lock_b.acquire_read)
+        settle()
+
+        assert not writer.ready()
+        assert not reader.ready()
+
+        lock_a.release()
+        settle()
+
+        assert writer.ready()
+        assert not reader.ready()
+
+        lock_b.release()
+        settle()
+
+        assert reader.ready()
+
+        lock_b.release_read()
+        assert manager.global_sema.counter == 1
+
+    def test_pause(self):
+        manager = SessionLockManager(max_concurrent=1)
+        lock_a = manager.get_lock('a')
+        lock_b = manager.get_lock('b')
+
+        lock_a.acquire()
+        lock_a.pause()
+
+        # another session gets our global slot
+        other = gevent.spawn(lock_b.acquire)
+        settle()
+
+        assert other.ready()
+
+        # but we keep our session to ourselves
+        same = gevent.spawn(lock_a.acquire_read)
+        resume = gevent.spawn(lock_a.resume)
+        settle()
+
+        assert not same.ready()
+        assert not resume.ready()
+
+        lock_b.release()
+        settle()
+
+        assert resume.ready()
+        assert not same.ready()
+
+        # releasing a paused lock doesn't release its slot twice
+        lock_a.pause()
+        lock_a.release()
+        settle()
+
+        assert same.ready()
+
+        lock_a.release_read()
+        assert manager.global_sema.counter == 1
+
+    def test_discard(self):
+        manager = SessionLockManager(max_concurrent=1)
+        lock = manager.get_lock('a')
+
+        lock.acquire()
+        waiter = gevent.spawn(lock.acquire_read)
+        settle()
+
+        assert not manager.discard('a')
+        assert manager.get_lock('a') is lock
+
+        lock.release()
+        settle()
+
+        assert waiter.ready()
+        assert not manager.discard('a')
+
+        lock.release_read()
+
+        assert lock.idle
+        assert manager.discard('a')
+        assert manager.session_ids() == []
+        assert manager.get_lock('a') is not lock
+
+        # a session that never had a lock is gone already
+        assert manager.discard('b')
+
+    def test_writer_waits_for_worker(self):
+        # A request holding the lock while its work is performed by a
+        # worker thread must not keep the event loop from running the
+        # other greenlets, including the ones waiting for the lock.
+        manager = SessionLockManager(max_concurrent=2)
+        workers = ModelWorkerPool(num_workers=1)
+        lock = manager.get_lock('a')
+
+        started = Event()
+        events = []
+
+        def work():
+            time.sleep(0.2)
+            events.append('work done')
+
+        def run():
+            lock.acquire()
+            started.set()
+
+            try:
+                workers.apply('a', work)
+            finally:
+                lock.release()
+
+        def step():
+            started.wait()
+            lock.acquire()
+            events.append('step')
+            lock.release()
+
+        def poll():
+            started.wait()
+            events.append('poll')
+
+        try:
+            gevent.joinall([gevent.spawn(run),
+                            gevent.spawn(step),
+                            gevent.spawn(poll)],
+                           timeout=5, raise_error=True)
+        finally:
+            workers.kill()
+
+        assert events == ['poll', 'work done', 'step']
+        assert lock.idle
+
+
+class ReaderWriterTests(UnitTestBase):
+    def setUp(self):
+        super(ReaderWriterTests, self).setUp()
+
+        self.manager = SessionLockManager(max_concurrent=10)
+        self.lock = self.manager.get_lock('a')
+
+    def test_readers_share(self):
+        self.lock.acquire_read()
+
+        reader = gevent.spawn(self.lock.acquire_read)
+        settle()
+
+        assert reader.ready()
+
+        self.lock.release_read()
+        self.lock.release_read()
+
+        assert self.lock.idle
+
+    def test_writer_excludes(self):
+        self.lock.acquire()
+
+        reader = gevent.spawn(self.lock.acquire_read)
+        writer = gevent.spawn(self.lock.acquire)
+        settle()
+
+        assert not reader.ready()
+        assert not writer.ready()
+
+        self.lock.release()
+        settle()
+
+        # the waiting writer goes first
+        assert writer.ready()
+        assert not reader.ready()
+
+        self.lock.release()
+        settle()
+
+        assert reader.ready()
+
+        self.lock.release_read()
+
+    def test_writer_waits_for_readers(self):
+        self.lock.acquire_read()
+
+        writer = gevent.spawn(self.lock.acquire)
+        settle()
+
+        assert not writer.ready()
+
+        self.lock.release_read()
+        settle()
+
+        assert writer.ready()
+
+        self.lock.release()
+
+    def test_writer_before_new_readers(self):
+        # polling clients can't starve a waiting writer
+        self.lock.acquire_read()
+
+        writer = gevent.spawn(self.lock.acquire)
+        settle()
+
+        reader = gevent.spawn(self.lock.acquire_read)
+        settle()
+
+        assert not writer.ready()
+        assert not reader.ready()
+
+        self.lock.release_read()
+        settle()
+
+        assert writer.ready()
+        assert not reader.ready()
+
+        self.lock.release()
+        settle()
+
+        assert reader.ready()
+
+        self.lock.release_read()
+
+    def test_killed_writer(self):
+        # a writer that gives up waiting doesn't hold back the readers
+        self.lock.acquire_read()
+
+        writer = gevent.spawn(self.lock.acquire)
+        settle()
+
+        reader = gevent.spawn(self.lock.acquire_read)
+        settle()
+
+        assert not reader.ready()
+
+        writer.kill()
+        settle()
+
+        assert reader.ready()
+
+        self.lock.release_read()
+        self.lock.release_read()
+
+        assert self.lock.idle
+        assert self.manager.global_sema.counter == 10
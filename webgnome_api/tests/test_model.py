@@ -1,6 +1,8 @@
 """
 Functional tests for the Model Web API
 """
+import ujson
+
 from gnome.multi_model_broadcast import ModelBroadcaster
 from base import FunctionalTestBase
 
@@ -150,6 +152,59 @@ class ModelTests(FunctionalTestBase):
                     for v in s.values()
                     if isinstance(v, ModelBroadcaster)]
 
+    def test_get_model_etag(self):
+        resp = self.testapp.post_json('/model', params=self.req_data)
+        model1 = resp.json_body
+
+        resp = self.testapp.get('/model')
+        etag = resp.headers['ETag']
+
+        # an unchanged model is not sent again
+        self.testapp.get('/model', headers={'If-None-Match': etag},
+                         status=304)
+
+        model1['time_step'] = 1800.0
+        self.testapp.put_json('/model', params=model1)
+
+        resp = self.testapp.get('/model', headers={'If-None-Match': etag})
+
+        assert resp.headers['ETag'] != etag
+        assert resp.json_body['time_step'] == 1800.0
+
+    def test_merge_patch(self):
+        resp = self.testapp.post_json('/model', params=self.req_data)
+        model1 = resp.json_body
+
+        patch = {'duration': 2 * 86400.0}
+        resp = self.testapp.patch('/model', ujson.dumps(patch),
+                                  content_type='application/merge-patch+json')
+        model2 = resp.json_body
+
+        assert model2['id'] == model1['id']
+        assert model2['duration'] == 2 * 86400.0
+        assert model2['time_step'] == model1['time_step']
+
+    def test_malformed_json(self):
+        self.testapp.post('/model', '{"obj_type": ',
+                          content_type='application/json', status=400)
+
+        self.testapp.post_json('/model', params=self.req_data)
+
+        self.testapp.put('/model', '{"obj_type": ',
+                         content_type='application/json', status=400)
+        self.testapp.patch('/model', '{"duration": ',
+                           content_type='application/merge-patch+json',
+                           status=400)
+        self.testapp.patch('/model', '[{"op": ',
+                           content_type='application/json-patch+json',
+                           status=400)
+
+        # our other objects are created & updated by the common views
+        self.testapp.post('/spill', '{"obj_type": ',
+                          content_type='application/json', status=400)
+        self.testapp.put('/spill', 'not json',
+                         content_type='application/json', status=400)
+
 
 class NestedModelTests(FunctionalTestBase):
     req_data = {'obj_type': u'gnome.model.Model',
@@ -244,6 +299,66 @@ class NestedModelTests(FunctionalTestBase):
 
         assert model2['environment'][0]['units'] == 'knots'
 
+    def test_patch_nested_environment(self):
+        req_data = self.req_data.copy()
+        req_data['environment'] = [{'obj_type': 'gnome.environment.Wind',
+                                    'description': u'Wind Object',
+                                    'updated_at': '2014-03-26T14:52:45.385126',
+                                    'source_type': u'undefined',
+                                    'source_id': u'undefined',
+                                    'timeseries': [('2012-11-06T20:10:30',
+                                                    (1.0, 0.0)),
+                                                   ('2012-11-06T20:15:30',
+                                                    (1.0, 270.0))],
+                                    'units': u'meter per second'
+                                    }]
+
+        resp = self.testapp.post_json('/model', params=req_data)
+        model1 = resp.json_body
+
+        # a merge patch only needs the members that change
+        patch = {'duration': 2 * 86400.0}
+        resp = self.testapp.patch_json('/model', params=patch)
+        model2 = resp.json_body
+
+        assert model2['duration'] == 2 * 86400.0
+        assert model2['environment'] == model1['environment']
+
+        patch = [{'op': 'test', 'path': '/environment/0/units',
+                  'value': 'meter per second'},
+                 {'op': 'replace', 'path': '/environment/0/units',
+                  'value': 'knots'}]
+        resp = self.testapp.patch('/model', ujson.dumps(patch),
+                                  content_type='application/json-patch+json')
+        model3 = resp.json_body
+
+        assert model3['environment'][0]['id'] == model1['environment'][0]['id']
+        assert model3['environment'][0]['units'] == 'knots'
+        assert model3['duration'] == 2 * 86400.0
+
+        patch = [{'op': 'test', 'path': '/environment/0/units',
+                  'value': 'meter per second'}]
+        self.testapp.patch('/model', ujson.dumps(patch),
+                           content_type='application/json-patch+json',
+                           status=400)
+
+        # a patch is applied as a whole or not at all
+        patch = [{'op': 'replace', 'path': '/duration',
+                  'value': 3 * 86400.0},
+                 {'op': 'replace', 'path': '/environment/0/units',
+                  'value': 'meter per second'},
+                 {'op': 'test', 'path': '/environment/0/units',
+                  'value': 'knots'}]
+        self.testapp.patch('/model', ujson.dumps(patch),
+                           content_type='application/json-patch+json',
+                           status=400)
+
+        resp = self.testapp.get('/model')
+        model4 = resp.json_body
+
+        assert model4['duration'] == 2 * 86400.0
+        assert model4['environment'][0]['units'] == 'knots'
+
     def test_put_environment_inside_model(self):
         req_data = self.req_data.copy()
         req_data['environment'] = [{'obj_type': 'gnome.environment.Wind',
@@ -269,6 +384,12 @@ class NestedModelTests(FunctionalTestBase):
 
         assert environment2['units'] == 'knots'
 
+        # the model must not be served from before its wind was updated
+        resp = self.testapp.get('/model')
+        model2 = resp.json_body
+
+        assert model2['environment'][0]['units'] == 'knots'
+
         # we should not have any adios uncertainty runs yet
         app = self.testapp.app
         assert not [v for s in app.registry.settings['objects'].values()
@@ -1,6 +1,9 @@
 """
 Functional tests for the Gnome Location object Web API
 """
+import ujson
+import gevent
+
 import pytest
 
 from base import FunctionalTestBase
@@ -156,3 +159,130 @@ class ModelRunTest(FunctionalTestBase):
         # an additional call to /step should generate a 404
         resp = self.testapp.get('/step', status=404)
         print 'done!'
+
+    @pytest.mark.slow
+    def test_full_run_stream(self):
+        # We are testing our ability to stream the steps of a full run
+        self.testapp.get('/location/central-long-island-sound')
+
+        resp = self.testapp.get('/model')
+        model1 = resp.json_body
+        model1['start_time'] = self.spill_data['release']['release_time']
+
+        resp = self.testapp.post_json('/spill', params=self.spill_data)
+        spill = resp.json_body
+        model1['spills'] = [spill]
+
+        resp = self.testapp.post_json('/outputter',
+                                      params=self.geojson_data)
+        geojson_out = resp.json_body
+        model1['outputters'] = [geojson_out]
+
+        resp = self.testapp.put_json('/model', params=model1)
+        model1 = resp.json_body
+
+        resp = self.testapp.get('/full_run_stream')
+        assert resp.content_type == 'application/x-ndjson'
+
+        steps = [ujson.loads(l) for l in resp.body.splitlines()]
+
+        assert len(steps) == model1['num_time_steps']
+
+        for s, step in enumerate(steps):
+            assert 'error' not in step
+            assert step['step_num'] == s
+            assert 'feature_collection' in step['TrajectoryGeoJsonOutput']
+
+    @pytest.mark.slow
+    def test_background_run(self):
+        # We are testing our ability to perform a model run in the
+        # background and fetch its steps as they are completed
+        self.testapp.get('/location/central-long-island-sound')
+
+        resp = self.testapp.get('/model')
+        model1 = resp.json_body
+        model1['start_time'] = self.spill_data['release']['release_time']
+
+        resp = self.testapp.post_json('/spill', params=self.spill_data)
+        spill = resp.json_body
+        model1['spills'] = [spill]
+
+        resp = self.testapp.post_json('/outputter',
+                                      params=self.geojson_data)
+        geojson_out = resp.json_body
+        model1['outputters'] = [geojson_out]
+
+        resp = self.testapp.put_json('/model', params=model1)
+        model1 = resp.json_body
+
+        resp = self.testapp.post('/run')
+        run = resp.json_body
+
+        assert run['status'] in ('queued', 'running')
+        assert run['total_steps'] == model1['num_time_steps']
+
+        steps = []
+        while run['status'] in ('queued', 'running'):
+            gevent.sleep(0.1)
+
+            resp = self.testapp.get('/run/{0}/steps?from={1}'
+                                    .format(run['id'], len(steps)))
+            steps.extend(resp.json_body)
+
+            resp = self.testapp.get('/run/{0}'.format(run['id']))
+            run = resp.json_body
+
+        resp = self.testapp.get('/run/{0}/steps?from={1}'
+                                .format(run['id'], len(steps)))
+        steps.extend(resp.json_body)
+
+        assert run['status'] == 'finished'
+        assert run['current_step'] == model1['num_time_steps']
+        assert [s['step_num'] for s in steps] == range(len(steps))
+
+        self.testapp.get('/run/not-a-run', status=404)
+
+        # bad parameters are rejected before the run is queued
+        self.testapp.post('/run?max_points=0', status=400)
+
+    @pytest.mark.slow
+    def test_cancel_full_run(self):
+        # We are testing our ability to cancel a full run in progress
+        self.testapp.get('/location/central-long-island-sound')
+
+        resp = self.testapp.get('/model')
+        model1 = resp.json_body
+        model1['start_time'] = self.spill_data['release']['release_time']
+
+        resp = self.testapp.post_json('/spill', params=self.spill_data)
+        spill = resp.json_body
+        model1['spills'] = [spill]
+
+        resp = self.testapp.post_json('/outputter',
+                                      params=self.geojson_data)
+        geojson_out = resp.json_body
+        model1['outputters'] = [geojson_out]
+
+        resp = self.testapp.put_json('/model', params=model1)
+        model1 = resp.json_body
+
+        full_run = gevent.spawn(self.testapp.get,
+                                '/full_run_without_response')
+        gevent.sleep(0.1)
+
+        self.testapp.delete('/full_run_without_response', status=204)
+
+        output = full_run.get().json_body
+
+        assert output['cancelled'] is True
+        assert output['step_num'] < model1['num_time_steps'] - 1
+
+        # a cancel only applies to the run in progress
+        resp = self.testapp.get('/full_run_without_response')
+        output = resp.json_body
+
+        assert 'cancelled' not in output
+        assert output['step_num'] == model1['num_time_steps'] - 1
+
+        # there is nothing left to cancel
+        self.testapp.delete('/full_run_without_response', status=404)
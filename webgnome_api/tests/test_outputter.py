@@ -323,3 +323,32 @@ class WeatheringOutputterTests(OutputterTests):
     def check_updates(self, json_obj):
         assert json_obj['output_last_step'] is False
         assert json_obj['output_zero_step'] is False
+
+
+class DensityGridOutputterTests(OutputterTests):
+    '''
+        Tests out the Web API's DensityGridOutput object API
+    '''
+    req_data = {'obj_type': u'webgnome_api.outputters.DensityGridOutput',
+                'name': u'DensityGrid',
+                'output_last_step': True,
+                'output_zero_step': True,
+                'resolution': 0.01,
+                'weighting': 'count'}
+
+    def check_created_values(self, json_obj1, json_obj2):
+        for k in ('name', 'output_last_step', 'output_zero_step',
+                  'resolution', 'weighting'):
+            assert json_obj1[k] == json_obj2[k]
+
+    def perform_updates(self, json_obj):
+        json_obj['output_last_step'] = False
+        json_obj['output_zero_step'] = False
+        json_obj['bbox'] = [-73.0, 40.5, -72.0, 41.5]
+        json_obj['weighting'] = 'mass'
+
+    def check_updates(self, json_obj):
+        assert json_obj['output_last_step'] is False
+        assert json_obj['output_zero_step'] is False
+        assert json_obj['bbox'] == [-73.0, 40.5, -72.0, 41.5]
+        assert json_obj['weighting'] == 'mass'
@@ -0,0 +1,153 @@
+"""
+Tests for the socket.io namespace that pushes the steps of a model run
+"""
+import gevent
+
+from base import UnitTestBase
+
+from webgnome_api.views import socket_step
+from webgnome_api.views.socket_step import StepNamespace
+
+
+class FakeModel(object):
+    def __init__(self, num_time_steps):
+        self.num_time_steps = num_time_steps
+        self.current_time_step = -1
+
+
+class FakeLock(object):
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+
+def fake_step_model(request, active_model):
+    if active_model.current_time_step >= active_model.num_time_steps - 1:
+        raise StopIteration
+
+    active_model.current_time_step += 1
+
+    return {'step_num': active_model.current_time_step}
+
+
+class StepNamespaceTests(UnitTestBase):
+    '''
+        We drive the namespace with its events, and acknowledge the steps
+        that it emits ourselves.
+    '''
+    patched = {'get_active_model': lambda request: request.active_model,
+               'get_session_lock': lambda request: FakeLock(),
+               'prewarm_uncertain_models': lambda request: None,
+               'step_model': fake_step_model}
+
+    def setUp(self):
+        super(StepNamespaceTests, self).setUp()
+
+        self.originals = dict([(k, getattr(socket_step, k))
+                               for k in self.patched])
+        for k, v in self.patched.iteritems():
+            setattr(socket_step, k, v)
+
+        self.request = self.get_request()
+        self.request.active_model = FakeModel(10)
+
+        # we don't have a socket.io connection, so we skip the
+        # BaseNamespace constructor
+        self.ns = StepNamespace.__new__(StepNamespace)
+        self.ns.request = self.request
+        self.ns.initialize()
+
+        self.events = []
+        self.ns.emit = self.emit
+
+    def tearDown(self):
+        for k, v in self.originals.iteritems():
+            setattr(socket_step, k, v)
+
+        if self.ns.runner is not None:
+            self.ns.runner.kill()
+
+        super(StepNamespaceTests, self).tearDown()
+
+    def emit(self, event, *args, **kwargs):
+        self.events.append((event, args, kwargs.get('callback')))
+
+    def steps(self):
+        return [args[0]['step_num']
+                for event, args, _cb in self.events if event == 'step']
+
+    def ack(self):
+        for event, _args, callback in self.events:
+            if event == 'step' and callback is not None:
+                callback()
+
+        self.events = [(e, a, None) for e, a, _cb in self.events]
+
+    def test_ack_window(self):
+        self.ns.on_run()
+        gevent.sleep(0.01)
+
+        # the client hasn't acknowledged anything yet
+        assert self.steps() == [0, 1]
+
+        self.ack()
+        gevent.sleep(0.01)
+
+        assert self.steps() == [0, 1, 2, 3]
+
+        # an extra acknowledgement doesn't widen the window
+        self.ns.step_acked()
+        self.ns.step_acked()
+        self.ns.step_acked()
+        gevent.sleep(0.01)
+
+        assert self.steps() == [0, 1, 2, 3, 4, 5]
+
+    def test_complete(self):
+        self.ns.on_run()
+
+        for _i in range(10):
+            gevent.sleep(0.01)
+            self.ack()
+
+        assert self.steps() == range(10)
+        assert self.events[-1][0] == 'complete'
+        assert self.ns.runner.dead
+
+    def test_pause_resume(self):
+        self.ns.on_run()
+        gevent.sleep(0.01)
+
+        self.ns.on_pause()
+        self.ack()
+        gevent.sleep(0.01)
+
+        # the steps in flight aren't followed by any others
+        assert self.steps() == [0, 1]
+
+        self.ns.on_resume()
+        gevent.sleep(0.01)
+
+        assert self.steps() == [0, 1, 2, 3]
+
+    def test_run_while_running(self):
+        self.ns.on_run()
+        gevent.sleep(0.01)
+
+        runner = self.ns.runner
+        self.ns.on_pause()
+        self.ns.on_run()
+
+        # run resumes the run in progress rather than starting another
+        assert self.ns.runner is runner
+        assert self.ns.unpaused.is_set()
+
+    def test_no_active_model(self):
+        self.request.active_model = None
+
+        self.ns.on_run()
+        gevent.sleep(0.01)
+
+        assert [e for e, _a, _cb in self.events] == ['step_error']
@@ -1,11 +1,15 @@
 """
 Functional tests for the Gnome Location object Web API
 """
+import struct
 import datetime
 import dateutil.parser
 
+import ujson
 import pytest
 
+from webgnome_api.common import binary
+
 from base import FunctionalTestBase
 
 from pprint import PrettyPrinter
@@ -393,6 +397,24 @@ class StepTest(FunctionalTestBase):
                               'output_last_step': True,
                               'output_zero_step': True}
 
+    def create_spill_model(self, outputters):
+        '''
+            Load our location, and give its model our spill and some
+            outputters.  Returns the updated model.
+        '''
+        self.testapp.get('/location/central-long-island-sound')
+
+        resp = self.testapp.get('/model')
+        model1 = resp.json_body
+
+        resp = self.testapp.post_json('/spill', params=self.spill_data)
+        model1['spills'] = [resp.json_body]
+        model1['outputters'] = outputters
+
+        resp = self.testapp.put_json('/model', params=model1)
+
+        return resp.json_body
+
     def test_first_step(self):
         # We are testing our ability to generate the first step in a model run
         resp = self.testapp.get('/location/central-long-island-sound')
@@ -439,6 +461,240 @@ class StepTest(FunctionalTestBase):
 
         assert first_step['step_num'] == 0
 
+    def test_step_batch(self):
+        # We are testing our ability to generate a batch of steps
+        # with a single request
+        model1 = self.create_spill_model([self.geojson_output_data,
+                                          self.weathering_output_data])
+
+        resp = self.testapp.get('/step?count=3')
+        steps = resp.json_body
+
+        assert len(steps) == 3
+        assert [s['step_num'] for s in steps] == [0, 1, 2]
+
+        # stepping until the time of step 4 should return two more steps
+        start_time = dateutil.parser.parse(model1['start_time'])
+        until = start_time + datetime.timedelta(seconds=4 *
+                                                model1['time_step'])
+
+        resp = self.testapp.get('/step?until={0}'.format(until.isoformat()))
+        steps = resp.json_body
+
+        assert [s['step_num'] for s in steps] == [3, 4]
+
+        # a time with a UTC offset is compared in UTC
+        until = start_time + datetime.timedelta(seconds=6 *
+                                                model1['time_step'])
+
+        resp = self.testapp.get('/step',
+                                params={'until': (until.isoformat() +
+                                                  '+00:00')})
+        steps = resp.json_body
+
+        assert [s['step_num'] for s in steps] == [5, 6]
+
+        self.testapp.get('/step?count=0', status=400)
+        self.testapp.get('/step?until=not-a-time', status=400)
+
+    def test_step_num(self):
+        # We are testing our ability to jump to any step of a model run
+        self.create_spill_model([self.geojson_output_data,
+                                 self.weathering_output_data])
+
+        # step far enough to have taken a checkpoint
+        resp = self.testapp.get('/step?count=15')
+        steps = resp.json_body
+        time_stamps = [s['WeatheringOutput']['time_stamp'] for s in steps]
+
+        # our spill is still releasing, so a jump only gets the elements
+        # of a sequential run if the release is restored as well
+        released = [s['WeatheringOutput']['nominal']['amount_released']
+                    for s in steps]
+        num_elements = [count_points(s['TrajectoryGeoJsonOutput']
+                                     ['feature_collection']['features'])
+                        for s in steps]
+
+        # jump back, to a step after a checkpoint and to one before it
+        for step_num in (12, 3, 14):
+            resp = self.testapp.get('/step/{0}'.format(step_num))
+            step = resp.json_body
+
+            assert step['step_num'] == step_num
+            assert (step['WeatheringOutput']['time_stamp'] ==
+                    time_stamps[step_num])
+            assert (step['WeatheringOutput']['nominal']['amount_released'] ==
+                    released[step_num])
+            assert (count_points(step['TrajectoryGeoJsonOutput']
+                                 ['feature_collection']['features']) ==
+                    num_elements[step_num])
+
+            # and we continue from there
+            resp = self.testapp.get('/step')
+            assert resp.json_body['step_num'] == step_num + 1
+
+        # the client hasn't seen the steps we jumped over, so a jump
+        # gets a keyframe, even if it lands right after the last frame
+        resp = self.testapp.get('/step?delta=1')
+        assert resp.json_body['step_num'] == 16
+
+        resp = self.testapp.get('/step/17?delta=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is False
+
+        resp = self.testapp.get('/step/5?delta=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is True
+
+        resp = self.testapp.get('/step/7?delta=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is True
+
+        resp = self.testapp.get('/step?delta=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is False
+
+        # the model isn't in the state it was in the last time that it
+        # was at the same step, so it is sent again
+        resp = self.testapp.get('/model')
+        etag = resp.headers['ETag']
+
+        self.testapp.get('/step/3')
+        self.testapp.get('/step/8')
+
+        resp = self.testapp.get('/model', headers={'If-None-Match': etag})
+        assert resp.headers['ETag'] != etag
+
+        self.testapp.get('/step/-1', status=400)
+        self.testapp.get('/step/not-a-step', status=400)
+        self.testapp.get('/step/100000', status=404)
+
+    def test_step_decimation(self):
+        # We are testing our ability to reduce the particles of a step
+        self.create_spill_model([self.geojson_output_data])
+
+        resp = self.testapp.get('/step?count=6')
+        features = (resp.json_body[-1]['TrajectoryGeoJsonOutput']
+                    ['feature_collection']['features'])
+        num_points = count_points(features)
+
+        self.testapp.get('/rewind')
+
+        resp = self.testapp.get('/step?count=6&max_points=10')
+        features = (resp.json_body[-1]['TrajectoryGeoJsonOutput']
+                    ['feature_collection']['features'])
+
+        assert count_points(features) <= 10
+        assert sum_weights(features) == num_points
+
+        self.testapp.get('/step?max_points=0', status=400)
+        self.testapp.get('/step?bbox=1,2,3', status=400)
+        self.testapp.get('/step?bbox=10,0,0,10', status=400)
+
+        # delta frames aren't decimated, so we don't accept both
+        self.testapp.get('/step?delta=1&max_points=10', status=400)
+        self.testapp.get('/step?delta=1&bbox=0,0,10,10', status=400)
+
+    def test_delta_step(self):
+        # We are testing our delta encoded trajectory frames
+        self.create_spill_model([self.geojson_output_data])
+
+        resp = self.testapp.get('/step?delta=1&count=3')
+        frames = [s['TrajectoryDelta'] for s in resp.json_body]
+
+        assert 'TrajectoryGeoJsonOutput' not in resp.json_body[0]
+        assert [f['keyframe'] for f in frames] == [True, False, False]
+
+        for f in frames:
+            forecast = f['forecast']
+            assert (len(forecast['id']) == len(forecast['lon']) ==
+                    len(forecast['lat']) == len(forecast['status']))
+
+        resp = self.testapp.get('/step?delta=1&keyframe=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is True
+
+        # after a rewind we start over with a keyframe
+        self.testapp.get('/rewind')
+
+        resp = self.testapp.get('/step?delta=1')
+        assert resp.json_body['TrajectoryDelta']['keyframe'] is True
+
+    def test_binary_step(self):
+        # We are testing our binary encoding of the step output
+        self.create_spill_model([self.geojson_output_data])
+
+        resp = self.testapp.get('/step',
+                                headers={'Accept': binary.content_type})
+        assert resp.content_type == binary.content_type
+
+        body = resp.body
+        header_length = struct.unpack('<I', body[:4])[0]
+        header = ujson.loads(body[4:4 + header_length])
+
+        assert header['step_num'] == 0
+        assert len(body) == 4 + header_length + header['data_length']
+
+        groups = header['TrajectoryGeoJsonOutput']['groups']
+        arrays = dict([(a['name'], a) for a in header['arrays']])
+
+        assert 'feature_collection' not in header['TrajectoryGeoJsonOutput']
+        assert arrays['lon']['count'] == sum([g['count'] for g in groups])
+        assert arrays['lat']['count'] == arrays['lon']['count']
+        assert arrays['status']['count'] == arrays['lon']['count']
+
+        # JSON remains our default
+        resp = self.testapp.get('/step')
+        assert resp.content_type == 'application/json'
+        assert resp.json_body['step_num'] == 1
+
+    def test_density_step(self):
+        # We are testing our gridded particle density output
+        self.create_spill_model([{'obj_type': ('webgnome_api.outputters'
+                                               '.DensityGridOutput'),
+                                  'name': 'DensityGrid',
+                                  'resolution': 0.05,
+                                  'output_last_step': True,
+                                  'output_zero_step': True}])
+
+        resp = self.testapp.get('/step?count=6')
+        density = resp.json_body[-1]['DensityGridOutput']
+
+        west, south, east, north = density['bbox']
+        assert west < east and south < north
+
+        rows, cols = density['shape']
+        forecast = density['forecast']
+
+        assert len(forecast['index']) == len(forecast['value'])
+        assert all([0 <= i < rows * cols for i in forecast['index']])
+        assert all([v > 0 for v in forecast['value']])
+
+    def test_step_timing(self):
+        # We are testing our breakdown of where the time of a step goes
+        self.create_spill_model([self.geojson_output_data,
+                                 self.weathering_output_data])
+
+        self.testapp.get('/timing', status=404)
+
+        resp = self.testapp.get('/step')
+        assert 'timing' not in resp.json_body
+
+        self.testapp.get('/rewind')
+
+        resp = self.testapp.get('/step?timing=1')
+        timing = resp.json_body['timing']
+
+        assert 'Server-Timing' in resp.headers
+        assert len(timing['movers']) > 0
+        assert len(timing['outputters']) == 2
+        assert timing['total'] >= 0.0
+
+        resp = self.testapp.get('/step?timing=1&count=2')
+        assert all(['timing' in s for s in resp.json_body])
+
+        resp = self.testapp.get('/timing')
+        summary = resp.json_body
+
+        assert summary['steps'] == 3
+        assert 'render' in summary['total']
+        assert summary['max']['total'] >= summary['mean']['total']
+
     def test_weathering_step(self):
         # We are testing our ability to generate the first step in a
         # weathering model run
@@ -504,6 +760,63 @@ class StepTest(FunctionalTestBase):
 
         assert first_step['step_num'] == 0
 
+    def test_step_num_after_update(self):
+        # We are testing our ability to resume a run from a checkpoint
+        # after a late change to a response option
+        self.testapp.get('/location/central-long-island-sound')
+
+        print 'test_step_num_after_update(): getting model...'
+        resp = self.testapp.get('/model')
+        model1 = resp.json_body
+
+        print 'test_step_num_after_update(): creating spill...'
+        model1['spills'] = [self.spill_data]
+
+        model1['environment'].append(self.wind_data)
+        model1['environment'].append(self.water_data)
+
+        resp = self.testapp.put_json('/model', params=model1)
+        model1 = resp.json_body
+
+        wind_data = [e for e in model1['environment']
+                     if e['obj_type'] == 'gnome.environment.wind.Wind'][0]
+        water_data = [e for e in model1['environment']
+                      if e['obj_type'] == 'gnome.environment.environment.Water'
+                      ][0]
+
+        print 'test_step_num_after_update(): creating weatherers...'
+        self.evaporation_data['wind'] = wind_data
+        self.evaporation_data['water'] = water_data
+
+        start_time = dateutil.parser.parse(model1['start_time'])
+        time_step = datetime.timedelta(seconds=model1['time_step'])
+
+        skimmer_data = dict(self.skimmer_data)
+        skimmer_data['active_start'] = (start_time +
+                                        12 * time_step).isoformat()
+
+        model1['weatherers'] = [self.evaporation_data, skimmer_data]
+        model1['outputters'] = [self.weathering_output_data]
+
+        resp = self.testapp.put_json('/model', params=model1)
+        model1 = resp.json_body
+
+        resp = self.testapp.get('/step?count=16')
+        skimmed = resp.json_body[-1]['WeatheringOutput']['nominal']['skimmed']
+
+        # skimming later leaves the steps up to the change unaffected
+        skimmer = [w for w in model1['weatherers']
+                   if w['obj_type'] == skimmer_data['obj_type']][0]
+        skimmer['active_start'] = (start_time + 14 * time_step).isoformat()
+
+        self.testapp.put_json('/weatherer', params=skimmer)
+
+        resp = self.testapp.get('/step/15')
+        step = resp.json_body
+
+        assert step['step_num'] == 15
+        assert step['WeatheringOutput']['nominal']['skimmed'] < skimmed
+
     def test_weathering_step_with_rewind(self):
         # We are testing our ability to generate the first step in a
         # weathering model run
@@ -570,9 +883,13 @@ class StepTest(FunctionalTestBase):
 
         assert first_step['step_num'] == 0
 
+        # 9 ensemble members, plus the nominal, low, high & percentiles
         weathering_out = [v for v in first_step['WeatheringOutput'].values()
                           if isinstance(v, dict)]
-        assert len(weathering_out) == 12
+        assert len(weathering_out) == 13
+
+        percentiles = first_step['WeatheringOutput']['percentiles']
+        assert sorted(percentiles.keys()) == ['5', '50', '95']
 
         resp = self.testapp.get('/step')
         second_step = resp.json_body
@@ -581,7 +898,7 @@ class StepTest(FunctionalTestBase):
 
         weathering_out = [v for v in second_step['WeatheringOutput'].values()
                           if isinstance(v, dict)]
-        assert len(weathering_out) == 12
+        assert len(weathering_out) == 13
 
         resp = self.testapp.get('/rewind')
         rewind_response = resp.json_body
@@ -594,7 +911,17 @@ class StepTest(FunctionalTestBase):
 
         weathering_out = [v for v in rewound_step['WeatheringOutput'].values()
                           if isinstance(v, dict)]
-        assert len(weathering_out) == 12
+        assert len(weathering_out) == 13
+
+        # the replayed run keeps stepping its uncertain models
+        resp = self.testapp.get('/step')
+        rewound_step = resp.json_body
+
+        assert rewound_step['step_num'] == 1
+
+        weathering_out = [v for v in rewound_step['WeatheringOutput'].values()
+                          if isinstance(v, dict)]
+        assert len(weathering_out) == 13
 
     def test_current_output_step(self):
         # We are testing our ability to generate the first step in a
@@ -1058,3 +1385,16 @@ class StepTest(FunctionalTestBase):
         assert 'nominal' in step['WeatheringOutput']
         assert 'skimmed' in step['WeatheringOutput']['nominal']
         assert step['WeatheringOutput']['nominal']['skimmed'] == skimmed_amt
+
+
+def count_points(features):
+    return sum([len(f['geometry']['coordinates'])
+                if f['geometry']['type'] == 'MultiPoint' else 1
+                for f in features])
+
+
+def sum_weights(features):
+    return sum([sum(f['properties']['weights'])
+                if f['geometry']['type'] == 'MultiPoint'
+                else f['properties']['weight']
+                for f in features])
@@ -0,0 +1,76 @@
+"""
+Tests for our py_gnome tween
+"""
+import ujson
+
+from base import UnitTestBase
+
+from webgnome_api import get_json
+from webgnome_api.tweens.py_gnome import (PyGnomeSchemaTweenFactory,
+                                          json_body_key)
+
+
+class PyGnomeSchemaTweenTests(UnitTestBase):
+    payload = {'obj_type': 'gnome.model.Model',
+               'environment': [{'obj_type': 'gnome.environment.Wind',
+                                'units': 'knots'}],
+               'duration': 86400.0}
+
+    def json_request(self, body, content_type='application/json'):
+        request = self.get_request(body=body, text=body.decode('utf-8'),
+                                   environ={'CONTENT_TYPE': content_type})
+        request.session.session_id = 'session'
+
+        return request
+
+    def handle(self, body, content_type='application/json'):
+        '''
+            Pass a request through our tween, and return what the view
+            gets from request.json.
+        '''
+        seen = {}
+
+        def handler(request):
+            seen['json'] = get_json(request)
+
+        request = self.json_request(body, content_type)
+
+        PyGnomeSchemaTweenFactory(handler, self.config.registry)(request)
+
+        return request, seen['json']
+
+    def test_adds_json_keys(self):
+        request, json_request = self.handle(ujson.dumps(self.payload))
+
+        assert json_request['json_'] == 'webapi'
+        assert json_request['environment'][0]['json_'] == 'webapi'
+        assert 'json_' not in self.payload
+
+        # the body is parsed once, and left alone
+        assert request.environ[json_body_key] is json_request
+        assert request.body == ujson.dumps(self.payload)
+
+    def test_keeps_json_keys(self):
+        payload = dict(self.payload, json_='save')
+
+        _request, json_request = self.handle(ujson.dumps(payload))
+
+        assert json_request['json_'] == 'save'
+
+    def test_merge_patch(self):
+        _request, json_request = self.handle(
+            ujson.dumps(self.payload),
+            content_type='application/merge-patch+json')
+
+        assert json_request['json_'] == 'webapi'
+
+    def test_malformed(self):
+        request = self.json_request('{"obj_type": ')
+
+        def handler(request):
+            # the view finds out for itself, and rejects the request
+            self.assertRaises(ValueError, get_json, request)
+
+        PyGnomeSchemaTweenFactory(handler, self.config.registry)(request)
+
+        assert json_body_key not in request.environ
@@ -0,0 +1,94 @@
+"""
+Tests for our weathering uncertainty ensemble
+"""
+from base import UnitTestBase, FunctionalTestBase
+
+from webgnome_api.common.uncertainty import aggregate_weathering_output
+
+
+class AggregateWeatheringOutputTests(UnitTestBase):
+    nominal = {'time_stamp': '2013-02-13T09:00:00',
+               'amount_released': 100.0,
+               'evaporated': 10.0,
+               'floating': 90,
+               'dispersion': {'natural': 1.0, 'chemical': 0.0}}
+
+    def ensemble(self):
+        return [dict(self.nominal,
+                     evaporated=10.0 + i,
+                     floating=90 - i,
+                     dispersion={'natural': 1.0 + i, 'chemical': 0.0})
+                for i in range(5)]
+
+    def test_no_ensemble(self):
+        full_output = aggregate_weathering_output(self.nominal)
+
+        assert full_output['nominal'] == self.nominal
+        assert full_output['time_stamp'] == self.nominal['time_stamp']
+        assert full_output['low'] is None
+        assert full_output['high'] is None
+        assert 'percentiles' not in full_output
+
+    def test_bounds(self):
+        ensemble = self.ensemble()
+        full_output = aggregate_weathering_output(self.nominal, ensemble)
+
+        low, high = full_output['low'], full_output['high']
+
+        assert low['evaporated'] == 10.0
+        assert high['evaporated'] == 14.0
+
+        # integer values stay integers
+        assert low['floating'] == 86
+        assert isinstance(high['floating'], int)
+
+        # nested values are aggregated as well
+        assert low['dispersion'] == {'natural': 1.0, 'chemical': 0.0}
+        assert high['dispersion'] == {'natural': 5.0, 'chemical': 0.0}
+
+        # non-numeric values are passed through
+        assert low['time_stamp'] == self.nominal['time_stamp']
+
+        for idx, member in enumerate(ensemble):
+            assert full_output[idx] == member
+
+    def test_percentiles(self):
+        full_output = aggregate_weathering_output(self.nominal,
+                                                  self.ensemble(),
+                                                  (5, 50, 95))
+
+        pct = full_output['percentiles']
+
+        assert sorted(pct.keys()) == ['5', '50', '95']
+        assert pct['50']['evaporated'] == 12.0
+        assert pct['50']['dispersion']['natural'] == 3.0
+        assert 'time_stamp' not in pct['50']
+
+
+class UncertaintyEnsembleTests(FunctionalTestBase):
+    def test_get_default(self):
+        resp = self.testapp.get('/uncertainty')
+        ensemble = resp.json_body
+
+        assert ensemble['wind_speed'] == ['down', 'normal', 'up']
+        assert ensemble['spill_amount'] == ['down', 'normal', 'up']
+
+    def test_put(self):
+        resp = self.testapp.put_json('/uncertainty',
+                                     params={'spill_amount': ['normal']})
+        ensemble = resp.json_body
+
+        assert ensemble['wind_speed'] == ['down', 'normal', 'up']
+        assert ensemble['spill_amount'] == ['normal']
+
+        resp = self.testapp.get('/uncertainty')
+
+        assert resp.json_body == ensemble
+
+    def test_put_invalid(self):
+        self.testapp.put_json('/uncertainty',
+                              params={'wind_speed': ['down', 'sideways']},
+                              status=400)
+        self.testapp.put_json('/uncertainty',
+                              params={'spill_amount': []},
+                              status=400)
@@ -0,0 +1,92 @@
+"""
+Tests for the workers that run our py_gnome model work
+"""
+import time
+import threading
+
+import gevent
+import pytest
+
+from base import UnitTestBase
+
+from webgnome_api.common.workers import ModelWorkerPool
+
+
+class ModelWorkerPoolTests(UnitTestBase):
+    def setUp(self):
+        super(ModelWorkerPoolTests, self).setUp()
+
+        self.workers = ModelWorkerPool(num_workers=4)
+
+    def tearDown(self):
+        self.workers.kill()
+
+        super(ModelWorkerPoolTests, self).tearDown()
+
+    def test_result(self):
+        assert self.workers.apply('a', lambda x, y=0: x + y, 1, y=2) == 3
+
+    def test_exception(self):
+        def fail():
+            raise ValueError('bad model')
+
+        with pytest.raises(ValueError):
+            self.workers.apply('a', fail)
+
+        # the worker survives the failure
+        assert self.workers.apply('a', lambda: 'ok') == 'ok'
+
+    def test_session_affinity(self):
+        session_ids = ['session-{0}'.format(i) for i in range(20)]
+
+        for s in session_ids:
+            assert (self.workers.worker_for(s) is
+                    self.workers.worker_for(s))
+
+        # the sessions are spread across our workers
+        assert len(set([id(self.workers.worker_for(s))
+                        for s in session_ids])) > 1
+
+    def test_session_order(self):
+        # the work of a session is performed in the order it was submitted
+        done = []
+
+        def work(i):
+            time.sleep(0.01 * (5 - i))
+            done.append(i)
+
+        gevent.joinall([gevent.spawn(self.workers.apply, 'a', work, i)
+                        for i in range(5)],
+                       timeout=5, raise_error=True)
+
+        assert done == range(5)
+
+    def test_off_event_loop(self):
+        # work is performed by a worker thread, so the event loop keeps
+        # serving other greenlets in the meantime
+        hub_thread = threading.current_thread()
+        events = []
+
+        def work():
+            time.sleep(0.2)
+            events.append('work done')
+
+            return threading.current_thread()
+
+        def poll():
+            gevent.sleep(0.05)
+            events.append('poll')
+
+        worker = gevent.spawn(self.workers.apply, 'a', work)
+        gevent.joinall([worker, gevent.spawn(poll)],
+                       timeout=5, raise_error=True)
+
+        assert worker.value is not hub_thread
+        assert events == ['poll', 'work done']
+
+    def test_inline(self):
+        workers = ModelWorkerPool(num_workers=0)
+
+        worker_thread = workers.apply('a', threading.current_thread)
+
+        assert worker_thread is threading.current_thread()
@@ -11,6 +11,9 @@ import ujson
 
 from webgnome_api.common.common_object import ValueIsJsonObject
 
+# where we keep the parsed JSON payload of a request
+json_body_key = 'webgnome_api.json_body'
+
 
 class PyGnomeSchemaTweenFactory(object):
     def __init__(self, handler, registry):
@@ -47,23 +50,27 @@ class PyGnomeSchemaTweenFactory(object):
         # code to be executed for each request
         # BEFORE the actual application code
         # goes here
-        if ('CONTENT_TYPE' in request.environ and
-                request.environ['CONTENT_TYPE'][:16] == 'application/json' and
-                request.body):
-            json_request = ujson.loads(request.body)
-
-            if self.add_json_key(json_request):
-                # TODO: The tween seems like a logical place to do
-                #       Preprocessing on a request.
-                #       But it seems like a wasteful use of processing
-                #       to evaluate our JSON request, update some content,
-                #       and then turn it back into a string.
-                #       I tried just leaving it as a JSON object, but the
-                #       request body doesn't accept anything but a string.
-                request.body = ujson.dumps(json_request)
+        if self.is_json_request(request) and request.body:
+            try:
+                json_request = ujson.loads(request.body)
+            except ValueError:
+                # we leave it to the view to reject the request
+                pass
+            else:
+                self.add_json_key(json_request)
+
+                # The views get the normalized payload from request.json,
+                # so that it is only parsed once.
+                request.environ[json_body_key] = json_request
 
         self.generate_short_session_id(request)
 
+    def is_json_request(self, request):
+        content_type = request.environ.get('CONTENT_TYPE', '').split(';')[0]
+
+        return (content_type == 'application/json' or
+                content_type.endswith('+json'))
+
     def after_the_handler(self, response):
         # code to be executed for each request
         # AFTER the actual application code
@@ -4,6 +4,7 @@ Views for the ElementType objects.
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy)
 
 from cornice import Service
@@ -31,3 +32,9 @@ def create_element_type(request):
 def update_element_type(request):
     '''Updates a Gnome ElementType object.'''
     return update_object(request, implemented_types)
+
+
+@element_type.patch()
+def patch_element_type(request):
+    '''Partially updates a Gnome ElementType object.'''
+    return patch_object(request, implemented_types)
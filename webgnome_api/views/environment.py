@@ -11,6 +11,7 @@ from pyramid.view import view_config
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy,
                                        cors_response,
                                        cors_exception,
@@ -47,6 +48,12 @@ def update_environment(request):
     return update_object(request, implemented_types)
 
 
+@env.patch()
+def patch_environment(request):
+    '''Partially updates an Environment object.'''
+    return patch_object(request, implemented_types)
+
+
 @view_config(route_name='environment_upload', request_method='OPTIONS')
 def environment_upload_options(request):
     return cors_response(request, request.response)
@@ -5,7 +5,6 @@ from os import walk
 from os.path import sep, join, isfile, isdir
 
 import time
-import ujson
 import urllib
 import redis
 
@@ -14,7 +13,10 @@ from docutils.core import publish_parts
 from cornice import Service
 from pyramid.httpexceptions import HTTPNotFound, HTTPBadRequest
 
-from webgnome_api.common.views import cors_exception, cors_policy
+from webgnome_api.common.views import (cors_exception,
+                                       cors_policy,
+                                       check_etag,
+                                       file_etag)
 from webgnome_api.common.indexing import iter_keywords
 
 help_svc = Service(name='help', path='/help*dir',
@@ -30,6 +32,14 @@ def get_help(request):
                      .encode('utf8'))
     requested_file = join(help_dir, requested_dir)
 
+    if isfile(requested_file + '.rst'):
+        check_etag(request, file_etag([requested_file + '.rst']))
+    elif isdir(requested_file):
+        check_etag(request, file_etag([join(path, fname)
+                                       for path, _dirnames, filenames
+                                       in walk(requested_file)
+                                       for fname in filenames]))
+
     if isfile(requested_file + '.rst'):
         # a single help file was requested
         html = ''
@@ -79,7 +89,7 @@ def get_help(request):
 def create_help_feedback(request):
     '''Creates a feedback entry for the given help section'''
     try:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
     except:
         raise cors_exception(request, HTTPBadRequest)
 
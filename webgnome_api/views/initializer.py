@@ -4,6 +4,7 @@ Views for the Initializer objects.
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy)
 
 from cornice import Service
@@ -38,3 +39,9 @@ def create_initializer(request):
 def update_initializer(request):
     '''Updates a Gnome Initializer object.'''
     return update_object(request, implemented_types)
+
+
+@initializer.patch()
+def patch_initializer(request):
+    '''Partially updates a Gnome Initializer object.'''
+    return patch_object(request, implemented_types)
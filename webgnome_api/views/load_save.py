@@ -15,7 +15,8 @@ from gnome.persist import load, is_savezip_valid
 from webgnome_api.common.common_object import RegisterObject, clean_session_dir
 from webgnome_api.common.session_management import (init_session_objects,
                                                     set_active_model,
-                                                    get_active_model)
+                                                    get_active_model,
+                                                    get_session_lock)
 from webgnome_api.common.views import (cors_response,
                                        cors_exception,
                                        process_upload)
@@ -51,7 +52,7 @@ def upload_model(request):
                                                     'valid zipfile!'))
 
     # now we try to load our model from the zipfile.
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
+    gnome_sema = get_session_lock(request)
     gnome_sema.acquire()
     log.info('semaphore acquired.')
     try:
@@ -18,9 +18,13 @@ from gnome.persist import load
 from webgnome_api.common.common_object import obj_id_from_url, RegisterObject
 from webgnome_api.common.session_management import (init_session_objects,
                                                     set_active_model,
-                                                    get_active_model)
+                                                    get_active_model,
+                                                    get_session_lock)
 
-from webgnome_api.common.views import cors_exception, cors_policy
+from webgnome_api.common.views import (cors_exception,
+                                       cors_policy,
+                                       check_etag,
+                                       file_etag)
 
 location_api = Service(name='location', path='/location*obj_id',
                        description="Location API", cors_policy=cors_policy)
@@ -42,22 +46,28 @@ def get_location(request):
     location_content = []
     location_file_dirs = []
 
-    for (path, _dirnames, filenames) in walk(locations_dir):
-        if len(path.split(sep)) == base_len + 1:
-            [location_content.append(ujson.load(open(join(path, f), 'r')))
-             for f in filenames
-             if f == 'compiled.json']
-
-            [location_file_dirs.append(path + "/" + basename(path) + '_save')
-             for f in filenames
-             if f == 'compiled.json']
+    location_paths = [path
+                      for (path, _dirnames, filenames) in walk(locations_dir)
+                      if (len(path.split(sep)) == base_len + 1 and
+                          'compiled.json' in filenames)]
 
     slug = obj_id_from_url(request)
+    if not slug:
+        # only our list of locations can be cached, since getting a
+        # location loads it into our session.
+        check_etag(request, file_etag([join(path, 'compiled.json')
+                                       for path in location_paths]))
+
+    for path in location_paths:
+        location_content.append(ujson.load(open(join(path, 'compiled.json'),
+                                                'r')))
+        location_file_dirs.append(path + "/" + basename(path) + '_save')
+
     if slug:
         matching = [(i, c) for i, c in enumerate(location_content)
                     if slugify.slugify_url(c['name']) == slug]
         if matching:
-            gnome_sema = request.registry.settings['py_gnome_semaphore']
+            gnome_sema = get_session_lock(request)
             gnome_sema.acquire()
             try:
                 location_file = location_file_dirs[matching[0][0]]
@@ -14,8 +14,12 @@ from pyramid.httpexceptions import (HTTPBadRequest,
                                     HTTPNotImplemented)
 
 from webgnome_api.common.views import (cors_exception,
+                                       serialize_object,
+                                       check_etag,
+                                       object_etag,
                                        cors_response,
                                        get_object,
+                                       patch_object,
                                        cors_policy,
                                        process_upload)
 
@@ -29,7 +33,9 @@ from webgnome_api.common.common_object import (CreateObject,
 from webgnome_api.common.session_management import (init_session_objects,
                                                     get_session_objects,
                                                     get_session_object,
-                                                    set_session_object)
+                                                    set_session_object,
+                                                    get_session_lock,
+                                                    run_model_task)
 
 from webgnome_api.common.helpers import JSONImplementsOneOf
 
@@ -61,15 +67,21 @@ def create_map_view(request):
     return create_map(request)
 
 
-def create_map(request):
-    '''Creates a Gnome Map object.'''
+def create_map(request, json_request=None):
+    '''
+        Creates a Gnome Map object.
+
+        The map is described by the JSON payload of the request, unless
+        we are given an already parsed description.
+    '''
     log_prefix = 'req({0}): create_map():'.format(id(request))
     init_session_objects(request)
 
-    try:
-        json_request = ujson.loads(request.body)
-    except:
-        raise cors_exception(request, HTTPBadRequest)
+    if json_request is None:
+        try:
+            json_request = request.json
+        except:
+            raise cors_exception(request, HTTPBadRequest)
 
     if not JSONImplementsOneOf(json_request, implemented_types):
         raise cors_exception(request, HTTPNotImplemented)
@@ -78,12 +90,13 @@ def create_map(request):
         json_request['filename'] = get_file_path(request,
                                                  json_request=json_request)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
+    gnome_sema = get_session_lock(request)
     gnome_sema.acquire()
     log.info('  ' + log_prefix + 'semaphore acquired...')
 
     try:
-        obj = CreateObject(json_request, get_session_objects(request))
+        obj = run_model_task(request, CreateObject,
+                             json_request, get_session_objects(request))
     except:
         raise cors_exception(request, HTTPUnsupportedMediaType,
                              with_stacktrace=True)
@@ -92,14 +105,14 @@ def create_map(request):
         log.info('  ' + log_prefix + 'semaphore released...')
 
     set_session_object(obj, request)
-    return obj.serialize()
+    return serialize_object(request, obj)
 
 
 @map_api.put()
 def update_map(request):
     '''Updates a Gnome Map object.'''
     try:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
     except:
         raise cors_exception(request, HTTPBadRequest)
 
@@ -109,16 +122,28 @@ def update_map(request):
     obj = get_session_object(obj_id_from_req_payload(json_request),
                              request)
     if obj:
+        gnome_sema = get_session_lock(request)
+        gnome_sema.acquire()
+
         try:
-            UpdateObject(obj, json_request, get_session_objects(request))
+            run_model_task(request, UpdateObject,
+                           obj, json_request, get_session_objects(request))
         except:
             raise cors_exception(request, HTTPUnsupportedMediaType,
                                  with_stacktrace=True)
+        finally:
+            gnome_sema.release()
     else:
         raise cors_exception(request, HTTPNotFound)
 
     set_session_object(obj, request)
-    return obj.serialize()
+    return serialize_object(request, obj)
+
+
+@map_api.patch()
+def patch_map(request):
+    '''Partially updates a Gnome Map object.'''
+    return patch_object(request, implemented_types)
 
 
 @view_config(route_name='map_upload', request_method='OPTIONS')
@@ -129,12 +154,11 @@ def upload_map_options(request):
 @view_config(route_name='map_upload', request_method='POST')
 def upload_map(request):
     file_path = process_upload(request, 'new_map').split(os.path.sep)[-1]
-    request.body = ujson.dumps({'obj_type': 'gnome.map.MapFromBNA',
-                                'filename': file_path,
-                                'refloat_halflife': 6.0,
-                                'json_': 'webapi'
-                                })
-    map_obj = create_map(request)
+    map_obj = create_map(request, {'obj_type': 'gnome.map.MapFromBNA',
+                                   'filename': file_path,
+                                   'refloat_halflife': 6.0,
+                                   'json_': 'webapi'
+                                   })
     resp = Response(ujson.dumps(map_obj))
 
     return cors_response(request, resp)
@@ -146,7 +170,15 @@ def get_geojson(request, implemented_types):
 
     if obj:
         if ObjectImplementsOneOf(obj, implemented_types):
-            return obj.to_geojson()
+            gnome_sema = get_session_lock(request)
+            gnome_sema.acquire_read()
+
+            try:
+                check_etag(request, object_etag(request, obj, 'geojson'))
+
+                return obj.to_geojson()
+            finally:
+                gnome_sema.release_read()
         else:
             raise cors_exception(request, HTTPNotImplemented)
     else:
@@ -1,7 +1,6 @@
 """
 Views for the Model object.
 """
-import ujson
 import logging
 from pyramid.httpexceptions import (HTTPBadRequest,
                                     HTTPNotFound,
@@ -10,8 +9,13 @@ from pyramid.httpexceptions import (HTTPBadRequest,
 from cornice import Service
 
 from webgnome_api.common.views import (cors_exception,
+                                       serialize_object,
+                                       check_etag,
+                                       object_etag,
+                                       get_model_step,
                                        cors_policy,
-                                       get_specifications)
+                                       get_specifications,
+                                       apply_patch)
 from webgnome_api.common.common_object import (CreateObject,
                                                UpdateObject,
                                                ObjectImplementsOneOf,
@@ -23,7 +27,9 @@ from webgnome_api.common.session_management import (init_session_objects,
                                                     get_session_object,
                                                     set_session_object,
                                                     get_active_model,
-                                                    set_active_model)
+                                                    set_active_model,
+                                                    get_session_lock,
+                                                    run_model_task)
 
 from webgnome_api.common.helpers import JSONImplementsOneOf
 
@@ -50,14 +56,16 @@ def get_model(request):
     '''
     ret = None
     obj_id = obj_id_from_url(request)
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
-    gnome_sema.acquire()
+    gnome_sema = get_session_lock(request)
+    gnome_sema.acquire_read()
 
     try:
         if not obj_id:
             my_model = get_active_model(request)
             if my_model:
-                ret = my_model.serialize()
+                check_etag(request, object_etag(request, my_model, 'json',
+                                                get_model_step(request)))
+                ret = serialize_object(request, my_model)
             else:
                 ret = get_specifications(request, implemented_types)
         else:
@@ -65,14 +73,16 @@ def get_model(request):
             if obj:
                 if ObjectImplementsOneOf(obj, implemented_types):
                     set_active_model(request, obj.id)
-                    ret = obj.serialize()
+                    check_etag(request, object_etag(request, obj, 'json',
+                                                    get_model_step(request)))
+                    ret = serialize_object(request, obj)
                 else:
                     # we refer to an object, but it is not a Model
                     raise cors_exception(request, HTTPBadRequest)
             else:
                 raise cors_exception(request, HTTPNotFound)
     finally:
-        gnome_sema.release()
+        gnome_sema.release_read()
 
     return ret
 
@@ -85,16 +95,19 @@ def create_model(request):
     log_prefix = 'req({0}): create_object():'.format(id(request))
     log.info('>>' + log_prefix)
 
-    try:
-        json_request = ujson.loads(request.body)
-    except:
+    if request.body:
+        try:
+            json_request = request.json
+        except:
+            raise cors_exception(request, HTTPBadRequest)
+    else:
         json_request = None
 
     if json_request and not JSONImplementsOneOf(json_request,
                                                 implemented_types):
         raise cors_exception(request, HTTPNotImplemented)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
+    gnome_sema = get_session_lock(request)
     gnome_sema.acquire()
     log.info('  ' + log_prefix + 'semaphore acquired...')
 
@@ -102,8 +115,8 @@ def create_model(request):
         init_session_objects(request, force=True)
 
         if json_request:
-            new_model = CreateObject(json_request,
-                                     get_session_objects(request))
+            new_model = run_model_task(request, CreateObject, json_request,
+                                       get_session_objects(request))
         else:
             new_model = Model()
 
@@ -119,7 +132,7 @@ def create_model(request):
         log.info('  ' + log_prefix + 'semaphore released...')
 
     log.info('<<' + log_prefix)
-    return new_model.serialize()
+    return serialize_object(request, new_model)
 
 
 @model.put()
@@ -136,14 +149,14 @@ def update_model(request):
 
     ret = None
     try:
-        json_request = ujson.loads(request.body)
+        json_request = request.json
     except:
         raise cors_exception(request, HTTPBadRequest)
 
     if not JSONImplementsOneOf(json_request, implemented_types):
         raise cors_exception(request, HTTPNotImplemented)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
+    gnome_sema = get_session_lock(request)
     gnome_sema.acquire()
     log.info('  ' + log_prefix + 'semaphore acquired...')
 
@@ -155,10 +168,11 @@ def update_model(request):
 
     if active_model:
         try:
-            if UpdateObject(active_model, json_request,
-                            get_session_objects(request)):
+            if run_model_task(request, UpdateObject,
+                              active_model, json_request,
+                              get_session_objects(request)):
                 set_session_object(active_model, request)
-            ret = active_model.serialize()
+            ret = serialize_object(request, active_model)
         except:
             raise cors_exception(request, HTTPUnsupportedMediaType,
                                  with_stacktrace=True)
@@ -177,3 +191,48 @@ def update_model(request):
 
     log.info('<<' + log_prefix)
     return ret
+
+
+@model.patch()
+def patch_model(request):
+    '''
+        Partially updates a Model, with a JSON Patch if the request is of
+        type application/json-patch+json, or with a JSON Merge Patch
+        otherwise.  Only the parts of the model that are changed by the
+        patch are deserialized and updated.
+        - Like update_model(), if we don't specify a model ID, we patch
+          the current active model.
+    '''
+    log_prefix = 'req({0}): patch_model():'.format(id(request))
+    log.info('>>' + log_prefix)
+
+    try:
+        patch = request.json
+    except:
+        raise cors_exception(request, HTTPBadRequest)
+
+    obj_id = obj_id_from_url(request)
+    if obj_id:
+        active_model = get_session_object(obj_id, request)
+    else:
+        active_model = get_active_model(request)
+
+    if active_model:
+        if not ObjectImplementsOneOf(active_model, implemented_types):
+            raise cors_exception(request, HTTPBadRequest)
+
+        gnome_sema = get_session_lock(request)
+        gnome_sema.acquire()
+        log.info('  ' + log_prefix + 'semaphore acquired...')
+
+        try:
+            apply_patch(request, active_model, patch)
+            ret = serialize_object(request, active_model)
+        finally:
+            gnome_sema.release()
+            log.info('  ' + log_prefix + 'semaphore released...')
+    else:
+        raise cors_exception(request, HTTPNotFound)
+
+    log.info('<<' + log_prefix)
+    return ret
@@ -20,12 +20,16 @@ from gnome.movers.current_movers import CurrentMoversBase
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy,
                                        cors_response,
                                        cors_exception,
+                                       check_etag,
+                                       object_etag,
                                        process_upload)
 
-from webgnome_api.common.session_management import get_session_object
+from webgnome_api.common.session_management import (get_session_object,
+                                                    get_session_lock)
 
 log = logging.getLogger(__name__)
 
@@ -70,6 +74,12 @@ def update_mover(request):
     '''Updates a Mover object.'''
     return update_object(request, implemented_types)
 
+
+@mover.patch()
+def patch_mover(request):
+    '''Partially updates a Mover object.'''
+    return patch_object(request, implemented_types)
+
 @view_config(route_name='mover_upload', request_method='OPTIONS')
 def mover_upload_options(request):
     return cors_response(request, request.response)
@@ -91,8 +101,8 @@ def get_current_info(request):
     log_prefix = 'req({0}): get_current_info():'.format(id(request))
     log.info('>>' + log_prefix)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
-    gnome_sema.acquire()
+    gnome_sema = get_session_lock(request)
+    gnome_sema.acquire_read()
     log.info('  {0} {1}'.format(log_prefix, 'semaphore acquired...'))
 
     try:
@@ -100,6 +110,8 @@ def get_current_info(request):
         mover = get_session_object(obj_id, request)
 
         if mover is not None:
+            check_etag(request, object_etag(request, mover, 'grid'))
+
             # start = active_model.start_time
             # start_seconds = time_utils.date_to_sec(start)
             # num_hours = active_model.duration.total_seconds() / 60 / 60
@@ -116,7 +128,7 @@ def get_current_info(request):
             exc = cors_exception(request, HTTPNotFound)
             raise exc
     finally:
-        gnome_sema.release()
+        gnome_sema.release_read()
         log.info('  ' + log_prefix + 'semaphore released...')
 
     log.info('<<' + log_prefix)
@@ -128,8 +140,8 @@ def get_grid_centers(request):
     log_prefix = 'req({0}): get_current_info():'.format(id(request))
     log.info('>>' + log_prefix)
 
-    gnome_sema = request.registry.settings['py_gnome_semaphore']
-    gnome_sema.acquire()
+    gnome_sema = get_session_lock(request)
+    gnome_sema.acquire_read()
     log.info('  {0} {1}'.format(log_prefix, 'semaphore acquired...'))
 
     try:
@@ -137,7 +149,8 @@ def get_grid_centers(request):
         mover = get_session_object(obj_id, request)
 
         if mover is not None:
-            
+            check_etag(request, object_etag(request, mover, 'centers'))
+
             if isinstance(mover, CurrentMoversBase):
                 # signature = get_grid_signature(mover)
                 centers = get_center_points(mover)
@@ -147,7 +160,7 @@ def get_grid_centers(request):
             exc = cors_exception(request, HTTPNotFound)
             raise exc
     finally:
-        gnome_sema.release()
+        gnome_sema.release_read()
         log.info('  ' + log_prefix + 'semaphore released...')
 
     log.info('<<' + log_prefix)
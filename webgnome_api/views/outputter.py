@@ -4,6 +4,7 @@ Views for the Outputter objects.
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy)
 
 from cornice import Service
@@ -19,6 +20,7 @@ implemented_types = ('gnome.outputters.outputter.Outputter',
                      'gnome.outputters.weathering.WeatheringOutput',
                      'gnome.outputters.json.IceJsonOutput',
                      'gnome.outputters.image.IceImageOutput',
+                     'webgnome_api.outputters.DensityGridOutput',
                      )
 
 
@@ -38,3 +40,9 @@ def create_outputter(request):
 def update_outputter(request):
     '''Updates a Gnome Outputter object.'''
     return update_object(request, implemented_types)
+
+
+@outputter.patch()
+def patch_outputter(request):
+    '''Partially updates a Gnome Outputter object.'''
+    return patch_object(request, implemented_types)
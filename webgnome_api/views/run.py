@@ -0,0 +1,152 @@
+"""
+Views for background model runs.
+"""
+import logging
+
+from pyramid.httpexceptions import (HTTPBadRequest,
+                                    HTTPNotFound,
+                                    HTTPPreconditionFailed)
+from cornice import Service
+
+from webgnome_api.common.session_management import (get_active_model,
+                                                    prewarm_uncertain_models,
+                                                    finish_uncertain_models,
+                                                    get_session_lock,
+                                                    run_model_task)
+
+from webgnome_api.common.views import cors_exception, cors_policy
+from webgnome_api.common.jobs import RunRequest
+
+from webgnome_api.views.step import step_model, get_decimation_params
+
+run_api = Service(name='run', path='/run*obj_id',
+                  description="Background Model Run API",
+                  cors_policy=cors_policy)
+
+log = logging.getLogger(__name__)
+
+
+@run_api.post()
+def create_run(request):
+    '''
+        Queues up a run of the current active Model, and returns the
+        run's status.  The run is performed in the background.
+        The parameters of /step that shape its output apply here too.
+    '''
+    # we check them now, since the run can't answer with an error
+    get_decimation_params(request)
+
+    active_model = get_active_model(request)
+
+    if active_model:
+        model_runs = request.registry.settings['model_runs']
+
+        # our run outlives the request, so it mustn't hold on to it
+        run_request = RunRequest(request)
+
+        run = model_runs.submit(request.session.session_id,
+                                lambda r: run_model(run_request,
+                                                    active_model, r),
+                                active_model.num_time_steps)
+
+        return run.to_dict()
+    else:
+        raise cors_exception(request, HTTPPreconditionFailed)
+
+
+@run_api.get()
+def get_run(request):
+    '''
+        Returns the status of a model run, or the list of model runs of our
+        session if no run is specified.
+        - /run/<id>/steps returns the output of the completed steps,
+          beginning with the step specified by the 'from' parameter.
+          Only the outputs of a run's latest steps are kept, so the
+          output may begin with a later step, which is the run's
+          first_kept_step.
+    '''
+    obj_ids = request.matchdict.get('obj_id')
+    model_runs = request.registry.settings['model_runs']
+
+    if not obj_ids:
+        return [r.to_dict()
+                for r in model_runs.session_runs(request.session.session_id)]
+
+    run = get_session_run(request)
+
+    if len(obj_ids) >= 2 and obj_ids[1] == 'steps':
+        try:
+            first = int(request.GET.get('from', 0))
+        except ValueError:
+            raise cors_exception(request, HTTPBadRequest)
+
+        return run.get_steps(first)
+    else:
+        return run.to_dict()
+
+
+@run_api.delete()
+def cancel_run(request):
+    '''
+        Cancels a model run.  A run that is in progress is stopped after
+        its current step.
+    '''
+    run = get_session_run(request)
+    request.registry.settings['model_runs'].cancel(run)
+
+    return run.to_dict()
+
+
+def get_session_run(request):
+    obj_ids = request.matchdict.get('obj_id')
+    model_runs = request.registry.settings['model_runs']
+
+    run = None
+    if obj_ids:
+        run = model_runs.get(request.session.session_id, obj_ids[0])
+
+    if run is None:
+        raise cors_exception(request, HTTPNotFound)
+
+    return run
+
+
+def run_model(request, active_model, run):
+    '''
+        Rewinds the active model and steps through it, adding each step's
+        output to the run.
+        The session lock is held for all of the run, so that steps,
+        rewinds and updates of the session's objects can't be interleaved
+        with it.  They wait for the run to finish instead.
+
+        :param request: The RunRequest that stands in for the request
+                        that submitted the run.
+    '''
+    log_prefix = 'run({0}): run_model():'.format(run.id)
+    log.info('>>' + log_prefix)
+
+    gnome_sema = get_session_lock(request)
+    gnome_sema.acquire()
+    log.info('  ' + log_prefix + 'semaphore acquired...')
+
+    try:
+        if not run.cancelled:
+            run_model_task(request, active_model.rewind)
+
+        while not run.cancelled:
+            try:
+                output = step_model(request, active_model)
+            except StopIteration:
+                prewarm_uncertain_models(request)
+                break
+
+            run.add_step(output)
+    finally:
+        # our ensemble may be stopped for others if we are cancelled
+        # or fail before the end of the run
+        finish_uncertain_models(request)
+
+        gnome_sema.release()
+        log.info('  ' + log_prefix + 'semaphore released...')
+
+    log.info('<<' + log_prefix)
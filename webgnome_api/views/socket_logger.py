@@ -12,6 +12,8 @@ from gevent import socket
 from socketio import socketio_manage
 from socketio.namespace import BaseNamespace
 
+from webgnome_api.views.socket_step import StepNamespace
+
 
 class LoggerNamespace(BaseNamespace):
     def recv_connect(self):
@@ -46,6 +48,7 @@ def socketio_service(request):
 
     resp = socketio_manage(request.environ,
                            namespaces={'/logger': LoggerNamespace,
+                                       '/step': StepNamespace,
                                        },
                            request=request)
     print 'socketio_manage() returned:', resp
@@ -0,0 +1,145 @@
+"""
+A socket.io namespace that pushes the steps of a model run to the client.
+"""
+import logging
+
+import gevent
+from gevent.event import Event
+from gevent.lock import BoundedSemaphore
+
+from socketio.namespace import BaseNamespace
+
+from webgnome_api.common.session_management import (get_active_model,
+                                                    get_session_lock,
+                                                    prewarm_uncertain_models,
+                                                    run_model_task)
+from webgnome_api.common.views import format_exception
+
+from webgnome_api.views.step import step_model
+
+log = logging.getLogger(__name__)
+
+
+class StepNamespace(BaseNamespace):
+    '''
+        Runs the active model of our session, and emits a 'step' event
+        with the output of each step as soon as it has been computed.
+
+        The client acknowledges each step, and we never have more than
+        max_unacked steps in flight, so a slow client holds up the run
+        instead of having steps pile up for it.
+
+        The client controls the run with these events:
+        - run: start stepping from wherever the model is.
+        - pause: stop stepping after the current step.
+        - resume: continue stepping.
+        - rewind: rewind the model.  A run in progress continues from
+                  the first step.
+        We emit 'complete' when the run reaches its end, 'rewound' once
+        the model has been rewound, and 'step_error' if a step fails.
+    '''
+    max_unacked = 2
+
+    def initialize(self):
+        self.runner = None
+        self.stopped = False
+
+        self.unpaused = Event()
+        self.unpaused.set()
+
+        self.window = BoundedSemaphore(self.max_unacked)
+
+    def on_run(self):
+        self.unpaused.set()
+
+        if self.runner is None or self.runner.dead:
+            # We don't use self.spawn(), since that kills the runner when
+            # the client disconnects, possibly in the middle of a step.
+            self.runner = gevent.spawn(self.run_model)
+
+    def on_pause(self):
+        self.unpaused.clear()
+
+    def on_resume(self):
+        self.unpaused.set()
+
+    def on_rewind(self):
+        active_model = get_active_model(self.request)
+
+        if active_model is None:
+            self.emit('step_error', 'no active model')
+            return
+
+        gnome_sema = get_session_lock(self.request)
+        gnome_sema.acquire()
+
+        try:
+            run_model_task(self.request, active_model.rewind)
+            prewarm_uncertain_models(self.request)
+        except Exception:
+            self.emit('step_error', format_exception())
+            return
+        finally:
+            gnome_sema.release()
+
+        self.emit('rewound')
+
+    def recv_disconnect(self):
+        # let our runner finish its current step and go away
+        self.stopped = True
+        self.unpaused.set()
+        self.release_window()
+
+        super(StepNamespace, self).recv_disconnect()
+
+    def run_model(self):
+        log_prefix = 'socket({0}): run_model():'.format(id(self))
+        log.info('>>' + log_prefix)
+
+        gnome_sema = get_session_lock(self.request)
+
+        while True:
+            self.unpaused.wait()
+            self.window.acquire()
+
+            if self.stopped:
+                break
+
+            if not self.unpaused.is_set():
+                # we were paused while we waited for an acknowledgement
+                self.release_window()
+                continue
+
+            active_model = get_active_model(self.request)
+            if active_model is None:
+                self.emit('step_error', 'no active model')
+                break
+
+            gnome_sema.acquire()
+            try:
+                output = step_model(self.request, active_model)
+            except StopIteration:
+                prewarm_uncertain_models(self.request)
+                self.emit('complete')
+                break
+            except Exception:
+                self.emit('step_error', format_exception())
+                break
+            finally:
+                gnome_sema.release()
+
+            self.emit('step', output, callback=self.step_acked)
+
+        self.release_window()
+
+        log.info('<<' + log_prefix)
+
+    def step_acked(self, *args):
+        self.release_window()
+
+    def release_window(self):
+        try:
+            self.window.release()
+        except ValueError:
+            # the window was already fully released
+            pass
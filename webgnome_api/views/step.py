@@ -2,31 +2,72 @@
 Views for the Location objects.
 """
 import time
-from collections import defaultdict
+from datetime import timedelta
 import logging
 
-from pyramid.httpexceptions import (HTTPNotFound,
+import ujson
+import dateutil.parser
+from dateutil.tz import tzutc
+import gevent
+from gevent import get_hub
+
+from pyramid.httpexceptions import (HTTPBadRequest,
+                                    HTTPNotFound,
                                     HTTPPreconditionFailed,
+                                    HTTPServiceUnavailable,
                                     HTTPUnprocessableEntity)
 from cornice import Service
 
 from gnome.weatherers import Skimmer, Burn, ChemicalDispersion
 
 from webgnome_api.common.session_management import (get_active_model,
-                                                    get_uncertain_models,
+                                                    get_session_objects,
+                                                    checkout_uncertain_models,
+                                                    checkin_uncertain_models,
+                                                    finish_uncertain_models,
                                                     drop_uncertain_models,
-                                                    set_uncertain_models)
-
-from webgnome_api.common.views import cors_exception, cors_policy
+                                                    set_uncertain_models,
+                                                    prewarm_uncertain_models,
+                                                    wait_for_uncertain_models,
+                                                    get_timing_summary,
+                                                    reset_timing_summary,
+                                                    get_delta_encoder,
+                                                    reset_delta_encoder,
+                                                    get_checkpoints,
+                                                    start_session_run,
+                                                    end_session_run,
+                                                    cancel_session_runs,
+                                                    get_session_lock,
+                                                    run_model_task)
+
+from webgnome_api.common.uncertainty import aggregate_weathering_output
+from webgnome_api.common.broadcasters import UncertainModelsUnavailable
+from webgnome_api.common.timing import StepTiming
+from webgnome_api.outputters import DensityGridOutput
+from webgnome_api.common import binary
+from webgnome_api.common.decimation import (parse_bbox,
+                                            decimate_feature_collection)
+from webgnome_api.common.views import (cors_exception,
+                                       cors_policy,
+                                       format_exception)
 
 
 step_api = Service(name='step', path='/step',
                    description="Model Step API", cors_policy=cors_policy)
+step_to_api = Service(name='step_to', path='/step/{step_num}',
+                      description="Model Random Access Step API",
+                      cors_policy=cors_policy)
 rewind_api = Service(name='rewind', path='/rewind',
                      description="Model Rewind API", cors_policy=cors_policy)
 full_run_api = Service(name='full_run', path='/full_run_without_response',
                        description="Model Full Run API",
                        cors_policy=cors_policy)
+full_run_stream_api = Service(name='full_run_stream', path='/full_run_stream',
+                              description="Model Streaming Full Run API",
+                              cors_policy=cors_policy)
+timing_api = Service(name='timing', path='/timing',
+                     description="Model Step Timing API",
+                     cors_policy=cors_policy)
 
 log = logging.getLogger(__name__)
 
@@ -34,76 +75,315 @@ log = logging.getLogger(__name__)
 @step_api.get()
 def get_step(request):
     '''
-        Generates and returns an image corresponding to the step.
+        Generates and returns the next step in the model run.
+        The parameters of our step endpoints are:
+        - count, until: generate a batch of steps, up to a number of steps
+          or an ISO time, and return them as a list.
+        - bbox, max_points: decimate the trajectory particles, see
+          common.decimation.
+        - delta, keyframe: send delta encoded trajectory frames, see
+          common.delta.  They can't be combined with decimation.
+        - timing: add a breakdown of the step's time, see /timing.
+        Clients that accept application/x-gnome-trajectory get their steps
+        in our binary encoding, see common.binary.
     '''
     log_prefix = 'req({0}): get_step():'.format(id(request))
     log.info('>>' + log_prefix)
 
+    count, until = get_batch_params(request)
+    get_decimation_params(request)
+
     active_model = get_active_model(request)
     if active_model:
         # generate the next step in the sequence.
-        gnome_sema = request.registry.settings['py_gnome_semaphore']
+        gnome_sema = get_session_lock(request)
+
+        begin = time.time()
         gnome_sema.acquire()
+        lock_wait = time.time() - begin
         log.info('  ' + log_prefix + 'semaphore acquired...')
 
         try:
-            if active_model.current_time_step == -1:
-                # our first step, establish uncertain models
-                drop_uncertain_models(request)
+            if count is None and until is None:
+                output = step_model(request, active_model, lock_wait)
+            else:
+                output = step_model_batch(request, active_model,
+                                          count, until, lock_wait)
+        except StopIteration:
+            log.info('  ' + log_prefix + 'stop iteration exception...')
+            prewarm_uncertain_models(request)
+            raise cors_exception(request, HTTPNotFound)
+        except UncertainModelsUnavailable:
+            log.info('  ' + log_prefix + 'no uncertain models...')
+            raise cors_exception(request, HTTPServiceUnavailable)
+        except:
+            log.info('  ' + log_prefix + 'unknown exception...')
+            raise cors_exception(request, HTTPUnprocessableEntity,
+                                 with_stacktrace=True)
+        finally:
+            gnome_sema.release()
+            log.info('  ' + log_prefix + 'semaphore released...')
 
-                log.info('\thas_weathering_uncertainty {0}'.
-                         format(active_model.has_weathering_uncertainty))
-                if active_model.has_weathering_uncertainty:
-                    set_uncertain_models(request)
-                else:
-                    log.info('Model does not have weathering uncertainty')
+        request.response.vary = ('Accept',)
 
-            begin = time.time()
-            output = active_model.step()
+        if binary_requested(request) or timing_requested(request):
+            return render_step_output(request, output)
+        else:
+            return output
+    else:
+        raise cors_exception(request, HTTPPreconditionFailed)
 
-            begin_uncertain = time.time()
-            steps = get_uncertain_steps(request)
-            end = time.time()
 
-            if steps and 'WeatheringOutput' in output:
-                nominal = output['WeatheringOutput']
-                aggregate = defaultdict(list)
-                low = {}
-                high = {}
-                full_output = {}
-
-                for idx, step_output in enumerate(steps):
-                    for k, v in step_output['WeatheringOutput'].iteritems():
-                        aggregate[k].append(v)
-
-                for k, v in aggregate.iteritems():
-                    low[k] = min(v)
-                    high[k] = max(v)
-
-                full_output = {'time_stamp': nominal['time_stamp'],
-                               'nominal': nominal,
-                               'low': low,
-                               'high': high}
-                for idx, step_output in enumerate(steps):
-                    full_output[idx] = step_output['WeatheringOutput']
-
-                output['WeatheringOutput'] = full_output
-                output['uncertain_response_time'] = end - begin_uncertain
-                output['total_response_time'] = end - begin
-            elif 'WeatheringOutput' in output:
-                nominal = output['WeatheringOutput']
-                full_output = {'time_stamp': nominal['time_stamp'],
-                               'nominal': nominal,
-                               'low': None,
-                               'high': None}
-                output['WeatheringOutput'] = full_output
-                output['uncertain_response_time'] = end - begin_uncertain
-                output['total_response_time'] = end - begin
+def get_batch_params(request):
+    '''
+        Parse the optional batch parameters of a step request.
+    '''
+    count = request.GET.get('count')
+    until = request.GET.get('until')
+
+    try:
+        if count is not None:
+            count = int(count)
+
+            if count < 1:
+                raise ValueError('step count must be positive')
+
+        if until is not None:
+            until = dateutil.parser.parse(until)
+
+            if until.tzinfo is not None:
+                # our model times are naive, and taken to be UTC
+                until = until.astimezone(tzutc()).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        raise cors_exception(request, HTTPBadRequest)
+
+    return count, until
+
+
+def get_decimation_params(request):
+    '''
+        Parse the optional decimation parameters of a step request.
+        The delta frames are encoded from the elements themselves rather
+        than our trajectory output, so they would ignore our decimation.
+    '''
+    max_points = request.GET.get('max_points')
+    bbox = request.GET.get('bbox')
+
+    try:
+        if ((max_points is not None or bbox is not None) and
+                flag_param(request, 'delta')):
+            raise ValueError('delta frames can not be decimated')
+
+        if max_points is not None:
+            max_points = int(max_points)
+
+            if max_points < 1:
+                raise ValueError('max_points must be positive')
+
+        if bbox is not None:
+            bbox = parse_bbox(bbox)
+    except ValueError:
+        raise cors_exception(request, HTTPBadRequest)
+
+    return max_points, bbox
+
+
+def decimate_output(request, output):
+    max_points, bbox = get_decimation_params(request)
+
+    if ((max_points is not None or bbox is not None) and
+            'TrajectoryGeoJsonOutput' in output):
+        traj_output = output['TrajectoryGeoJsonOutput']
+
+        traj_output['feature_collection'] = decimate_feature_collection(
+            traj_output['feature_collection'], max_points, bbox)
+
+
+def step_model(request, active_model, lock_wait=0.0, shape_output=True):
+    '''
+        Step the active model, along with any uncertain models, and
+        return the aggregated output.
+        The session lock is expected to be held by the caller.
+
+        :param lock_wait: The time we spent waiting for the session lock,
+                          which is reported with the step timing.
+        :param shape_output: Whether the output is shaped by the parameters
+                             of the request.  A step whose output never
+                             reaches the client is left alone, so that it
+                             doesn't end up in the delta frames or the
+                             timing summary.
+    '''
+    timing = (StepTiming()
+              if shape_output and timing_requested(request)
+              else None)
+
+    if active_model.current_time_step == -1:
+        if timing_requested(request):
+            reset_timing_summary(request)
+
+        set_outputter_maps(active_model)
+        get_checkpoints(request).model_reset()
+
+        # A new run needn't put our objects in the same state at each
+        # step as the run that our cached serializations were taken in.
+        get_session_objects(request).refresh()
+
+        # our first step, establish uncertain models
+        log.info('\thas_weathering_uncertainty {0}'.
+                 format(active_model.has_weathering_uncertainty))
+        if active_model.has_weathering_uncertainty:
+            set_uncertain_models(request)
+        else:
+            log.info('Model does not have weathering uncertainty')
+            drop_uncertain_models(request)
+
+    # The uncertain models run in their own processes, so we step them
+    # at the same time as our nominal model.
+    begin = time.time()
+    uncertain_steps = spawn_uncertain_steps(request, active_model)
+
+    try:
+        if timing is None:
+            output = run_model_task(request, active_model.step)
+        else:
+            # An instrumented model can't be pickled, so we can't have
+            # it be spawned into our uncertain models at the same time.
+            wait_for_uncertain_models(request)
+
+            with timing.instrument(active_model):
+                output = run_model_task(request, active_model.step)
+
+        run_model_task(request, get_checkpoints(request).save, active_model)
+    finally:
+        if uncertain_steps is not None:
+            # we never leave the uncertain models busy when we return,
+            # even if our nominal step has failed.
+            uncertain_steps.wait()
+
+    steps, uncertain_time = (uncertain_steps.get()
+                             if uncertain_steps is not None
+                             else (None, 0.0))
+
+    if not shape_output:
+        return output
+
+    decimate_output(request, output)
+    encode_delta(request, active_model, output)
+    end = time.time()
 
+    if 'WeatheringOutput' in output:
+        ensemble = ([s['WeatheringOutput'] for s in steps]
+                    if steps else None)
+        percentiles = request.registry.settings['uncertainty_percentiles']
+
+        output['WeatheringOutput'] = aggregate_weathering_output(
+            output['WeatheringOutput'], ensemble, percentiles)
+        output['uncertain_response_time'] = uncertain_time
+        output['total_response_time'] = end - begin
+
+    if timing is not None:
+        timing.add('lock_wait', lock_wait)
+        timing.add('uncertain', uncertain_time)
+        timing.add('total', end - begin)
+
+        output['timing'] = timing.to_dict()
+        get_timing_summary(request).add_step(output['timing'])
+
+    return output
+
+
+def set_outputter_maps(active_model):
+    for o in active_model.outputters:
+        if isinstance(o, DensityGridOutput):
+            o.set_map(active_model.map)
+
+
+def step_model_batch(request, active_model, count=None, until=None,
+                     lock_wait=0.0):
+    '''
+        Step the active model repeatedly, and return the list of outputs.
+        We stop after generating count steps, or after reaching the model
+        time specified by until, whichever comes first.
+        The session lock is expected to be held by the caller.
+    '''
+    outputs = []
+
+    while count is None or len(outputs) < count:
+        try:
+            output = step_model(request, active_model,
+                                lock_wait if not outputs else 0.0)
+        except StopIteration:
+            if not outputs:
+                raise
+
+            prewarm_uncertain_models(request)
+            break
+
+        outputs.append(output)
+
+        if until is not None and get_step_time(active_model, output) >= until:
+            break
+
+    return outputs
+
+
+@step_to_api.get()
+def get_step_num(request):
+    '''
+        Generates and returns the given step of the model run, wherever
+        the model is in its run.
+
+        Rather than rewinding and recomputing every step before it, the
+        model is restored to the latest checkpoint before the step, if
+        that is closer than where the model is, and stepped forward from
+        there.  Uncertain models can't be restored, so the steps that
+        follow a restored checkpoint don't have an uncertainty ensemble
+        until the model is rewound.
+        When the session's objects are changed, only the checkpoints past
+        the earliest model time that is affected by the changes are
+        dropped, so a run that is revisited after a late change to,
+        say, a response option is resumed from before the change instead
+        of being recomputed from its start.
+
+        The model continues from the given step, so a following /step
+        returns the step after it.  The parameters of /step that shape
+        its output apply here too.
+    '''
+    log_prefix = 'req({0}): get_step_num():'.format(id(request))
+    log.info('>>' + log_prefix)
+
+    try:
+        step_num = int(request.matchdict['step_num'])
+
+        if step_num < 0:
+            raise ValueError('step number must not be negative')
+    except ValueError:
+        raise cors_exception(request, HTTPBadRequest)
+
+    get_decimation_params(request)
+
+    active_model = get_active_model(request)
+    if active_model:
+        if step_num >= active_model.num_time_steps:
+            raise cors_exception(request, HTTPNotFound)
+
+        gnome_sema = get_session_lock(request)
+
+        begin = time.time()
+        gnome_sema.acquire()
+        lock_wait = time.time() - begin
+        log.info('  ' + log_prefix + 'semaphore acquired...')
+
+        try:
+            output = step_model_to(request, active_model, step_num,
+                                   lock_wait)
         except StopIteration:
             log.info('  ' + log_prefix + 'stop iteration exception...')
-            drop_uncertain_models(request)
+            prewarm_uncertain_models(request)
             raise cors_exception(request, HTTPNotFound)
+        except UncertainModelsUnavailable:
+            log.info('  ' + log_prefix + 'no uncertain models...')
+            raise cors_exception(request, HTTPServiceUnavailable)
         except:
             log.info('  ' + log_prefix + 'unknown exception...')
             raise cors_exception(request, HTTPUnprocessableEntity,
@@ -112,11 +392,146 @@ def get_step(request):
             gnome_sema.release()
             log.info('  ' + log_prefix + 'semaphore released...')
 
-        return output
+        request.response.vary = ('Accept',)
+
+        if binary_requested(request) or timing_requested(request):
+            return render_step_output(request, output)
+        else:
+            return output
     else:
         raise cors_exception(request, HTTPPreconditionFailed)
 
 
+def step_model_to(request, active_model, step_num, lock_wait=0.0):
+    '''
+        Bring the active model to the step before the given one, by
+        stepping it forward, restoring a checkpoint, or rewinding it,
+        and return the output of the given step.
+        The session lock is expected to be held by the caller.
+    '''
+    checkpoints = get_checkpoints(request)
+    current_step = active_model.current_time_step
+
+    if step_num != current_step + 1 or checkpoints.stale:
+        # where we would step forward from without a checkpoint
+        if current_step < step_num and not checkpoints.stale:
+            start = current_step
+        else:
+            start = -1
+
+        checkpoint = checkpoints.latest(step_num - 1)
+
+        if checkpoint is not None and checkpoint.step_num > start:
+            restore_checkpoint(request, active_model, checkpoint)
+        elif start == -1 and current_step != -1:
+            run_model_task(request, active_model.rewind)
+
+        # the client hasn't seen where we jumped to, so we don't send it
+        # a delta frame against the step that it saw last
+        reset_delta_encoder(request)
+
+    while active_model.current_time_step < step_num - 1:
+        step_model(request, active_model, shape_output=False)
+
+    return step_model(request, active_model, lock_wait)
+
+
+def restore_checkpoint(request, active_model, checkpoint):
+    if active_model.current_time_step == -1:
+        # A checkpoint can only be restored into a run that has been
+        # set up, which the first step of the run does.
+        set_outputter_maps(active_model)
+        run_model_task(request, active_model.step)
+
+    run_model_task(request, checkpoint.restore, active_model)
+    get_checkpoints(request).model_reset()
+    reset_delta_encoder(request)
+
+    # Our objects are back at an earlier step, which our cached
+    # serializations can't tell from the state they were taken in if
+    # the model is stepped back to where it was.
+    get_session_objects(request).refresh()
+
+    # our uncertain models can't follow the model to its checkpoint
+    drop_uncertain_models(request)
+
+
+def encode_delta(request, active_model, output):
+    if flag_param(request, 'delta'):
+        encoder = get_delta_encoder(request)
+
+        output.pop('TrajectoryGeoJsonOutput', None)
+        output['TrajectoryDelta'] = encoder.encode(
+            output['step_num'], active_model.spills.items(),
+            keyframe=flag_param(request, 'keyframe'))
+
+
+def flag_param(request, name):
+    return request.GET.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def timing_requested(request):
+    return flag_param(request, 'timing')
+
+
+def binary_requested(request):
+    '''
+        The client can ask for our binary step encoding with its Accept
+        header.  JSON remains our default.
+    '''
+    best_match = request.accept.best_match(['application/json',
+                                            binary.content_type])
+
+    return best_match == binary.content_type
+
+
+def render_step_output(request, output):
+    '''
+        Render our step output ourselves, either as JSON or in our binary
+        encoding, so that the time it takes can be added to the timing
+        summary of our run.
+    '''
+    response = request.response
+
+    begin = time.time()
+    if binary_requested(request):
+        response.content_type = binary.content_type
+        response.body = (binary.encode_steps(output)
+                         if isinstance(output, list)
+                         else binary.encode_step(output))
+    else:
+        response.content_type = 'application/json'
+        response.body = ujson.dumps(output)
+    render_time = time.time() - begin
+
+    if timing_requested(request):
+        get_timing_summary(request).add('render', render_time)
+        response.headers['Server-Timing'] = ('render;dur={0:.3f}'
+                                             .format(render_time * 1000))
+
+    return response
+
+
+@timing_api.get()
+def get_timing(request):
+    '''
+        Returns the step timing of the latest model run of our session
+        that was performed with timing=1, as the number of timed steps
+        and the total, mean & maximum time spent in each component.
+    '''
+    summary = get_timing_summary(request, create=False)
+
+    if summary is None:
+        raise cors_exception(request, HTTPNotFound)
+
+    return summary.to_dict()
+
+
+def get_step_time(active_model, output):
+    return (active_model.start_time +
+            timedelta(seconds=output['step_num'] * active_model.time_step))
+
+
 @rewind_api.get()
 def get_rewind(request):
     '''
@@ -124,11 +539,12 @@ def get_rewind(request):
     '''
     active_model = get_active_model(request)
     if active_model:
-        gnome_sema = request.registry.settings['py_gnome_semaphore']
+        gnome_sema = get_session_lock(request)
         gnome_sema.acquire()
 
         try:
-            active_model.rewind()
+            run_model_task(request, active_model.rewind)
+            prewarm_uncertain_models(request)
         except:
             raise cors_exception(request, HTTPUnprocessableEntity,
                                  with_stacktrace=True)
@@ -144,85 +560,215 @@ def get_full_run(request):
         Performs a full run of the current active Model, turning off any
         response options.
         Returns the final step results.
+        The decimation parameters of /step apply to the trajectory output.
+        If the run is cancelled, the results of the last step that was
+        completed are returned, marked as 'cancelled'.
     '''
+    get_decimation_params(request)
+
     active_model = get_active_model(request)
     if active_model:
-        gnome_sema = request.registry.settings['py_gnome_semaphore']
+        # our run can be cancelled while we wait for the session lock
+        cancel_token = start_session_run(request)
+
+        gnome_sema = get_session_lock(request)
         gnome_sema.acquire()
 
         try:
-            weatherer_enabled_flags = [w.on for w in active_model.weatherers]
-
-            for w in active_model.weatherers:
-                if isinstance(w, (Skimmer, Burn, ChemicalDispersion)):
-                    w.on = False
-
-            active_model.rewind()
-
-            drop_uncertain_models(request)
-
-            if active_model.has_weathering_uncertainty:
-                log.info('Model has weathering uncertainty')
-                set_uncertain_models(request)
-            else:
-                log.info('Model does not have weathering uncertainty')
-
+            output = None
             begin = time.time()
 
-            for step in active_model:
-                output = step
-                steps = get_uncertain_steps(request)
+            for output in iter_full_run(request, active_model, cancel_token):
+                pass
 
             end = time.time()
 
-            if steps and 'WeatheringOutput' in output:
-                nominal = output['WeatheringOutput']
-                aggregate = defaultdict(list)
-                low = {}
-                high = {}
-                full_output = {}
-
-                for idx, step_output in enumerate(steps):
-                    for k, v in step_output['WeatheringOutput'].iteritems():
-                        aggregate[k].append(v)
-
-                for k, v in aggregate.iteritems():
-                    low[k] = min(v)
-                    high[k] = max(v)
-
-                full_output = {'time_stamp': nominal['time_stamp'],
-                               'nominal': nominal,
-                               'low': low,
-                               'high': high}
-                for idx, step_output in enumerate(steps):
-                    full_output[idx] = step_output['WeatheringOutput']
-
-                output['WeatheringOutput'] = full_output
-                output['total_response_time'] = end - begin
-            elif 'WeatheringOutput' in output:
-                nominal = output['WeatheringOutput']
-                full_output = {'time_stamp': nominal['time_stamp'],
-                               'nominal': nominal,
-                               'low': None,
-                               'high': None}
-                output['WeatheringOutput'] = full_output
+            if output is not None:
                 output['total_response_time'] = end - begin
+
+                if cancel_token.cancelled:
+                    output['cancelled'] = True
+        except UncertainModelsUnavailable:
+            raise cors_exception(request, HTTPServiceUnavailable)
         except:
             raise cors_exception(request, HTTPUnprocessableEntity,
                                  with_stacktrace=True)
         finally:
-            for a, w in zip(weatherer_enabled_flags, active_model.weatherers):
-                w.on = a
             gnome_sema.release()
+            end_session_run(request, cancel_token)
 
         return output
     else:
         raise cors_exception(request, HTTPPreconditionFailed)
 
 
-def get_uncertain_steps(request):
-    uncertain_models = get_uncertain_models(request)
-    if uncertain_models:
-        return uncertain_models.cmd('step', {})
+@full_run_api.delete()
+@full_run_stream_api.delete()
+def cancel_full_run(request):
+    '''
+        Cancels the full runs of our session that are in progress, or
+        waiting for the session lock.  A run is stopped after its current
+        step.  Returns 404 if there is no run to cancel.
+        We don't take the session lock, since the run we are cancelling
+        is holding it.
+    '''
+    if cancel_session_runs(request) == 0:
+        raise cors_exception(request, HTTPNotFound)
+
+    request.response.status_int = 204
+
+    return request.response
+
+
+@full_run_stream_api.get()
+def get_full_run_stream(request):
+    '''
+        Performs a full run of the current active Model, turning off any
+        response options.
+        The output of each step is streamed to the client as soon as it
+        has been computed, in the form of newline delimited JSON.
+        The decimation parameters of /step apply to the trajectory output.
+    '''
+    get_decimation_params(request)
+
+    active_model = get_active_model(request)
+    if active_model:
+        response = request.response
+        response.content_type = 'application/x-ndjson'
+        response.app_iter = stream_full_run(request, active_model)
+
+        return response
     else:
+        raise cors_exception(request, HTTPPreconditionFailed)
+
+
+def stream_full_run(request, active_model):
+    '''
+        The app_iter of our streaming full run response.
+        The session lock is held for as long as the run is being iterated,
+        and is released when the run completes, fails, or the client
+        goes away.  While a step is being written to the client, we
+        give up our global slot, so a slow client doesn't keep other
+        sessions from running their models.
+        Since the response status has already been sent by the time a
+        step fails, a failure is reported as a final line containing
+        an 'error' item.  Likewise, a cancelled run ends with a line
+        containing a 'cancelled' item.
+    '''
+    log_prefix = 'req({0}): stream_full_run():'.format(id(request))
+
+    cancel_token = start_session_run(request)
+
+    try:
+        gnome_sema = get_session_lock(request)
+        gnome_sema.acquire()
+        log.info('  ' + log_prefix + 'semaphore acquired...')
+
+        full_run = iter_full_run(request, active_model, cancel_token)
+
+        try:
+            for output in full_run:
+                chunk = ujson.dumps(output) + '\n'
+
+                gnome_sema.pause()
+                try:
+                    yield chunk
+                finally:
+                    gnome_sema.resume()
+
+            if cancel_token.cancelled:
+                yield ujson.dumps({'cancelled': True}) + '\n'
+        except Exception:
+            log.info('  ' + log_prefix + 'unknown exception...')
+            yield ujson.dumps({'error': format_exception()}) + '\n'
+        finally:
+            full_run.close()
+            gnome_sema.release()
+            log.info('  ' + log_prefix + 'semaphore released...')
+    finally:
+        end_session_run(request, cancel_token)
+
+
+def iter_full_run(request, active_model, cancel_token):
+    '''
+        Rewinds the active model and generates the output of each step
+        of a full run with the response options turned off.
+        The response options are restored when the run completes, is
+        cancelled through its cancel token, or the generator is closed.
+        The session lock is expected to be held by the caller.
+    '''
+    session_objects = get_session_objects(request)
+    switched_off = []
+
+    try:
+        for w in active_model.weatherers:
+            if isinstance(w, (Skimmer, Burn, ChemicalDispersion)) and w.on:
+                w.on = False
+                switched_off.append(w)
+
+                # our uncertain models need to see the changed response
+                # options
+                session_objects.touch(obj=w)
+
+        run_model_task(request, active_model.rewind)
+
+        while True:
+            # Give a cancel request the chance to be processed, even if
+            # our steps don't yield to the event loop by themselves.
+            gevent.sleep(0)
+
+            if cancel_token.cancelled:
+                log.info('full run cancelled')
+                break
+
+            try:
+                output = step_model(request, active_model)
+            except StopIteration:
+                break
+
+            yield output
+    finally:
+        finish_uncertain_models(request)
+
+        for w in switched_off:
+            w.on = True
+            session_objects.touch(obj=w)
+
+
+def spawn_uncertain_steps(request, active_model):
+    '''
+        Start stepping our uncertain models, if we have any, in a separate
+        thread, and return an async result.
+        The result is a tuple containing the uncertain step outputs and the
+        time it took to generate them.
+    '''
+    if active_model.current_time_step >= active_model.num_time_steps - 1:
+        # our run is over, there is nothing to step
         return None
+
+    uncertain_models = checkout_uncertain_models(request)
+    if uncertain_models is None:
+        return None
+
+    try:
+        broadcaster = uncertain_models.broadcaster
+    except:
+        checkin_uncertain_models(request, uncertain_models)
+        raise
+
+    uncertain_steps = get_hub().threadpool.spawn(get_uncertain_steps,
+                                                 broadcaster)
+
+    # our uncertain models can't be stopped while they are stepping
+    uncertain_steps.rawlink(lambda _result:
+                            checkin_uncertain_models(request,
+                                                     uncertain_models))
+
+    return uncertain_steps
+
+
+def get_uncertain_steps(uncertain_models):
+    begin = time.time()
+    steps = uncertain_models.cmd('step', {})
+
+    return steps, time.time() - begin
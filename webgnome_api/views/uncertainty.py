@@ -0,0 +1,50 @@
+"""
+Views for the uncertainty ensemble of a session.
+"""
+from pyramid.httpexceptions import HTTPBadRequest
+from cornice import Service
+
+from webgnome_api.common.broadcasters import Ensemble
+from webgnome_api.common.session_management import (get_uncertainty_ensemble,
+                                                    set_uncertainty_ensemble)
+from webgnome_api.common.views import cors_exception, cors_policy
+
+uncertainty_api = Service(name='uncertainty', path='/uncertainty',
+                          description="Uncertainty Ensemble API",
+                          cors_policy=cors_policy)
+
+
+@uncertainty_api.get()
+def get_uncertainty(request):
+    '''
+        Returns the dimensions of the uncertainty ensemble that is used
+        for the runs of our session.
+    '''
+    return get_uncertainty_ensemble(request).to_dict()
+
+
+@uncertainty_api.put()
+def update_uncertainty(request):
+    '''
+        Sets the dimensions of the uncertainty ensemble that is used for
+        the runs of our session.  A smaller ensemble, like 1x3, gives us
+        a quicker preview.
+        The change takes effect when the next run begins.
+    '''
+    ensemble = get_uncertainty_ensemble(request)
+
+    try:
+        json_request = request.json
+
+        ensemble = Ensemble.from_levels(
+            json_request.get('wind_speed', ensemble.wind_speed),
+            json_request.get('spill_amount', ensemble.spill_amount))
+    except (ValueError, AttributeError, TypeError):
+        raise cors_exception(request, HTTPBadRequest)
+
+    if not request.registry.settings['uncertain_models'].fits(ensemble):
+        raise cors_exception(request, HTTPBadRequest)
+
+    set_uncertainty_ensemble(request, ensemble)
+
+    return ensemble.to_dict()
@@ -4,6 +4,7 @@ Views for the Weatherer objects.
 from webgnome_api.common.views import (get_object,
                                        create_object,
                                        update_object,
+                                       patch_object,
                                        cors_policy)
 
 from cornice import Service
@@ -41,3 +42,9 @@ def create_weatherer(request):
 def update_weatherer(request):
     '''Updates a Weatherer object.'''
     return update_object(request, implemented_types)
+
+
+@weatherer.patch()
+def patch_weatherer(request):
+    '''Partially updates a Weatherer object.'''
+    return patch_object(request, implemented_types)